@@ -0,0 +1,456 @@
+# arrays.py
+# The Array Int and Array Double types: fixed-length arrays of numbers that
+# the operators and the array builtins work on whole, in one bulk operation
+# each, rather than one interpreted step per element.
+#
+#   let xs :: Array Int = parseInts getLine
+#   let scaled :: Array Double = xs * 1.5 + 2
+#   puts arraySum (arraySlice scaled 0 10)
+#
+# + - * and / between two arrays of the same length, or an array and a
+# number, work element by element; the result is an Array Double when
+# either side holds doubles or the operator is /, as with numbers. < > <=
+# and >= give an Array Int of 1s and 0s, so arraySum of one counts the
+# matches. == and != compare whole arrays and give a Bool. Arrays never
+# change: every operation makes a new one.
+#
+# Elements are kept in an array.array, or in a NumPy array when NumPy can
+# be imported. Either way the results are the ones Belasova's numbers would
+# give: Int elements are exact (an Array Int holds 64-bit values, and an
+# operation that would leave that range raises rather than wrapping) and
+# arraySum adds doubles in order, as a loop would.
+import array
+import operator
+from functools import reduce
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ARRAY_INT, ARRAY_DOUBLE = 'Array Int', 'Array Double'
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+# Int results whose float estimate stays below this are exact in 64 bits.
+SAFE_INT = 2.0 ** 62
+
+
+class Array:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return str(self.data.tolist())
+
+    def __repr__(self):
+        return f"{self.kind} {self}"
+
+    def __bool__(self):
+        raise RuntimeError(f"An {self.kind} is not a condition")
+
+    # Equal elements make equal arrays (and equal hashes); the class still
+    # tells an Array Int from an Array Double in memoization keys.
+    def __eq__(self, other):
+        if not isinstance(other, Array):
+            return NotImplemented
+        return len(self.data) == len(other.data) and self.data.tolist() == other.data.tolist()
+
+    def __ne__(self, other):
+        if not isinstance(other, Array):
+            return NotImplemented
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self.data.tolist()))
+
+    def __add__(self, other):
+        return _arithmetic(operator.add, self, other)
+
+    def __radd__(self, other):
+        return _arithmetic(operator.add, other, self)
+
+    def __sub__(self, other):
+        return _arithmetic(operator.sub, self, other)
+
+    def __rsub__(self, other):
+        return _arithmetic(operator.sub, other, self)
+
+    def __mul__(self, other):
+        return _arithmetic(operator.mul, self, other)
+
+    def __rmul__(self, other):
+        return _arithmetic(operator.mul, other, self)
+
+    def __truediv__(self, other):
+        return _arithmetic(operator.truediv, self, other)
+
+    def __rtruediv__(self, other):
+        return _arithmetic(operator.truediv, other, self)
+
+    def __lt__(self, other):
+        return _compare(operator.lt, self, other)
+
+    def __gt__(self, other):
+        return _compare(operator.gt, self, other)
+
+    def __le__(self, other):
+        return _compare(operator.le, self, other)
+
+    def __ge__(self, other):
+        return _compare(operator.ge, self, other)
+
+
+class IntArray(Array):
+    __slots__ = ()
+    kind = ARRAY_INT
+    typecode = 'q'
+
+
+class DoubleArray(Array):
+    __slots__ = ()
+    kind = ARRAY_DOUBLE
+    typecode = 'd'
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _operands(left, right):
+    # Whether the operator applies: arrays of one length, or an array and a
+    # number.
+    for operand in (left, right):
+        if not isinstance(operand, Array) and not _is_number(operand):
+            return False
+    if isinstance(left, Array) and isinstance(right, Array) and len(left.data) != len(right.data):
+        raise RuntimeError(f"Array lengths differ: {len(left.data)} and {len(right.data)}")
+    return True
+
+
+def _holds_doubles(operand):
+    return isinstance(operand, DoubleArray) or isinstance(operand, float)
+
+
+def _arithmetic(op, left, right):
+    if not _operands(left, right):
+        return NotImplemented
+    if op is operator.truediv:
+        if _has_zero(right):
+            raise RuntimeError("Division by zero")
+        cls = DoubleArray
+    else:
+        cls = DoubleArray if _holds_doubles(left) or _holds_doubles(right) else IntArray
+    return cls(_elementwise(op, left, right, cls))
+
+
+def _compare(op, left, right):
+    if not _operands(left, right):
+        return NotImplemented
+    return IntArray(_elementwise(op, left, right, IntArray))
+
+
+# Element-wise operations in plain Python, over array.array (or NumPy data
+# that has left the range NumPy can be trusted with).
+def _values(operand):
+    if not isinstance(operand, Array):
+        return repeat(operand)
+    return operand.data if numpy is None else operand.data.tolist()
+
+
+def _python_elementwise(op, left, right, cls):
+    return _pack(cls, map(op, _values(left), _values(right)))
+
+
+def _python_pack(cls, values):
+    try:
+        return array.array(cls.typecode, values)
+    except OverflowError:
+        raise RuntimeError(f"{cls.kind} element out of range")
+
+
+if numpy is None:
+    _pack = _python_pack
+    _elementwise = _python_elementwise
+
+    def _has_zero(operand):
+        return 0 in operand.data if isinstance(operand, Array) else operand == 0
+
+    def _to_int(data):
+        try:
+            return _pack(IntArray, map(int, data))
+        except (ValueError, OverflowError) as e:
+            raise RuntimeError(f"Array Int conversion error: {e}")
+
+    def _to_double(data):
+        return array.array('d', data)
+
+    def _sum(values):
+        if isinstance(values, IntArray):
+            return sum(values.data)
+        # In order, as a loop adding them would.
+        return reduce(operator.add, values.data, 0.0)
+
+    def _extreme(function, values):
+        return function(values.data)
+
+    def _range(start, stop):
+        return array.array('q', range(start, stop))
+
+    def _fill(cls, count, value):
+        return array.array(cls.typecode, [value]) * max(count, 0)
+
+else:
+    IntArray.dtype = numpy.int64
+    DoubleArray.dtype = numpy.float64
+
+    def _pack(cls, values):
+        if not isinstance(values, list):
+            values = list(values)
+        try:
+            return numpy.array(values, dtype=cls.dtype)
+        except OverflowError:
+            raise RuntimeError(f"{cls.kind} element out of range")
+
+    def _numpy_operand(operand):
+        # The operand as NumPy takes it, or None for an int too large for
+        # an int64.
+        if isinstance(operand, Array):
+            return operand.data
+        if isinstance(operand, int) and not INT_MIN <= operand <= INT_MAX:
+            return None
+        return operand
+
+    def _as_float(operand):
+        return operand.astype(numpy.float64) if isinstance(operand, numpy.ndarray) else float(operand)
+
+    def _elementwise(op, left, right, cls):
+        left_data, right_data = _numpy_operand(left), _numpy_operand(right)
+        if left_data is None or right_data is None:
+            return _pack(cls, map(op, _values(left), _values(right)))
+        with numpy.errstate(all='ignore'):
+            if cls is IntArray and op in (operator.add, operator.sub, operator.mul):
+                # int64 arithmetic wraps; results that may not fit are
+                # worked out exactly instead, and raise if they do not.
+                estimate = op(_as_float(left_data), _as_float(right_data))
+                if not (numpy.abs(estimate) < SAFE_INT).all():
+                    return _pack(cls, map(op, _values(left), _values(right)))
+            result = op(left_data, right_data)
+        return result.astype(cls.dtype, copy=False)
+
+    def _has_zero(operand):
+        return bool((operand.data == 0).any()) if isinstance(operand, Array) else operand == 0
+
+    def _to_int(data):
+        if not (numpy.isfinite(data).all() and (numpy.abs(data) < SAFE_INT).all()):
+            try:
+                return _pack(IntArray, map(int, data.tolist()))
+            except (ValueError, OverflowError) as e:
+                raise RuntimeError(f"Array Int conversion error: {e}")
+        return data.astype(numpy.int64)
+
+    def _to_double(data):
+        return data.astype(numpy.float64)
+
+    def _sum(values):
+        data = values.data
+        if not len(data):
+            return 0 if isinstance(values, IntArray) else 0.0
+        if isinstance(values, IntArray):
+            if len(data) * max(abs(int(data.min())), abs(int(data.max()))) > INT_MAX:
+                return sum(data.tolist())
+            return int(data.sum())
+        # numpy.sum adds pairwise; accumulate adds in order, as a loop
+        # would. Adding 0.0 gives the 0.0 a loop starting from it would
+        # for an array of -0.0s.
+        return float(numpy.add.accumulate(data)[-1]) + 0.0
+
+    def _extreme(function, values):
+        data = values.data
+        if isinstance(values, DoubleArray) and numpy.isnan(data).any():
+            # Python's min and max do not always pass a NaN on.
+            return function(data.tolist())
+        return (data.min() if function is min else data.max()).item()
+
+    def _range(start, stop):
+        return numpy.arange(start, stop, dtype=numpy.int64)
+
+    def _fill(cls, count, value):
+        return numpy.full(max(count, 0), value, dtype=cls.dtype)
+
+
+# Conversions, for `let` declarations with an array type.
+def to_int_array(value):
+    # Doubles are truncated, as toInt truncates a number.
+    if isinstance(value, IntArray):
+        return value
+    if isinstance(value, DoubleArray):
+        return IntArray(_to_int(value.data))
+    raise RuntimeError(f"Cannot convert {value!r} to Array Int")
+
+
+def to_double_array(value):
+    if isinstance(value, DoubleArray):
+        return value
+    if isinstance(value, IntArray):
+        return DoubleArray(_to_double(value.data))
+    raise RuntimeError(f"Cannot convert {value!r} to Array Double")
+
+
+ARRAY_CASTS = {
+    ARRAY_INT: to_int_array,
+    ARRAY_DOUBLE: to_double_array,
+}
+
+
+# Builtins. Like the others, each takes the list of its arguments.
+def _expect(name, args, counts):
+    if len(args) not in counts:
+        expected = f"exactly {counts[0]}" if len(counts) == 1 else ' or '.join(map(str, counts))
+        raise RuntimeError(f"{name} expects {expected} argument{'s' if max(counts) > 1 else ''}")
+
+
+def _array_arg(name, value):
+    if not isinstance(value, Array):
+        raise RuntimeError(f"{name} expects an array, got {value!r}")
+    return value
+
+
+def _int_arg(name, value):
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise RuntimeError(f"{name} expects an Int, got {value!r}")
+    return value
+
+
+def _from_numbers(name, values):
+    for value in values:
+        if not _is_number(value):
+            raise RuntimeError(f"{name} expects numbers, got {value!r}")
+    cls = DoubleArray if any(isinstance(value, float) for value in values) else IntArray
+    return cls(_pack(cls, values))
+
+
+def array_of(args):
+    # arrayOf 1 2 3: an Array Double if any element is a Double.
+    return _from_numbers('arrayOf', list(args))
+
+
+def _range_bounds(args):
+    # arrayRange n is 0 up to n - 1; arrayRange a b is a up to b - 1.
+    _expect('arrayRange', args, (1, 2))
+    bounds = [_int_arg('arrayRange', arg) for arg in args]
+    return bounds if len(bounds) == 2 else (0, bounds[0])
+
+
+def array_range(args):
+    start, stop = _range_bounds(args)
+    return IntArray(_range(start, stop))
+
+
+def range_length(args):
+    start, stop = _range_bounds(args)
+    return max(stop - start, 0)
+
+
+def array_fill(args):
+    # arrayFill n x: n copies of the number x.
+    _expect('arrayFill', args, (2,))
+    count = _int_arg('arrayFill', args[0])
+    value = args[1]
+    if not _is_number(value):
+        raise RuntimeError(f"arrayFill expects a number, got {value!r}")
+    cls = DoubleArray if isinstance(value, float) else IntArray
+    try:
+        return cls(_fill(cls, count, value))
+    except OverflowError:
+        raise RuntimeError(f"{cls.kind} element out of range")
+
+
+def fill_length(args):
+    _expect('arrayFill', args, (2,))
+    return max(_int_arg('arrayFill', args[0]), 0)
+
+
+def _parser(name, cls, convert):
+    # Numbers separated by spaces or commas, as a line of input has them.
+    def parse(args):
+        _expect(name, args, (1,))
+        try:
+            values = [convert(part) for part in str(args[0]).replace(',', ' ').split()]
+        except ValueError as e:
+            raise RuntimeError(f"{name} conversion error: {e}")
+        return cls(_pack(cls, values))
+    return parse
+
+
+parse_ints = _parser('parseInts', IntArray, int)
+parse_doubles = _parser('parseDoubles', DoubleArray, float)
+
+
+def array_length(args):
+    _expect('arrayLength', args, (1,))
+    return len(_array_arg('arrayLength', args[0]).data)
+
+
+def array_get(args):
+    # arrayGet xs i: element i, counting from 0; negative i counts from
+    # the end.
+    _expect('arrayGet', args, (2,))
+    values = _array_arg('arrayGet', args[0])
+    index = _int_arg('arrayGet', args[1])
+    length = len(values.data)
+    if not -length <= index < length:
+        raise RuntimeError(f"Array index {index} out of range for length {length}")
+    return values.data[index].item() if numpy is not None else values.data[index]
+
+
+def array_slice(args):
+    # arraySlice xs a b: elements a up to b - 1, with positions as in
+    # arrayGet; positions past either end stop there.
+    _expect('arraySlice', args, (3,))
+    values = _array_arg('arraySlice', args[0])
+    start = _int_arg('arraySlice', args[1])
+    stop = _int_arg('arraySlice', args[2])
+    return type(values)(values.data[start:stop])
+
+
+def array_sum(args):
+    _expect('arraySum', args, (1,))
+    return _sum(_array_arg('arraySum', args[0]))
+
+
+def _reduction(name, function):
+    def reduce_array(args):
+        _expect(name, args, (1,))
+        values = _array_arg(name, args[0])
+        if not len(values.data):
+            raise RuntimeError(f"{name} of an empty array")
+        return _extreme(function, values)
+    return reduce_array
+
+
+array_min = _reduction('arrayMin', min)
+array_max = _reduction('arrayMax', max)
+
+ARRAY_BUILTINS = {
+    'arrayOf': array_of,
+    'arrayRange': array_range,
+    'arrayFill': array_fill,
+    'parseInts': parse_ints,
+    'parseDoubles': parse_doubles,
+    'arrayLength': array_length,
+    'arrayGet': array_get,
+    'arraySlice': array_slice,
+    'arraySum': array_sum,
+    'arrayMin': array_min,
+    'arrayMax': array_max,
+}
+
+# The builtins whose arrays can be longer than their arguments -> the length
+# of the array a call would make, without making it (see limits.py). Bad
+# arguments fail as in the call.
+ARRAY_LENGTHS = {
+    'arrayRange': range_length,
+    'arrayFill': fill_length,
+}
@@ -0,0 +1,129 @@
+# ast_arena.py
+# Struct-of-arrays encoding of an AST. Nodes become integer indices into
+# typed arrays, and every scalar (identifier names, operators, literal
+# values) is interned once in a constant table.
+#
+# Node i has class NODE_CLASSES[kinds[i]] and its fields, in __slots__
+# order, are the ints data[starts[i]:starts[i] + number of fields]. Each
+# field is a tagged int, (payload << 2) | tag:
+#   TAG_NODE   payload is a node index
+#   TAG_CONST  payload is an index into constants
+#   TAG_LIST   payload is an offset into data holding [length, items...]
+#   TAG_TUPLE  as TAG_LIST, decoded as a tuple
+# lines[i] is node i's source line, 0 for a node without one.
+import gc
+from array import array
+
+import ast_nodes
+from ast_nodes import Node, line_of
+
+NODE_CLASSES = tuple(cls for cls in vars(ast_nodes).values()
+                     if isinstance(cls, type) and issubclass(cls, Node) and cls is not Node)
+KIND_OF = {cls: kind for kind, cls in enumerate(NODE_CLASSES)}
+
+TAG_NODE, TAG_CONST, TAG_LIST, TAG_TUPLE = range(4)
+
+
+class NodeArena:
+    def __init__(self):
+        self.kinds = array('B')
+        self.starts = array('L')
+        self.data = array('i')
+        self.lines = array('L')
+        self.constants = []
+        self.constant_indexes = {}
+        self.roots = array('L')
+
+    @classmethod
+    def encode(cls, ast):
+        arena = cls()
+        for node in ast:
+            arena.roots.append(arena.add(node))
+        return arena
+
+    def add(self, node):
+        fields = [self.encode_value(value) for value in (getattr(node, name) for name in node.__slots__)]
+        index = len(self.kinds)
+        self.kinds.append(KIND_OF[type(node)])
+        self.starts.append(len(self.data))
+        self.lines.append(line_of(node) or 0)
+        self.data.extend(fields)
+        return index
+
+    def encode_value(self, value):
+        if isinstance(value, Node):
+            return self.add(value) << 2 | TAG_NODE
+        if isinstance(value, (list, tuple)):
+            items = [self.encode_value(item) for item in value]
+            offset = len(self.data)
+            self.data.append(len(items))
+            self.data.extend(items)
+            return offset << 2 | (TAG_TUPLE if isinstance(value, tuple) else TAG_LIST)
+        # Key on the type too, so 1, 1.0 and True stay distinct.
+        key = (type(value), value)
+        index = self.constant_indexes.get(key)
+        if index is None:
+            index = self.constant_indexes[key] = len(self.constants)
+            self.constants.append(value)
+        return index << 2 | TAG_CONST
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def decode(self):
+        # Allocating every node at once would otherwise trigger repeated
+        # cyclic-GC passes over the growing tree, none of which free anything.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.build_nodes()
+        finally:
+            if enabled:
+                gc.enable()
+
+    def build_nodes(self):
+        # Children are always encoded before their parents, so one forward
+        # pass rebuilds every node without recursing through the tree.
+        nodes = []
+        append = nodes.append
+        constants = self.constants
+        data = self.data
+        for kind, start, line in zip(self.kinds, self.starts, self.lines):
+            cls = NODE_CLASSES[kind]
+            # Constructors take their fields in __slots__ order.
+            fields = []
+            for tagged in data[start:start + len(cls.__slots__)]:
+                tag = tagged & 3
+                if tag == TAG_NODE:
+                    fields.append(nodes[tagged >> 2])
+                elif tag == TAG_CONST:
+                    fields.append(constants[tagged >> 2])
+                else:
+                    fields.append(self.decode_value(tagged, nodes))
+            node = cls(*fields)
+            if line:
+                node.line = line
+            append(node)
+        return [nodes[index] for index in self.roots]
+
+    def decode_value(self, tagged, nodes):
+        tag = tagged & 3
+        payload = tagged >> 2
+        if tag == TAG_NODE:
+            return nodes[payload]
+        if tag == TAG_CONST:
+            return self.constants[payload]
+        length = self.data[payload]
+        items = [self.decode_value(item, nodes) for item in self.data[payload + 1:payload + 1 + length]]
+        return tuple(items) if tag == TAG_TUPLE else items
+
+    def nbytes(self):
+        arrays = (self.kinds, self.starts, self.data, self.lines, self.roots)
+        return sum(len(a) * a.itemsize for a in arrays)
+
+    def __getstate__(self):
+        return (self.kinds, self.starts, self.data, self.lines, self.constants, self.roots)
+
+    def __setstate__(self, state):
+        self.kinds, self.starts, self.data, self.lines, self.constants, self.roots = state
+        self.constant_indexes = {(type(value), value): index for index, value in enumerate(self.constants)}
@@ -1,93 +1,165 @@
-class NumberLiteral:
+# AST node classes are slotted: large programs allocate hundreds of thousands
+# of nodes, and a per-instance __dict__ would dominate their size.
+#
+# The parser sets line, the source line a statement starts on, on every
+# statement; other nodes leave it unset (see line_of).
+class Node:
+    __slots__ = ('line',)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in iter_fields(self))
+        return f"{type(self).__name__}({fields})"
+
+class NumberLiteral(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class StringLiteral(Node):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
-class StringLiteral:
+class BooleanLiteral(Node):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
-class BooleanLiteral:
+# Produced by the optimizer: a value computed ahead of time (a folded
+# expression, or a literal with its source form already decoded).
+class Constant(Node):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
-class Identifier:
+class Identifier(Node):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
-class InputCall:
+class InputCall(Node):
+    __slots__ = ()
+
+    def __init__(self):
+        pass
+
+# `eof`: true once getLine has no more lines to read.
+class EndOfInput(Node):
+    __slots__ = ()
+
     def __init__(self):
         pass
 
-class PutsStatement:
+class PutsStatement(Node):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
-class FunctionSignature:
+class FunctionSignature(Node):
+    __slots__ = ('name', 'param_types', 'return_type')
+
     def __init__(self, name, param_types, return_type):
         self.name = name
         self.param_types = param_types
         self.return_type = return_type
 
-class FunctionDefinition:
+class FunctionDefinition(Node):
+    __slots__ = ('name', 'params', 'body')
+
     def __init__(self, name, params, body):
         self.name = name
         self.params = params
         self.body = body
 
-class FunctionCall:
+class FunctionCall(Node):
+    __slots__ = ('name', 'args')
+
     def __init__(self, name, args):
         self.name = name
         self.args = args
 
-class ReturnStatement:
+class ReturnStatement(Node):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
-class VariableAssignment:
+class VariableAssignment(Node):
+    __slots__ = ('name', 'value', 'type_annotation', 'is_declaration')
+
     def __init__(self, name, value, type_annotation=None, is_declaration=False):
         self.name = name
         self.value = value
         self.type_annotation = type_annotation
         self.is_declaration = is_declaration
 
-class BinaryOp:
+class BinaryOp(Node):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
-class UnaryOp:
+class UnaryOp(Node):
+    __slots__ = ('op', 'expr')
+
     def __init__(self, op, expr):
         self.op = op
         self.expr = expr
 
-class IfElseStatement:
+class IfElseStatement(Node):
+    __slots__ = ('condition', 'then_block', 'else_block')
+
     def __init__(self, condition, then_block, else_block):
         self.condition = condition
         self.then_block = then_block
         self.else_block = else_block
 
-class IfChain:
+class IfChain(Node):
+    __slots__ = ('branches', 'else_block')
+
     def __init__(self, branches, else_block):
         self.branches = branches
         self.else_block = else_block
 
-class CheckStatement:
+class CheckStatement(Node):
+    __slots__ = ('subject_expr', 'when_branches', 'else_block')
+
     def __init__(self, subject_expr, when_branches, else_block=None):
         self.subject_expr = subject_expr
         self.when_branches = when_branches
         self.else_block = else_block
 
-class LoopNode:
+class LoopNode(Node):
+    __slots__ = ('loop_type', 'condition_or_count', 'body')
+
     def __init__(self, loop_type, condition_or_count, body):
         self.loop_type = loop_type  # 'infinite', 'times', or 'until'
         self.condition_or_count = condition_or_count
         self.body = body
 
-class BreakStatement:
+class BreakStatement(Node):
+    __slots__ = ()
+
     def __init__(self):
         pass
 
-class ContinueStatement:
+class ContinueStatement(Node):
+    __slots__ = ()
+
     def __init__(self):
-        pass
\ No newline at end of file
+        pass
+
+def line_of(node):
+    return getattr(node, 'line', None)
+
+def iter_fields(node):
+    for name in node.__slots__:
+        yield name, getattr(node, name)
@@ -0,0 +1,263 @@
+# batch.py
+# Runs many independent .sova scripts across a pool of worker processes,
+# one per CPU by default, and summarizes how they went.
+#
+#   python batch.py PATH [PATH ...] [--jobs N] [--engine NAME] [--timeout S] [--output-dir DIR]
+#                  [--input-dir DIR] [--cache] [--cache-dir DIR] [--json FILE]
+#                  [--max-steps N] [--max-seconds S] [--max-string N] [--max-array N]
+#
+# A PATH is a script, a directory (searched recursively for *.sova) or a
+# glob pattern. A script reads its input from the file next to it with the
+# same name and an .in extension (or from --input-dir), and reads nothing
+# when there is none; its output goes to a matching .out file.
+#
+# Workers live for the whole batch and keep every Program they have built,
+# so a script listed more than once is parsed and compiled once per worker;
+# with --cache, parsed programs are also kept on disk between batches.
+#
+# --timeout interrupts a script wherever it is; the --max options (see
+# limits.py) have the script stop itself, and its status is limit.
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from engines import DEFAULT_ENGINE, ENGINES
+from limits import Limits, ResourceLimitExceeded, add_limit_arguments, limits_from_options
+from memo import POLICIES, RECURSIVE
+from program import Program
+from program_cache import ProgramCache
+from streams import BLOCK, BufferedSink, FileSource, ListSource
+
+OK, ERROR, TIMEOUT, LIMIT = 'ok', 'error', 'timeout', 'limit'
+INPUT_SUFFIX = '.in'
+OUTPUT_SUFFIX = '.out'
+
+
+class ScriptTimeout(BaseException):
+    # Not an Exception, so nothing the script runs through can swallow it.
+    pass
+
+
+def find_scripts(paths):
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(name for name in dirs if not name.startswith(('.', '__')))
+                scripts.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.sova'))
+        elif os.path.isfile(path):
+            scripts.append(path)
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                raise RuntimeError(f"No scripts match {path}")
+            scripts.extend(match for match in matches if os.path.isfile(match))
+    # The same file named twice runs twice.
+    return [os.path.abspath(script) for script in scripts]
+
+
+def job_paths(script, root, input_dir, output_dir):
+    # Where a script's input and output live: next to it, or at the same
+    # place relative to root under input_dir and output_dir.
+    stem = os.path.splitext(os.path.relpath(script, root))[0]
+    base = os.path.splitext(script)[0]
+    input_path = os.path.join(input_dir, stem) if input_dir else base
+    output_path = os.path.join(output_dir, stem) if output_dir else base
+    return input_path + INPUT_SUFFIX, output_path + OUTPUT_SUFFIX
+
+
+# Worker state, set up once per process by init_worker.
+_options = None
+_programs = {}
+_cache = None
+_limits = None
+
+
+def init_worker(options):
+    global _options, _cache, _limits
+    _options = options
+    if options['cache'] or options['cache_dir']:
+        _cache = ProgramCache(options['cache_dir'])
+    # Built here, as Limits are not picklable.
+    if options['limits'] is not None:
+        _limits = Limits(*options['limits'])
+    # Ctrl-C is handled by the parent, which stops the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def on_timeout(signum, frame):
+    raise ScriptTimeout()
+
+
+def load_program(script):
+    # The Program built for script, rebuilt when the file changes.
+    stat = os.stat(script)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    entry = _programs.get(script)
+    if entry is not None and entry[0] == stamp:
+        return entry[1], True
+    program = Program.from_file(script, cache=_cache, engine=_options['engine'],
+                                optimized=_options['optimize'], typecheck=_options['typecheck'],
+                                memoize=_options['memoize'], limits=_limits)
+    _programs[script] = (stamp, program)
+    return program, False
+
+
+def run_job(job):
+    script, input_path, output_path = job
+    timeout = _options['timeout']
+    result = {'script': script, 'output': output_path, 'status': OK, 'error': None, 'reused': False}
+    start = time.perf_counter()
+    try:
+        # The timer is stopped inside the outer try, so a timeout that
+        # fires just as the script ends is still caught.
+        if timeout:
+            signal.signal(signal.SIGALRM, on_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            program, result['reused'] = load_program(script)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            input_source = FileSource(input_path) if os.path.isfile(input_path) else ListSource([])
+            try:
+                with open(output_path, 'w') as stream:
+                    program.run(input_source, BufferedSink(stream, policy=BLOCK, flush_on_input=False))
+            finally:
+                input_source.close()
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except ScriptTimeout:
+        result['status'] = TIMEOUT
+        result['error'] = f"timed out after {timeout:g}s"
+    except ResourceLimitExceeded as e:
+        result['status'] = LIMIT
+        result['error'] = f"{e} after {e.usage}"
+    except Exception as e:
+        result['status'] = ERROR
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def summarize(results, elapsed, jobs, slowest=10):
+    counts = {status: sum(1 for result in results if result['status'] == status)
+              for status in (OK, ERROR, TIMEOUT, LIMIT)}
+    script_time = sum(result['seconds'] for result in results)
+    return {
+        'scripts': len(results),
+        'ok': counts[OK],
+        'errors': counts[ERROR],
+        'timeouts': counts[TIMEOUT],
+        'over_limits': counts[LIMIT],
+        'workers': jobs,
+        'wall_seconds': elapsed,
+        'script_seconds': script_time,
+        'scripts_per_second': len(results) / elapsed if elapsed else 0.0,
+        'reused_programs': sum(1 for result in results if result['reused']),
+        'slowest': [(result['script'], result['seconds'])
+                    for result in sorted(results, key=lambda result: -result['seconds'])[:slowest]],
+    }
+
+
+def print_summary(summary, results):
+    failed = [result for result in results if result['status'] != OK]
+    if failed:
+        print("\nfailures:")
+        for result in failed:
+            print(f"  {result['script']}: {result['error']}")
+    print(f"\n{summary['scripts']} scripts in {summary['wall_seconds']:.2f}s on {summary['workers']} worker(s): "
+          f"{summary['scripts_per_second']:.1f} scripts/s")
+    print(f"{summary['ok']} ok, {summary['errors']} failed, {summary['timeouts']} timed out, "
+          f"{summary['over_limits']} over limits; {summary['script_seconds']:.2f}s spent in scripts")
+    if summary['slowest']:
+        print("slowest:")
+        for script, seconds in summary['slowest']:
+            print(f"  {seconds:>9.3f}s  {script}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Run many .sova scripts in parallel.')
+    arg_parser.add_argument('paths', nargs='+', help="scripts, directories or glob patterns")
+    arg_parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                            help="worker processes (default: one per CPU)")
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                            help=f"execution engine (default: {DEFAULT_ENGINE})")
+    arg_parser.add_argument('--timeout', type=float, default=0,
+                            help="seconds a script may run before it is stopped (default: no limit)")
+    arg_parser.add_argument('--input-dir', help=f"read each script's {INPUT_SUFFIX} file from here")
+    arg_parser.add_argument('--output-dir', help=f"write each script's {OUTPUT_SUFFIX} file here")
+    arg_parser.add_argument('--no-optimize', action='store_true', help="skip the AST optimizer")
+    arg_parser.add_argument('--typecheck', action='store_true',
+                            help="type check each script first and fail it on type errors")
+    arg_parser.add_argument('--memoize', choices=POLICIES, default=RECURSIVE,
+                            help=f"cache results of pure functions (default: {RECURSIVE})")
+    arg_parser.add_argument('--cache', action='store_true',
+                            help="reuse parsed programs from __sovacache__ when the source is unchanged")
+    arg_parser.add_argument('--cache-dir', help="keep cache entries in this directory (implies --cache)")
+    arg_parser.add_argument('--chunk-size', type=int, default=1,
+                            help="scripts handed to a worker at a time (raise for many tiny scripts)")
+    arg_parser.add_argument('--json', help="also write every result and the summary to this file")
+    arg_parser.add_argument('--quiet', '-q', action='store_true', help="only print the summary")
+    add_limit_arguments(arg_parser)
+    options = arg_parser.parse_args()
+    if options.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+    if options.chunk_size < 1:
+        arg_parser.error("--chunk-size must be at least 1")
+    if options.timeout < 0:
+        arg_parser.error("--timeout cannot be negative")
+    if options.timeout and not hasattr(signal, 'setitimer'):
+        arg_parser.error("--timeout needs interval timers, which this platform lacks")
+    try:
+        limits = limits_from_options(options)
+    except RuntimeError as e:
+        arg_parser.error(str(e))
+
+    try:
+        scripts = find_scripts(options.paths)
+    except RuntimeError as e:
+        arg_parser.error(str(e))
+    if not scripts:
+        arg_parser.error("no scripts found")
+    root = os.path.commonpath([os.path.dirname(script) for script in scripts])
+    jobs = [(script, *job_paths(script, root, options.input_dir, options.output_dir)) for script in scripts]
+    worker_options = {
+        'engine': options.engine,
+        'optimize': not options.no_optimize,
+        'typecheck': options.typecheck,
+        'memoize': options.memoize,
+        'timeout': options.timeout,
+        'cache': options.cache,
+        'cache_dir': options.cache_dir,
+        'limits': None if limits is None else (limits.steps, limits.seconds, limits.string_length,
+                                               limits.array_length),
+    }
+
+    workers = min(options.jobs, len(jobs))
+    results = []
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, init_worker, (worker_options,)) as pool:
+        for result in pool.imap_unordered(run_job, jobs, options.chunk_size):
+            results.append(result)
+            if not options.quiet:
+                note = f"  {result['error']}" if result['error'] else ''
+                print(f"{result['status']:<8} {result['seconds']:>9.3f}s  {result['script']}{note}")
+    summary = summarize(results, time.perf_counter() - start, workers)
+    print_summary(summary, results)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'summary': summary, 'results': sorted(results, key=lambda result: result['script'])},
+                      f, indent=2)
+            f.write('\n')
+    if summary['ok'] != summary['scripts']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
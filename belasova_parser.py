@@ -1,5 +1,10 @@
+from collections import deque
+
 from ast_nodes import *
 
+# Tokens a type can start with.
+TYPE_TOKENS = ('INT_TYPE', 'STRING_TYPE', 'DOUBLE_TYPE', 'BOOL_TYPE', 'ARRAY_TYPE')
+
 class Parser:
     def __init__(self, tokens):
         self.tokens = tokens
@@ -17,44 +22,31 @@ class Parser:
         else:
             return ('EOF', '', -1)
 
+    def advance(self):
+        self.pos += 1
+
     def eat(self, kind):
         token = self.current()
         if token[0] == kind:
-            self.pos += 1
+            self.advance()
             return token
         line_info = f" at line {token[2]}" if len(token) > 2 else ""
         raise RuntimeError(f"Expected token {kind} but got {token[0]}{line_info}")
 
     def parse(self):
-        ast = []
+        return list(self.iter_statements())
+
+    def iter_statements(self):
+        # Yields top-level statements as soon as each one is parsed.
         while self.current()[0] != 'EOF':
             token_type = self.current()[0]
             if token_type == 'FN':
-                ast.extend(self.parse_function())
-            elif token_type == 'LET':
-                ast.append(self.parse_variable_assignment())
-            elif token_type == 'PUTS':
-                ast.append(self.parse_puts())
-            elif token_type == 'IF':
-                ast.append(self.parse_if_chain())
-            elif token_type == 'CHECK':
-                ast.append(self.parse_check_statement())
-            elif token_type == 'LOOP':
-                ast.append(self.parse_loop())
-            elif token_type == 'RETURN':
-                ast.append(self.parse_return())
-            elif token_type == 'BREAK':
-                self.eat('BREAK')
-                ast.append(BreakStatement())
-            elif token_type == 'CONTINUE':
-                self.eat('CONTINUE')
-                ast.append(ContinueStatement())
+                yield from self.parse_function()
             else:
-                ast.append(self.parse_expression())
-        return ast
+                yield self.parse_statement()
 
     def parse_function(self):
-        self.eat('FN')
+        line = self.eat('FN')[2]
         name = self.eat('IDENT')[1]
 
         # Parse parameter names
@@ -68,8 +60,8 @@ class Parser:
         param_types = []
         while True:
             tok = self.current()
-            if tok[0] in ('INT_TYPE', 'STRING_TYPE', 'DOUBLE_TYPE', 'BOOL_TYPE'):
-                param_types.append(self.eat(tok[0])[1])
+            if tok[0] in TYPE_TOKENS:
+                param_types.append(self.parse_type())
                 if self.current()[0] == 'ARROW':
                     self.eat('ARROW')
                 elif self.current()[0] == 'ARROW2':
@@ -81,17 +73,19 @@ class Parser:
                 raise RuntimeError(f"Expected type token, got {tok}")
 
         # Return type
-        if self.current()[0] not in ('INT_TYPE', 'STRING_TYPE', 'DOUBLE_TYPE', 'BOOL_TYPE'):
+        if self.current()[0] not in TYPE_TOKENS:
             raise RuntimeError(f"Expected return type token, got {self.current()}")
-        return_type = self.eat(self.current()[0])[1]
+        return_type = self.parse_type()
 
         # Validate parameter count matches
         if len(params) != len(param_types):
             raise RuntimeError(f"Parameter count mismatch in function {name}: {len(params)} names vs {len(param_types)} types")
 
         signature = FunctionSignature(name, param_types, return_type)
+        signature.line = line
 
         # Parse function definition line: name and params again
+        def_line = self.current()[2]
         def_name = self.eat('IDENT')[1]
         if def_name != name:
             raise RuntimeError(f"Function name mismatch: expected {name} but got {def_name}")
@@ -108,33 +102,23 @@ class Parser:
 
         body = self.parse_block()
         definition = FunctionDefinition(name, def_params, body)
+        definition.line = def_line
 
         return [signature, definition]
 
+    def parse_type(self):
+        # A type name, or Array followed by the type of its elements.
+        if self.current()[0] == 'ARRAY_TYPE':
+            self.eat('ARRAY_TYPE')
+            if self.current()[0] not in ('INT_TYPE', 'DOUBLE_TYPE'):
+                raise RuntimeError(f"Expected Int or Double after Array, got {self.current()}")
+            return f"Array {self.eat(self.current()[0])[1]}"
+        return self.eat(self.current()[0])[1]
+
     def parse_block(self):
         stmts = []
         while self.current()[0] not in ('END', 'EOF'):
-            tok = self.current()
-            if tok[0] == 'PUTS':
-                stmts.append(self.parse_puts())
-            elif tok[0] == 'LET':
-                stmts.append(self.parse_variable_assignment())
-            elif tok[0] == 'IF':
-                stmts.append(self.parse_if_chain())
-            elif tok[0] == 'CHECK':
-                stmts.append(self.parse_check_statement())
-            elif tok[0] == 'LOOP':
-                stmts.append(self.parse_loop())
-            elif tok[0] == 'RETURN':
-                stmts.append(self.parse_return())
-            elif tok[0] == 'BREAK':
-                self.eat('BREAK')
-                stmts.append(BreakStatement())
-            elif tok[0] == 'CONTINUE':
-                self.eat('CONTINUE')
-                stmts.append(ContinueStatement())
-            else:
-                stmts.append(self.parse_expression())
+            stmts.append(self.parse_statement())
         self.eat('END')
         return stmts
 
@@ -174,25 +158,27 @@ class Parser:
     def parse_statement(self):
         tok = self.current()
         if tok[0] == 'PUTS':
-            return self.parse_puts()
+            node = self.parse_puts()
         elif tok[0] == 'LET':
-            return self.parse_variable_assignment()
+            node = self.parse_variable_assignment()
         elif tok[0] == 'IF':
-            return self.parse_if_chain()
+            node = self.parse_if_chain()
         elif tok[0] == 'CHECK':
-            return self.parse_check_statement()
+            node = self.parse_check_statement()
         elif tok[0] == 'LOOP':
-            return self.parse_loop()
+            node = self.parse_loop()
         elif tok[0] == 'RETURN':
-            return self.parse_return()
+            node = self.parse_return()
         elif tok[0] == 'BREAK':
             self.eat('BREAK')
-            return BreakStatement()
+            node = BreakStatement()
         elif tok[0] == 'CONTINUE':
             self.eat('CONTINUE')
-            return ContinueStatement()
+            node = ContinueStatement()
         else:
-            return self.parse_expression()
+            node = self.parse_expression()
+        node.line = tok[2]
+        return node
 
     def parse_return(self):
         self.eat('RETURN')
@@ -206,8 +192,8 @@ class Parser:
         type_annotation = None
         if self.current()[0] == 'COLON2':
             self.eat('COLON2')
-            if self.current()[0] in ('INT_TYPE', 'STRING_TYPE', 'DOUBLE_TYPE', 'BOOL_TYPE'):
-                type_annotation = self.eat(self.current()[0])[1]
+            if self.current()[0] in TYPE_TOKENS:
+                type_annotation = self.parse_type()
             else:
                 raise RuntimeError(f"Expected type token after '::', got {self.current()}")
 
@@ -321,6 +307,9 @@ class Parser:
         elif tok[0] == 'FALSE':
             self.eat('FALSE')
             return BooleanLiteral(False)
+        elif tok[0] == 'END_OF_INPUT':
+            self.eat('END_OF_INPUT')
+            return EndOfInput()
         elif tok[0] == 'LPAREN':
             self.eat('LPAREN')
             expr = self.parse_expression()
@@ -341,7 +330,7 @@ class Parser:
         # Function call: identifier followed by zero or more args
         if isinstance(expr, Identifier):
             args = []
-            while self.current()[0] in ('IDENT', 'NUMBER', 'STRING', 'TRUE', 'FALSE', 'LPAREN'):
+            while self.current()[0] in ('IDENT', 'NUMBER', 'STRING', 'TRUE', 'FALSE', 'END_OF_INPUT', 'LPAREN'):
                 arg = self.parse_primary()
                 args.append(arg)
             if args:
@@ -383,4 +372,34 @@ class Parser:
 
     def parse_expression(self):
         # Logical expressions are top level
-        return self.parse_logical_expr()
\ No newline at end of file
+        return self.parse_logical_expr()
+
+
+class StreamingParser(Parser):
+    # Parses from any token iterator (such as tokenizer.iter_tokens or
+    # tokenizer.stream_file) through a small lookahead buffer instead of an
+    # indexed token list.
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
+
+    def fill(self, count):
+        while len(self.lookahead) < count:
+            token = next(self.tokens, None)
+            if token is None:
+                return False
+            self.lookahead.append(token)
+        return True
+
+    def current(self):
+        if self.fill(1):
+            return self.lookahead[0]
+        return ('EOF', '', -1)
+
+    def peek_next_token(self):
+        if self.fill(2):
+            return self.lookahead[1]
+        return ('EOF', '', -1)
+
+    def advance(self):
+        self.lookahead.popleft()
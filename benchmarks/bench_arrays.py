@@ -0,0 +1,82 @@
+# The same numeric batch computed by a loop over numbers and by array
+# operations, as the batch grows tenfold. Both must print the same results.
+#
+#   python -m benchmarks.bench_arrays [--size N] [--steps N] [--repeat N] [--engine NAME]
+import argparse
+import contextlib
+import io
+import time
+
+import arrays
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from optimizer import optimize
+
+LOOP = """
+let total :: Int = 0
+let above :: Int = 0
+let scaled :: Double = 0.0
+let i :: Int = 0
+loop {size} times:
+  let i :: Int = i + 1
+  let square :: Int = i * i
+  let total = total + square
+  if square > {threshold} then:
+    let above = above + 1
+  end
+  let scaled = scaled + i * 0.5 + 1.0
+end
+puts total
+puts above
+puts scaled
+"""
+
+ARRAYS = """
+let xs :: Array Int = arrayRange 1 {stop}
+let squares :: Array Int = xs * xs
+puts arraySum squares
+puts arraySum (squares > {threshold})
+puts arraySum (xs * 0.5 + 1.0)
+"""
+
+
+def run(engine_cls, source, repeat):
+    ast = optimize(Parser(tokenize(source)).parse())
+    best = None
+    for _ in range(repeat):
+        out = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(out):
+            engine_cls(ast).interpret()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out.getvalue()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare array operations with loops over numbers.')
+    arg_parser.add_argument('--size', type=int, default=1000, help='elements in the smallest batch')
+    arg_parser.add_argument('--steps', type=int, default=4, help='batch sizes, ten times larger each')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    options = arg_parser.parse_args()
+
+    print(f"arrays backed by {'NumPy' if arrays.numpy is not None else 'array.array'}")
+    print(f"{'engine':<10} {'size':>9} {'loop (s)':>10} {'arrays (s)':>11} {'speedup':>8}")
+    for name in options.engine or list(ENGINES):
+        for step in range(options.steps):
+            size = options.size * 10 ** step
+            threshold = size * size // 2
+            loop_time, loop_output = run(ENGINES[name], LOOP.format(size=size, threshold=threshold),
+                                         options.repeat)
+            array_time, array_output = run(ENGINES[name], ARRAYS.format(stop=size + 1, threshold=threshold),
+                                           options.repeat)
+            if loop_output != array_output:
+                raise RuntimeError(f"{name} computes different results with {size} elements")
+            print(f"{name:<10} {size:>9} {loop_time:>10.4f} {array_time:>11.5f} {loop_time / array_time:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Memory held by a parsed AST, as slotted nodes and as a NodeArena, and the
+# cost of pickling each form (what the program cache stores).
+#
+#   python -m benchmarks.bench_ast_memory [--size-mb N]
+import argparse
+import gc
+import pickle
+import time
+import tracemalloc
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from ast_arena import NodeArena
+from benchmarks.synthetic import generate_source
+
+
+def traced(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return value, size
+
+
+def timed(function):
+    start = time.perf_counter()
+    value = function()
+    return value, time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure AST memory and pickle cost.')
+    arg_parser.add_argument('--size-mb', type=float, default=5)
+    options = arg_parser.parse_args()
+
+    source = generate_source(int(options.size_mb * 1e6))
+    tokens = tokenize(source)
+    ast, nodes_size = traced(lambda: Parser(tokens).parse())
+    del tokens
+    arena, arena_size = traced(lambda: NodeArena.encode(ast))
+    print(f"{len(arena)} nodes from {len(source)} bytes of source")
+    print(f"{'nodes':<8} {nodes_size / 1e6:>8.1f} MB")
+    print(f"{'arena':<8} {arena_size / 1e6:>8.1f} MB ({arena.nbytes() / 1e6:.1f} MB of arrays)")
+
+    for label, value, load in (('nodes', ast, pickle.loads),
+                               ('arena', arena, lambda data: pickle.loads(data).decode())):
+        data, dump_time = timed(lambda: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        _, load_time = timed(lambda: load(data))
+        print(f"{label:<8} pickle {len(data) / 1e6:>6.1f} MB  dump {dump_time:.2f}s  load {load_time:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
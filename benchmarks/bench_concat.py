@@ -0,0 +1,82 @@
+# Building a report one line at a time with ++, as the number of lines
+# doubles. A loop that only appends to the report builds it in a list and
+# joins it once, so its time should double with the lines; when the loop
+# also reads the report, every append copies it and the time quadruples.
+#
+#   python -m benchmarks.bench_concat [--lines N] [--steps N] [--repeat N] [--engine NAME]
+import argparse
+import contextlib
+import io
+import time
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from optimizer import optimize
+
+REPORT = """
+fn cell x :: Int ->> String
+cell x = "[" ++ (x * 7) ++ "]"
+end
+
+let report :: String = "report\\n"
+let last :: String = ""
+let i :: Int = 0
+loop {lines} times:
+  let i :: Int = i + 1
+  let report = report ++ "row " ++ i ++ ": " ++ (cell i) ++ "\\n"
+  {extra}
+end
+puts last
+puts report
+"""
+
+VARIANTS = [
+    ('append only', ''),
+    # Reading the report in the loop keeps it a plain string.
+    ('read in loop', 'let last = report'),
+]
+
+
+def run(engine_cls, lines, extra, repeat):
+    ast = optimize(Parser(tokenize(REPORT.format(lines=lines, extra=extra))).parse())
+    best = None
+    for _ in range(repeat):
+        out = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(out):
+            engine_cls(ast).interpret()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out.getvalue()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure how report building scales with its length.')
+    arg_parser.add_argument('--lines', type=int, default=4000, help='lines in the smallest report')
+    arg_parser.add_argument('--steps', type=int, default=4, help='report sizes, doubling each time')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    options = arg_parser.parse_args()
+
+    print(f"{'engine':<10} {'lines':>7}" + ''.join(f" {label + ' (s)':>18} {'growth':>7}" for label, _ in VARIANTS))
+    for name in options.engine or list(ENGINES):
+        previous = [None] * len(VARIANTS)
+        for step in range(options.steps):
+            lines = options.lines << step
+            row = f"{name:<10} {lines:>7}"
+            outputs = set()
+            for index, (_, extra) in enumerate(VARIANTS):
+                elapsed, output = run(ENGINES[name], lines, extra, options.repeat)
+                outputs.add(output.split('\n', 1)[1])
+                growth = f"{elapsed / previous[index]:>6.1f}x" if previous[index] else f"{'':>7}"
+                row += f" {elapsed:>18.4f} {growth}"
+                previous[index] = elapsed
+            if len(outputs) != 1:
+                raise RuntimeError(f"{name} builds different reports with {lines} lines")
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
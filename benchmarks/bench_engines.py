@@ -0,0 +1,77 @@
+# Compare execution time of the engines on the .sova workloads.
+#
+#   python -m benchmarks.bench_engines [--repeat N] [--no-optimize] [--memoize POLICY] [--typecheck]
+#                                      [workload.sova ...]
+import argparse
+import contextlib
+import glob
+import io
+import os
+import time
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from memo import POLICIES, RECURSIVE, Memoizer
+from optimizer import optimize
+from typechecker import TypeChecker
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_engine(engine_cls, code, optimized=True, memoize=RECURSIVE, typecheck=False):
+    ast = Parser(tokenize(code)).parse()
+    if optimized:
+        ast = optimize(ast)
+    types = None
+    if typecheck:
+        typing = TypeChecker().check(ast)
+        if typing.errors:
+            raise RuntimeError(f"Type errors: {'; '.join(typing.errors)}")
+        types = typing.types
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        engine_cls(ast, Memoizer(memoize), types=types).interpret()
+    return time.perf_counter() - start, out.getvalue()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare execution engines on .sova workloads.')
+    arg_parser.add_argument('workloads', nargs='*')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    arg_parser.add_argument('--no-optimize', action='store_true', help='skip the AST optimizer')
+    arg_parser.add_argument('--memoize', choices=POLICIES, default=RECURSIVE,
+                            help='which pure functions to memoize (default: recursive)')
+    arg_parser.add_argument('--typecheck', action='store_true',
+                            help='type check each workload and run it with typed fast paths')
+    options = arg_parser.parse_args()
+
+    workloads = options.workloads or sorted(glob.glob(os.path.join(HERE, '*.sova')))
+    engines = options.engine or list(ENGINES)
+
+    print(f"{'workload':<20} {'engine':<10} {'best (s)':>10} {'speedup':>8}")
+    for path in workloads:
+        with open(path) as f:
+            code = f.read()
+        baseline = None
+        expected = None
+        for name in engines:
+            best = None
+            for _ in range(options.repeat):
+                elapsed, output = run_engine(ENGINES[name], code, not options.no_optimize, options.memoize,
+                                             options.typecheck)
+                best = elapsed if best is None else min(best, elapsed)
+            if expected is None:
+                expected = output
+            elif output != expected:
+                raise RuntimeError(f"{name} output differs on {path}")
+            if baseline is None:
+                baseline = best
+            print(f"{os.path.basename(path):<20} {name:<10} {best:>10.4f} {baseline / best:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
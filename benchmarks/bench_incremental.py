@@ -0,0 +1,108 @@
+# Edit-to-AST latency of the incremental front end against a full tokenize
+# and parse, on a large generated source.
+#
+#   python -m benchmarks.bench_incremental [--lines N] [--edits N] [--repeat N]
+import argparse
+import random
+import statistics
+import time
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from incremental import IncrementalParser
+from benchmarks.synthetic import generate_lines
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def line_indexes(front, prefix):
+    return [index for index, line in enumerate(front.lines) if line.startswith(prefix)]
+
+
+def edit_and_parse(front, start, end, new_lines):
+    front.replace_lines(start, end, new_lines)
+    front.ast()
+
+
+# Each scenario makes an edit at a line and then undoes it; both are timed.
+def retype_literal(front, index):
+    line = front.lines[index]
+    yield index, index + 1, [line.replace('=', '= 1 +', 1)]
+    yield index, index + 1, [line]
+
+
+def insert_statement(front, index):
+    yield index, index, ['puts "inserted"']
+    yield index, index + 1, []
+
+
+def delete_line(front, index):
+    line = front.lines[index]
+    yield index, index + 1, []
+    yield index, index, [line]
+
+
+def break_and_fix(front, index):
+    # Deleting a function's `end` makes everything after it part of the
+    # body until it is typed back.
+    line = front.lines[index]
+    yield index, index + 1, ['en']
+    yield index, index + 1, [line]
+
+
+SCENARIOS = [
+    ('retype literal', 'let ', retype_literal),
+    ('insert line', 'let ', insert_statement),
+    ('delete line', '    puts', delete_line),
+    ('break and fix', 'end', break_and_fix),
+]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure incremental reparsing latency.')
+    arg_parser.add_argument('--lines', type=int, default=50000)
+    arg_parser.add_argument('--edits', type=int, default=50, help='edits per scenario')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='runs of the full parse')
+    options = arg_parser.parse_args()
+
+    source = generate_lines(options.lines)
+    full = min(timed(lambda: Parser(tokenize(source)).parse()) for _ in range(options.repeat))
+    front = None
+
+    def build():
+        nonlocal front
+        front = IncrementalParser(source)
+    initial = timed(build)
+    print(f"{len(front.lines)} lines, {len(front.groups)} top-level groups")
+    print(f"{'full parse':<16} {full * 1000:>10.1f} ms")
+    print(f"{'initial build':<16} {initial * 1000:>10.1f} ms")
+    print(f"\n{'edit':<16} {'median (ms)':>12} {'max (ms)':>10} {'speedup':>8}")
+
+    rnd = random.Random(1)
+    for label, prefix, scenario in SCENARIOS:
+        times = []
+        failures = 0
+        candidates = line_indexes(front, prefix)
+        for _ in range(options.edits):
+            index = rnd.choice(candidates)
+            for start, end, new_lines in scenario(front, index):
+                start_time = time.perf_counter()
+                try:
+                    edit_and_parse(front, start, end, new_lines)
+                except RuntimeError:
+                    failures += 1
+                times.append(time.perf_counter() - start_time)
+        median = statistics.median(times)
+        note = f"  ({failures} edits left a syntax error)" if failures else ''
+        print(f"{label:<16} {median * 1000:>12.2f} {max(times) * 1000:>10.2f} {full / median:>7.0f}x{note}")
+
+    if repr(front.ast()) != repr(Parser(tokenize(front.text())).parse()):
+        raise RuntimeError("incremental AST differs from a full parse")
+
+
+if __name__ == '__main__':
+    main()
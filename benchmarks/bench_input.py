@@ -0,0 +1,82 @@
+# Throughput of getLine from each input source, on every engine: a program
+# sums the lines of a generated file until eof.
+#
+#   python -m benchmarks.bench_input [--lines N] [--engine NAME ...]
+import argparse
+import os
+import tempfile
+import time
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from optimizer import optimize
+from streams import BufferedSource, CollectingSink, FileSource, InputSource, ListSource
+
+PROGRAM = """
+let total :: Int = 0
+loop until eof:
+  let line :: String <- getLine
+  let total :: Int = total + (toInt line)
+end
+puts total
+"""
+
+
+class ReadlineSource(InputSource):
+    # One text-mode readline per line, as input() does when stdin is a pipe.
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = None
+
+    def read_line(self):
+        line = self.pending if self.pending is not None else self.stream.readline()
+        self.pending = None
+        return line.rstrip('\n')
+
+    def at_end(self):
+        if self.pending is None:
+            self.pending = self.stream.readline()
+        return self.pending == ''
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure getLine throughput per input source.')
+    arg_parser.add_argument('--lines', type=int, default=500_000)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    options = arg_parser.parse_args()
+
+    ast = optimize(Parser(tokenize(PROGRAM)).parse())
+    expected = f"{options.lines * (options.lines - 1) // 2}\n"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'input.txt')
+        with open(path, 'w') as f:
+            f.writelines(f"{n}\n" for n in range(options.lines))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        sources = {
+            'readline': lambda stream: ReadlineSource(stream),
+            'buffered': lambda stream: BufferedSource(stream),
+            'mmap': lambda stream: FileSource(path),
+            'list': lambda stream: ListSource(lines),
+        }
+
+        print(f"{'engine':<10} {'source':<9} {'time (s)':>9} {'lines/s':>12}")
+        for name in options.engine or list(ENGINES):
+            for label, make_source in sources.items():
+                output = CollectingSink()
+                with open(path) as stream:
+                    source = make_source(stream)
+                    engine = ENGINES[name](ast, output=output, input_source=source)
+                    start = time.perf_counter()
+                    engine.interpret()
+                    elapsed = time.perf_counter() - start
+                    source.close()
+                if output.getvalue() != expected:
+                    raise RuntimeError(f"{name} with {label} input printed {output.getvalue()!r}")
+                print(f"{name:<10} {label:<9} {elapsed:>9.3f} {options.lines / elapsed:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
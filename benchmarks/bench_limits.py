@@ -0,0 +1,80 @@
+# What execution budgets (see limits.py) cost: every engine runs the .sova
+# workloads with no Limits, with step and time limits too high to reach,
+# and with size limits as well. All three must print the same output; the
+# overhead is against the run with no Limits. Size limits cost most on
+# untyped programs, where any + or * might make a string.
+#
+#   python -m benchmarks.bench_limits [--repeat N] [--engine NAME ...] [--typecheck] [workload.sova ...]
+import argparse
+import contextlib
+import glob
+import io
+import os
+import time
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from limits import Limits
+from optimizer import optimize
+from typechecker import TypeChecker
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BUDGETS = {
+    'none': None,
+    'steps+time': Limits(steps=10 ** 12, seconds=10 ** 6),
+    'all': Limits(steps=10 ** 12, seconds=10 ** 6, string_length=10 ** 9, array_length=10 ** 9),
+}
+
+
+def run(engine_cls, ast, types, limits, repeat):
+    best = None
+    for _ in range(repeat):
+        out = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(out):
+            engine_cls(ast, types=types, limits=limits).interpret()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out.getvalue()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure the overhead of execution budgets.')
+    arg_parser.add_argument('workloads', nargs='*')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    arg_parser.add_argument('--typecheck', action='store_true',
+                            help='type check each workload and run it with typed fast paths')
+    options = arg_parser.parse_args()
+
+    workloads = options.workloads or sorted(glob.glob(os.path.join(HERE, '*.sova')))
+    print(f"{'workload':<16} {'engine':<8} " + ' '.join(f"{budget:>11}" for budget in BUDGETS)
+          + ' ' + ' '.join(f"{budget + ' +%':>13}" for budget in list(BUDGETS)[1:]))
+    for path in workloads:
+        with open(path) as f:
+            ast = optimize(Parser(tokenize(f.read())).parse())
+        types = None
+        if options.typecheck:
+            typing = TypeChecker().check(ast)
+            if typing.errors:
+                raise RuntimeError(f"Type errors: {'; '.join(typing.errors)}")
+            types = typing.types
+        for name in options.engine or list(ENGINES):
+            times = []
+            expected = None
+            for budget, limits in BUDGETS.items():
+                elapsed, output = run(ENGINES[name], ast, types, limits, options.repeat)
+                if expected is None:
+                    expected = output
+                elif output != expected:
+                    raise RuntimeError(f"{name} output differs on {path} with {budget} limits")
+                times.append(elapsed)
+            print(f"{os.path.basename(path):<16} {name:<8} " + ' '.join(f"{t:>11.4f}" for t in times)
+                  + ' ' + ' '.join(f"{(t / times[0] - 1) * 100:>13.1f}" for t in times[1:]))
+
+
+if __name__ == '__main__':
+    main()
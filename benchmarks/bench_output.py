@@ -0,0 +1,60 @@
+# Throughput of puts through each output sink, on every engine. Output goes
+# to os.devnull, so the numbers are the cost of producing it.
+#
+#   python -m benchmarks.bench_output [--lines N] [--engine NAME ...]
+import argparse
+import os
+import time
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from optimizer import optimize
+from streams import BLOCK, LINE, BufferedSink, CollectingSink, OutputSink
+
+PROGRAM = """
+let i :: Int = 0
+loop {lines} times:
+  let i :: Int = i + 1
+  puts "line " ++ i
+end
+"""
+
+
+class PrintSink(OutputSink):
+    # One print() per line, as the engines did before sinks.
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, value):
+        print(value, file=self.stream)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure puts throughput per output sink.')
+    arg_parser.add_argument('--lines', type=int, default=500_000)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    options = arg_parser.parse_args()
+
+    ast = optimize(Parser(tokenize(PROGRAM.format(lines=options.lines))).parse())
+    sinks = {
+        'print': lambda devnull: PrintSink(devnull),
+        'line': lambda devnull: BufferedSink(devnull, policy=LINE),
+        'block': lambda devnull: BufferedSink(devnull, policy=BLOCK),
+        'collect': lambda devnull: CollectingSink(),
+    }
+
+    print(f"{'engine':<10} {'sink':<8} {'time (s)':>9} {'lines/s':>12}")
+    with open(os.devnull, 'w') as devnull:
+        for name in options.engine or list(ENGINES):
+            for label, make_sink in sinks.items():
+                engine = ENGINES[name](ast, output=make_sink(devnull))
+                start = time.perf_counter()
+                engine.interpret()
+                elapsed = time.perf_counter() - start
+                print(f"{name:<10} {label:<8} {elapsed:>9.3f} {options.lines / elapsed:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# Time each phase of running a workload separately: tokenize, parse,
+# optimize, type check and every engine's run (which includes compiling
+# for the engines that compile). Each phase is timed over --repeat runs,
+# then run once more under tracemalloc for its peak memory. Results can be
+# written as JSON and compared with benchmarks.compare.
+#
+#   python -m benchmarks.bench_phases [--repeat N] [--engine NAME] [--no-optimize] [--typecheck]
+#                                     [--generated-kb N] [--output results.json] [workload.sova ...]
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from engines import ENGINES
+from memo import POLICIES, RECURSIVE, Memoizer
+from optimizer import optimize
+from streams import CollectingSink, ListSource
+from typechecker import TypeChecker
+from benchmarks.synthetic import generate_source
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_VERSION = 1
+
+
+def timings(function, repeat):
+    times = []
+    value = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        value = function()
+        times.append(time.perf_counter() - start)
+    return value, times
+
+
+def peak_memory(function):
+    # Peak bytes allocated while function runs, above what was already held.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_program(engine_cls, ast, memoize, types):
+    sink = CollectingSink()
+    engine_cls(ast, Memoizer(memoize), sink, ListSource([]), types).interpret()
+    return sink.getvalue()
+
+
+def measure_workload(name, code, engines, options):
+    # One result per phase of one workload, in phase order.
+    phases = []
+
+    def phase(label, function):
+        value, times = timings(function, options.repeat)
+        phases.append((label, times, peak_memory(function)))
+        return value
+
+    tokens = phase('tokenize', lambda: tokenize(code))
+    ast = phase('parse', lambda: Parser(tokens).parse())
+    if not options.no_optimize:
+        ast = phase('optimize', lambda: optimize(ast))
+    types = None
+    if options.typecheck:
+        typing = phase('typecheck', lambda: TypeChecker().check(ast))
+        if typing.errors:
+            raise RuntimeError(f"Type errors in {name}: {'; '.join(typing.errors)}")
+        types = typing.types
+    expected = None
+    for engine in engines:
+        output = phase(f"run:{engine}", lambda: run_program(ENGINES[engine], ast, options.memoize, types))
+        if expected is None:
+            expected = output
+        elif output != expected:
+            raise RuntimeError(f"{engine} output differs on {name}")
+    return [{'workload': name, 'bytes': len(code.encode('utf-8')), 'phase': label,
+             'best': min(times), 'median': statistics.median(times), 'peak': peak}
+            for label, times, peak in phases]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Time tokenizing, parsing and running .sova workloads.')
+    arg_parser.add_argument('workloads', nargs='*')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to run (repeatable, default: all)')
+    arg_parser.add_argument('--no-optimize', action='store_true', help='skip the AST optimizer')
+    arg_parser.add_argument('--typecheck', action='store_true',
+                            help='type check each workload and run it with typed fast paths')
+    arg_parser.add_argument('--memoize', choices=POLICIES, default=RECURSIVE,
+                            help='which pure functions to memoize (default: recursive)')
+    arg_parser.add_argument('--generated-kb', type=int, default=256,
+                            help='also run a generated source of this size (0 to skip, default: 256)')
+    arg_parser.add_argument('--output', '-o', help='write the results as JSON to this file')
+    options = arg_parser.parse_args()
+    if options.repeat < 1:
+        arg_parser.error('--repeat must be at least 1')
+
+    workloads = []
+    for path in options.workloads or sorted(glob.glob(os.path.join(HERE, '*.sova'))):
+        with open(path) as f:
+            workloads.append((os.path.basename(path), f.read()))
+    if options.generated_kb > 0:
+        workloads.append((f"generated-{options.generated_kb}kb", generate_source(options.generated_kb * 1000)))
+    engines = options.engine or list(ENGINES)
+
+    results = []
+    print(f"{'workload':<20} {'phase':<14} {'best (s)':>10} {'median (s)':>11} {'peak (KB)':>10}")
+    for name, code in workloads:
+        for result in measure_workload(name, code, engines, options):
+            results.append(result)
+            print(f"{name:<20} {result['phase']:<14} {result['best']:>10.4f} {result['median']:>11.4f} "
+                  f"{result['peak'] / 1e3:>10.1f}")
+
+    if options.output:
+        document = {
+            'version': RESULTS_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'options': {'repeat': options.repeat, 'optimize': not options.no_optimize,
+                        'typecheck': options.typecheck, 'memoize': options.memoize},
+            'results': results,
+        }
+        with open(options.output, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
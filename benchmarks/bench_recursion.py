@@ -0,0 +1,79 @@
+# Deep recursion on the VM: a tail-recursive accumulator, which must run
+# in constant space, and a non-tail recursion, whose frames live on the
+# VM's heap-allocated call stack rather than the Python stack.
+#
+#   python -m benchmarks.bench_recursion [--depth N] [--memory]
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from memo import OFF, Memoizer
+from optimizer import optimize
+from vm import VMInterpreter
+
+TAIL = """
+fn sum n acc :: Int -> Int ->> Int
+sum n acc = check n:
+  when 0: acc
+  else: sum (n - 1) (acc + n)
+end
+end
+
+puts sum {depth} 0
+"""
+
+NON_TAIL = """
+fn depth n :: Int ->> Int
+depth n = check n:
+  when 0: 0
+  else: 1 + (depth (n - 1))
+end
+end
+
+puts depth {depth}
+"""
+
+
+def run(template, depth, traced=False):
+    ast = optimize(Parser(tokenize(template.format(depth=depth))).parse())
+    out = io.StringIO()
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            # Memoization would add a frame to every non-tail call.
+            VMInterpreter(ast, Memoizer(OFF)).interpret()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if traced else None
+    finally:
+        if traced:
+            tracemalloc.stop()
+    return out.getvalue().strip(), elapsed, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Recurse deeply on the VM.')
+    arg_parser.add_argument('--depth', type=int, default=1_000_000)
+    arg_parser.add_argument('--memory', action='store_true',
+                            help='also report peak memory (tracemalloc slows the run down)')
+    options = arg_parser.parse_args()
+
+    expected = {'tail': str(options.depth * (options.depth + 1) // 2), 'non-tail': str(options.depth)}
+    for label, template in (('tail', TAIL), ('non-tail', NON_TAIL)):
+        output, elapsed, _ = run(template, options.depth)
+        if output != expected[label]:
+            raise RuntimeError(f"{label}: expected {expected[label]}, got {output}")
+        line = f"{label:<10} depth {options.depth}  {elapsed:.2f}s"
+        if options.memory:
+            peak = run(template, options.depth, traced=True)[2]
+            line += f"  peak {peak / 1e6:.1f} MB"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# Concurrent interactive sessions: async sessions on one event loop (see
+# sessions.py) against one thread per session, as the number of sessions
+# open at once grows. Every client sends its lines one at a time and waits
+# for each answer; the time from sending a line to reading its answer is
+# the per-line latency. The server runs in a process of its own, whose
+# peak thread count and memory are sampled from /proc where there is one.
+# Sessions whose connection the server drops are counted as failed.
+#
+#   python -m benchmarks.bench_sessions [--sessions N ...] [--lines N] [--mode MODE ...]
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import socketserver
+import statistics
+import tempfile
+import time
+
+from program import Program
+from session_server import BACKLOG, SessionServer
+from sessions import SessionHost
+from streams import BLOCK, BufferedSink, BufferedSource
+
+PROGRAM = """
+let count :: Int = 0
+loop until eof:
+  let line :: String <- getLine
+  let count :: Int = count + 1
+  puts count ++ ": " ++ line ++ " doubled is " ++ ((toInt line) * 2)
+end
+"""
+
+ASYNC, THREADS = 'async', 'threads'
+
+
+def serve_async(path, ready):
+    async def serve():
+        server = await SessionServer(SessionHost(Program.from_source(PROGRAM, engine='vm'))).start(path=path)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(serve())
+
+
+class _SessionHandler(socketserver.StreamRequestHandler):
+    # A blocking run of the program, on the connection's own thread.
+    def handle(self):
+        source = BufferedSource(io.TextIOWrapper(self.rfile, encoding='utf-8'))
+        sink = BufferedSink(io.TextIOWrapper(self.wfile, encoding='utf-8'), policy=BLOCK)
+        self.server.program.run(source, sink)
+
+
+class _ThreadedServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = BACKLOG
+
+
+def serve_threads(path, ready):
+    with _ThreadedServer(path, _SessionHandler) as server:
+        server.program = Program.from_source(PROGRAM, engine='vm')
+        ready.set()
+        server.serve_forever()
+
+
+def server_status(pid):
+    # The server's thread count and resident memory in KiB, or None.
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(':', 1) for line in f)
+    except OSError:
+        return None
+    return int(fields['Threads']), int(fields['VmRSS'].split()[0])
+
+
+async def client(path, lines, latencies):
+    reader, writer = await asyncio.open_unix_connection(path)
+    for index in range(lines):
+        start = time.perf_counter()
+        writer.write(f"{index}\n".encode())
+        answer = await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        if not answer.endswith(f" doubled is {index * 2}\n".encode()):
+            raise RuntimeError(f"Unexpected answer: {answer!r}")
+    writer.write_eof()
+    await reader.read()
+    writer.close()
+
+
+async def run_clients(path, sessions, lines, pid):
+    latencies = []
+    peak = [0, 0]
+
+    async def sample():
+        while True:
+            status = server_status(pid)
+            if status is not None:
+                peak[:] = map(max, peak, status)
+            await asyncio.sleep(0.01)
+    sampler = asyncio.ensure_future(sample())
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*[client(path, lines, latencies) for _ in range(sessions)],
+                                       return_exceptions=True)
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if isinstance(result, Exception) and not isinstance(result, OSError):
+            raise result
+    failed = sum(isinstance(result, OSError) for result in results)
+    return elapsed, latencies, failed, peak
+
+
+def measure(mode, sessions, lines):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sessions.sock')
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=serve_async if mode == ASYNC else serve_threads,
+                                         args=(path, ready), daemon=True)
+        server.start()
+        try:
+            if not ready.wait(30):
+                raise RuntimeError(f"The {mode} server did not start")
+            elapsed, latencies, failed, (threads, memory) = asyncio.run(
+                run_clients(path, sessions, lines, server.pid))
+        finally:
+            server.terminate()
+            server.join()
+    if not latencies:
+        raise RuntimeError(f"Every {mode} session failed")
+    latencies.sort()
+    return {
+        'lines_per_second': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'failed': failed,
+        'threads': threads,
+        'memory': memory,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure concurrent interactive sessions.')
+    arg_parser.add_argument('--sessions', type=int, action='append',
+                            help='sessions open at once (repeatable, default: 10 100 1000)')
+    arg_parser.add_argument('--lines', type=int, default=20, help='lines each session exchanges')
+    arg_parser.add_argument('--mode', action='append', choices=(ASYNC, THREADS),
+                            help='how sessions are served (repeatable, default: both)')
+    options = arg_parser.parse_args()
+
+    print(f"{'mode':<8} {'sessions':>8} {'lines/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'failed':>7} {'threads':>8} {'memory (MiB)':>13}")
+    for sessions in options.sessions or [10, 100, 1000]:
+        for mode in options.mode or [ASYNC, THREADS]:
+            result = measure(mode, sessions, options.lines)
+            memory = f"{result['memory'] / 1024:.1f}" if result['memory'] else '-'
+            print(f"{mode:<8} {sessions:>8} {result['lines_per_second']:>9.0f} {result['p50'] * 1000:>9.2f} "
+                  f"{result['p99'] * 1000:>9.2f} {result['failed']:>7} {result['threads'] or '-':>8} "
+                  f"{memory:>13}")
+
+
+if __name__ == '__main__':
+    main()
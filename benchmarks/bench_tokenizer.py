@@ -0,0 +1,43 @@
+# Tokenizer throughput on large synthetic sources.
+#
+#   python -m benchmarks.bench_tokenizer [--size-mb N] [--repeat N]
+import argparse
+import os
+import tempfile
+import time
+
+from tokenizer import iter_tokens, stream_file, tokenize
+from benchmarks.synthetic import generate_source
+
+
+def measure(label, lex, size, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = lex()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<14} {count:>10} tokens {count / best:>12,.0f} tokens/s {size / best / 1e6:>7.2f} MB/s")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measure tokenizer throughput.')
+    arg_parser.add_argument('--size-mb', type=float, default=5)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    options = arg_parser.parse_args()
+
+    source = generate_source(int(options.size_mb * 1e6))
+    data = source.encode('utf-8')
+    with tempfile.NamedTemporaryFile('wb', suffix='.sova', delete=False) as f:
+        f.write(data)
+    try:
+        measure('tokenize', lambda: len(tokenize(source)), len(data), options.repeat)
+        measure('iter_tokens', lambda: sum(1 for _ in iter_tokens(source)), len(data), options.repeat)
+        measure('bytes', lambda: sum(1 for _ in iter_tokens(data)), len(data), options.repeat)
+        measure('stream_file', lambda: sum(1 for _ in stream_file(f.name)), len(data), options.repeat)
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == '__main__':
+    main()
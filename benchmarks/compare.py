@@ -0,0 +1,77 @@
+# Compare two result files written by benchmarks.bench_phases and flag
+# every phase that got slower, or used more memory, by more than the
+# threshold. Exits with status 1 when anything regressed.
+#
+#   python -m benchmarks.compare OLD.json NEW.json [--threshold PCT] [--memory-threshold PCT]
+#                                [--min-seconds S]
+import argparse
+import json
+import sys
+
+from benchmarks.bench_phases import RESULTS_VERSION
+
+
+def load_results(path):
+    with open(path) as f:
+        document = json.load(f)
+    if document.get('version') != RESULTS_VERSION:
+        raise RuntimeError(f"{path}: unsupported results version {document.get('version')}")
+    return {(result['workload'], result['phase']): result for result in document['results']}
+
+
+def change(old, new):
+    return (new - old) / old if old else 0.0
+
+
+def compare(old, new, threshold, memory_threshold, min_seconds):
+    # Rows of (workload, phase, time change, memory change, regressed).
+    # Phases faster than min_seconds in both files are too noisy for their
+    # time to count as a regression.
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        time_change = change(before['best'], after['best'])
+        memory_change = change(before['peak'], after['peak'])
+        slower = time_change > threshold and max(before['best'], after['best']) >= min_seconds
+        regressed = slower or memory_change > memory_threshold
+        rows.append((*key, time_change, memory_change, regressed))
+    return rows
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Flag regressions between two benchmark result files.')
+    arg_parser.add_argument('old')
+    arg_parser.add_argument('new')
+    arg_parser.add_argument('--threshold', type=float, default=10,
+                            help='percent slowdown that counts as a regression (default: 10)')
+    arg_parser.add_argument('--memory-threshold', type=float, default=10,
+                            help='percent growth in peak memory that counts as a regression (default: 10)')
+    arg_parser.add_argument('--min-seconds', type=float, default=0.001,
+                            help='ignore slowdowns in phases faster than this (default: 0.001)')
+    options = arg_parser.parse_args()
+
+    try:
+        old = load_results(options.old)
+        new = load_results(options.new)
+    except (OSError, ValueError, KeyError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    rows = compare(old, new, options.threshold / 100, options.memory_threshold / 100, options.min_seconds)
+    print(f"{'workload':<20} {'phase':<14} {'time':>9} {'memory':>9}")
+    for workload, phase, time_change, memory_change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{workload:<20} {phase:<14} {time_change:>+9.1%} {memory_change:>+9.1%}{flag}")
+    for label, keys in (('only in old', old.keys() - new.keys()), ('only in new', new.keys() - old.keys())):
+        for workload, phase in sorted(keys):
+            print(f"{workload:<20} {phase:<14} {label}")
+
+    regressions = sum(1 for row in rows if row[-1])
+    if regressions:
+        print(f"\n{regressions} regression(s)")
+        sys.exit(1)
+    print("\nno regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Generators for large synthetic .sova sources.
+import random
+
+
+def generate_chunks(seed=1):
+    # Endless blocks of functions, declarations, conditionals and checks
+    # with fresh names.
+    rnd = random.Random(seed)
+    i = 0
+    while True:
+        i += 1
+        yield (f"fn scale{i} amount factor :: Int -> Double ->> Double\n"
+               f"scale{i} amount factor = (amount * factor) + {rnd.randint(0, 999)}\n"
+               f"end\n"
+               f"let total{i} :: Double = scale{i} {rnd.randint(1, 99)} {rnd.random():.3f}\n"
+               f"if total{i} >= 10 then:\n"
+               f"    puts \"big \" ++ total{i}\n"
+               f"else:\n"
+               f"    puts total{i} -- small\n"
+               f"end\n"
+               f"check total{i}:\n"
+               f"    when 1: puts \"one\"\n"
+               f"    else: puts \"other\"\n"
+               f"end\n")
+
+
+def generate_source(target_bytes, seed=1):
+    # Repeats generated blocks until the source reaches target_bytes.
+    parts = []
+    size = 0
+    for chunk in generate_chunks(seed):
+        if size >= target_bytes:
+            break
+        parts.append(chunk)
+        size += len(chunk)
+    return ''.join(parts)
+
+
+def generate_lines(target_lines, seed=1):
+    # Repeats generated blocks until the source has target_lines lines.
+    parts = []
+    lines = 0
+    for chunk in generate_chunks(seed):
+        if lines >= target_lines:
+            break
+        parts.append(chunk)
+        lines += chunk.count('\n')
+    return ''.join(parts)
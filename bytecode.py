@@ -0,0 +1,555 @@
+# bytecode.py
+# Compiles the parsed AST into a flat instruction stream for the VM in vm.py.
+#
+# Instructions are (opcode, argument) pairs stored back to back in an
+# array('i'); jump arguments are absolute offsets into that array.
+from array import array
+
+from arrays import ARRAY_CASTS
+from ast_nodes import *
+from memo import summarize
+from loops import function_reads, loop_invariants, string_accumulators
+from runtime import BINARY_OPS, BREAK, BUILTINS, CONTINUE, concat_operands, dispatch_table
+from resolver import GLOBAL, LOCAL, Resolver
+from typechecker import can_make_string, typed_binary_op, typed_cast
+
+OPNAMES = [
+    'LOAD_CONST',       # push consts[arg]
+    'LOAD_NAME',        # push global names[arg] (function bodies)
+    'LOAD_GLOBAL',      # push global names[arg] (top-level code)
+    'LOAD_LOCAL',       # push frame slot arg
+    'LOAD_LOCAL_OR_GLOBAL',  # push frame slot arg, or the global varnames[arg] if unset
+    'STORE_LOCAL',      # pop into frame slot arg
+    'STORE_GLOBAL',     # pop into global names[arg]
+    'ASSIGN_GLOBAL',    # pop into existing global names[arg]
+    'BINARY_OP',        # pop right, replace left with BINARY_FUNCS[arg](left, right); see CHECKED
+    'BUILD_STRING',     # pop arg values, push them joined as strings
+    'UNARY_NOT',
+    'CAST_INT',
+    'CAST_DOUBLE',
+    'CAST_ARRAY',       # convert top of stack with ARRAY_CAST_FUNCS[arg]
+    'JUMP',
+    'JUMP_IF_FALSE',    # pop, jump to arg if falsy
+    'JUMP_IF_TRUE',     # pop, jump to arg if truthy
+    'DISPATCH',         # pop, jump through the DispatchTable consts[arg]
+    'COUNT_DOWN',       # decrement the counter on top, or pop it and jump to arg when exhausted
+    'TO_COUNT',         # convert top of stack to an int loop counter
+    'POP',
+    'DUP',
+    'CALL',             # call calls[arg] = (name, argc, builtin)
+    'TAIL_CALL',        # as CALL, but the callee replaces the current frame
+    'RETURN',
+    'MEMO_STORE',       # store the top of stack in the cache the frame's (cache, key) names
+    'DEFINE_FUNCTION',  # register consts[arg] as a function
+    'PRINT',
+    'INPUT',
+    'AT_EOF',           # push whether the input source is exhausted
+    'RAISE',            # raise RuntimeError(consts[arg])
+    'CHECKPOINT',       # count a loop pass or call; pause every slice_steps (see vm.py)
+    'CHECK_STRING',     # fail if the string on top of the stack is over the string length limit
+    'LOAD_HOISTED',     # if hoisted value arg is set, push it and jump to arg
+    'STORE_HOISTED',    # set hoisted value arg to the top of stack
+    'CLEAR_HOISTED',    # unset the hoisted values of the HoistedValues consts[arg]
+    'LOAD_BUILDER',     # push the pieces of the string global names[arg] being built (see loops.py)
+    'APPEND_STRING',    # pop arg values, then the pieces below them, and append the values to those
+    'FINISH_STRING',    # store the string global names[arg] has been built into
+    'HALT',
+]
+(LOAD_CONST, LOAD_NAME, LOAD_GLOBAL, LOAD_LOCAL, LOAD_LOCAL_OR_GLOBAL, STORE_LOCAL, STORE_GLOBAL, ASSIGN_GLOBAL, BINARY_OP,
+ BUILD_STRING, UNARY_NOT, CAST_INT, CAST_DOUBLE, CAST_ARRAY, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, DISPATCH, COUNT_DOWN,
+ TO_COUNT, POP, DUP, CALL, TAIL_CALL, RETURN, MEMO_STORE, DEFINE_FUNCTION, PRINT, INPUT, AT_EOF, RAISE, CHECKPOINT,
+ CHECK_STRING, LOAD_HOISTED, STORE_HOISTED, CLEAR_HOISTED, LOAD_BUILDER, APPEND_STRING, FINISH_STRING,
+ HALT) = range(len(OPNAMES))
+
+BINARY_NAMES = tuple(BINARY_OPS)
+BINARY_FUNCS = tuple(BINARY_OPS.values())
+ARRAY_CAST_NAMES = tuple(ARRAY_CASTS)
+ARRAY_CAST_FUNCS = tuple(ARRAY_CASTS.values())
+EQ = BINARY_NAMES.index('==')
+# BINARY_OP args from CHECKED on are the operators of BINARY_NAMES with the
+# string checks of the run's Limits (see limits.py).
+CHECKED = len(BINARY_NAMES)
+
+
+class CodeObject:
+    def __init__(self, name, ops, consts, names, calls, varnames=()):
+        self.name = name
+        self.ops = ops
+        self.consts = consts
+        self.names = names
+        self.calls = calls
+        # Names of the frame slots, for functions.
+        self.varnames = varnames
+
+
+# Marks frame slots whose local has not been assigned yet.
+UNSET = object()
+
+
+class FunctionCode:
+    def __init__(self, name, params, code, summary):
+        self.name = name
+        self.params = params
+        self.code = code
+        # Appended to the arguments to make up the rest of the frame.
+        self.padding = (UNSET,) * (len(code.varnames) - len(params))
+        # Purity, for the memoizer.
+        self.summary = summary
+
+
+# A memoized call that misses returns through this frame, whose local_env
+# is (cache, key), on its way back to the caller.
+MEMO_STORE_CODE = CodeObject('<memo>', array('i', [MEMO_STORE, 0, RETURN, 0]), (), (), ())
+
+
+class DispatchTable:
+    # Jump targets for a check whose patterns are all literals, keyed by
+    # pattern value; default is taken when no pattern matches.
+    def __init__(self):
+        self.targets = {}
+        self.default = 0
+
+    def __repr__(self):
+        targets = ', '.join(f"{value!r}: {target}" for value, target in self.targets.items())
+        return f"{{{targets}}} else {self.default}"
+
+
+class HoistedValues:
+    # The values a loop hoists (see loops.py). Each is keyed by the offset
+    # just past the code computing it, which is where LOAD_HOISTED jumps.
+    def __init__(self):
+        self.keys = []
+
+    def __repr__(self):
+        return f"hoisted {self.keys}"
+
+
+class Loop:
+    # Jump targets for break and continue in the loop being compiled.
+    def __init__(self, node, start):
+        self.start = start
+        # A times loop keeps its counter on the stack.
+        self.has_counter = node.loop_type == 'times'
+        self.breaks = []
+
+
+class CodeBuilder:
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+        self.consts = []
+        self.names = []
+        self.calls = []
+        self.varnames = []
+        self.const_indexes = {}
+        self.name_indexes = {}
+
+    def emit(self, op, arg=0):
+        self.ops.append(op)
+        self.ops.append(arg)
+        return len(self.ops) - 2
+
+    def offset(self):
+        return len(self.ops)
+
+    def patch(self, index, target=None):
+        self.ops[index + 1] = self.offset() if target is None else target
+
+    def const(self, value):
+        # Key on the type too, so 1, 1.0 and True get separate slots.
+        key = (type(value), value)
+        if key not in self.const_indexes:
+            self.const_indexes[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_indexes[key]
+
+    def name_index(self, name):
+        if name not in self.name_indexes:
+            self.name_indexes[name] = len(self.names)
+            self.names.append(name)
+        return self.name_indexes[name]
+
+    def build(self):
+        return CodeObject(self.name, array('i', self.ops), tuple(self.consts),
+                          tuple(self.names), tuple(self.calls), tuple(self.varnames))
+
+
+class Compiler:
+    def __init__(self, types=None, checkpoints=False, limits=None):
+        # Expression types from a clean type check, or None.
+        self.types = types
+        # Whether loop passes and function calls get a CHECKPOINT, for
+        # code run in sessions or under limits (see limits.py).
+        self.checkpoints = checkpoints or limits is not None
+        self.limits = limits
+        self.builtins = limits.builtins if limits is not None else BUILTINS
+        # The operators whose strings get checked, or None.
+        self.string_ops = limits.string_ops if limits is not None else None
+        self.resolution = None
+        # Enclosing loops, innermost last.
+        self.loops = []
+        # Expression hoisted out of an enclosing loop -> its HoistedValues.
+        self.hoisted = {}
+        # Assignments appending to string accumulators of enclosing loops.
+        self.accumulating = set()
+        self.function_reads = set()
+
+    def compile_program(self, ast):
+        self.resolution = Resolver().resolve(ast)
+        statements = []
+        for node in ast:
+            statements.extend(node if isinstance(node, list) else [node])
+        self.function_reads = function_reads(statements)
+        builder = CodeBuilder('<main>')
+        for node in statements:
+            self.compile_statement(builder, node)
+        builder.emit(HALT)
+        return builder.build()
+
+    def compile_function(self, node):
+        builder = CodeBuilder(node.name)
+        builder.varnames = self.resolution.frames[node].names()
+        if self.checkpoints:
+            builder.emit(CHECKPOINT)
+        if node.body:
+            self.compile_function_sequence(builder, node.body, True, True)
+        else:
+            builder.emit(LOAD_CONST, builder.const(None))
+        builder.emit(RETURN)
+        return FunctionCode(node.name, tuple(node.params), builder.build(), summarize(node))
+
+    def compile_block(self, builder, stmts):
+        for stmt in stmts:
+            self.compile_statement(builder, stmt)
+
+    # Top-level code: mirrors Interpreter.eval_node.
+    def compile_statement(self, builder, node):
+        if isinstance(node, PutsStatement):
+            self.compile_expression(builder, node.expr, False)
+            builder.emit(PRINT)
+        elif isinstance(node, FunctionSignature):
+            # Signatures are metadata; ignore at runtime
+            pass
+        elif isinstance(node, FunctionDefinition):
+            builder.emit(DEFINE_FUNCTION, builder.const(self.compile_function(node)))
+        elif isinstance(node, VariableAssignment) and node in self.accumulating:
+            builder.emit(LOAD_BUILDER, builder.name_index(node.name))
+            operands = concat_operands(node.value, self.hoisted)[1:]
+            for operand in operands:
+                self.compile_expression(builder, operand, False)
+            builder.emit(APPEND_STRING, len(operands))
+        elif isinstance(node, VariableAssignment):
+            self.compile_expression(builder, node.value, False)
+            if node.is_declaration:
+                self.compile_cast(builder, typed_cast(node.type_annotation, node.value, self.types))
+                builder.emit(STORE_GLOBAL, builder.name_index(node.name))
+            else:
+                builder.emit(ASSIGN_GLOBAL, builder.name_index(node.name))
+        elif isinstance(node, IfElseStatement):
+            self.compile_expression(builder, node.condition, False)
+            to_else = builder.emit(JUMP_IF_FALSE)
+            self.compile_block(builder, node.then_block)
+            to_end = builder.emit(JUMP)
+            builder.patch(to_else)
+            self.compile_block(builder, node.else_block)
+            builder.patch(to_end)
+        elif isinstance(node, IfChain):
+            to_end = []
+            for condition, block in node.branches:
+                self.compile_expression(builder, condition, False)
+                to_next = builder.emit(JUMP_IF_FALSE)
+                self.compile_block(builder, block)
+                to_end.append(builder.emit(JUMP))
+                builder.patch(to_next)
+            self.compile_block(builder, node.else_block)
+            for index in to_end:
+                builder.patch(index)
+        elif isinstance(node, CheckStatement):
+            self.compile_check(builder, node, False)
+        elif isinstance(node, LoopNode):
+            self.compile_loop(builder, node)
+        elif isinstance(node, BreakStatement):
+            if not self.loops:
+                builder.emit(RAISE, builder.const(str(BREAK.outside_loop())))
+                return
+            loop = self.loops[-1]
+            if loop.has_counter:
+                builder.emit(POP)
+            loop.breaks.append(builder.emit(JUMP))
+        elif isinstance(node, ContinueStatement):
+            if not self.loops:
+                builder.emit(RAISE, builder.const(str(CONTINUE.outside_loop())))
+                return
+            builder.emit(JUMP, self.loops[-1].start)
+        elif isinstance(node, (Constant, NumberLiteral, StringLiteral, BooleanLiteral, Identifier, UnaryOp,
+                               BinaryOp, FunctionCall, InputCall, EndOfInput, int, float, str)):
+            self.compile_expression(builder, node, False)
+            builder.emit(POP)
+        else:
+            builder.emit(RAISE, builder.const(f"Unknown AST node: {node}"))
+
+    def compile_function_sequence(self, builder, stmts, want_value, tail):
+        # The value of a sequence is that of its last statement.
+        if not stmts:
+            if want_value:
+                builder.emit(LOAD_CONST, builder.const(None))
+            return
+        for stmt in stmts[:-1]:
+            self.compile_function_statement(builder, stmt, False)
+        self.compile_function_statement(builder, stmts[-1], want_value, tail)
+
+    # Function bodies: mirrors Interpreter.eval_function_body. When
+    # want_value is set the statement leaves its value on the stack; when
+    # tail is set that value is the function's result, so a call there can
+    # reuse the caller's frame.
+    def compile_function_statement(self, builder, node, want_value, tail=False):
+        if isinstance(node, VariableAssignment):
+            self.compile_expression(builder, node.value, True)
+            self.compile_cast(builder, typed_cast(node.type_annotation, node.value, self.types))
+            if want_value:
+                builder.emit(DUP)
+            builder.emit(STORE_LOCAL, self.resolution.bindings[node].slot)
+            return
+        elif isinstance(node, PutsStatement):
+            self.compile_expression(builder, node.expr, True)
+            builder.emit(PRINT)
+        elif isinstance(node, CheckStatement):
+            self.compile_check(builder, node, True, want_value, tail)
+            return
+        elif isinstance(node, FunctionCall) and tail:
+            self.compile_call(builder, node, True, TAIL_CALL)
+            return
+        elif isinstance(node, (Constant, NumberLiteral, StringLiteral, Identifier, UnaryOp, BinaryOp,
+                               FunctionCall, InputCall, EndOfInput, int, float, str)):
+            self.compile_expression(builder, node, True)
+            if not want_value:
+                builder.emit(POP)
+            return
+        else:
+            builder.emit(RAISE, builder.const(f"Unsupported node in function body: {node}"))
+        if want_value:
+            builder.emit(LOAD_CONST, builder.const(None))
+
+    def compile_expression(self, builder, node, in_function):
+        if isinstance(node, Constant):
+            builder.emit(LOAD_CONST, builder.const(node.value))
+        elif isinstance(node, NumberLiteral):
+            builder.emit(LOAD_CONST, builder.const(node.value))
+        elif isinstance(node, StringLiteral):
+            builder.emit(LOAD_CONST, builder.const(node.value.strip('"')))
+        elif isinstance(node, BooleanLiteral) and not in_function:
+            builder.emit(LOAD_CONST, builder.const(node.value))
+        elif isinstance(node, Identifier) and not in_function:
+            builder.emit(LOAD_GLOBAL, builder.name_index(node.name))
+        elif isinstance(node, Identifier):
+            scope, slot, name = self.resolution.bindings[node]
+            if scope == LOCAL:
+                builder.emit(LOAD_LOCAL, slot)
+            elif scope == GLOBAL:
+                builder.emit(LOAD_NAME, builder.name_index(name))
+            else:
+                builder.emit(LOAD_LOCAL_OR_GLOBAL, slot)
+        elif isinstance(node, (UnaryOp, BinaryOp)):
+            if node in self.hoisted:
+                self.compile_hoisted(builder, node, in_function)
+            else:
+                self.compile_operation(builder, node, in_function)
+        elif isinstance(node, FunctionCall):
+            self.compile_call(builder, node, in_function, CALL)
+        elif isinstance(node, InputCall):
+            builder.emit(INPUT)
+        elif isinstance(node, EndOfInput):
+            builder.emit(AT_EOF)
+        elif isinstance(node, (int, float, str)):
+            builder.emit(LOAD_CONST, builder.const(node))
+        elif in_function:
+            builder.emit(RAISE, builder.const(f"Unsupported node in function body: {node}"))
+        else:
+            builder.emit(RAISE, builder.const(f"Unknown AST node: {node}"))
+
+    def compile_operation(self, builder, node, in_function):
+        if isinstance(node, UnaryOp):
+            self.compile_expression(builder, node.expr, in_function)
+            if node.op == 'not':
+                builder.emit(UNARY_NOT)
+            else:
+                builder.emit(RAISE, builder.const(f"Unsupported unary operator: {node.op}"))
+            return
+        if node.op == '++':
+            operands = concat_operands(node, self.hoisted)
+            if len(operands) > 2:
+                for operand in operands:
+                    self.compile_expression(builder, operand, in_function)
+                builder.emit(BUILD_STRING, len(operands))
+                if self.string_ops is not None:
+                    builder.emit(CHECK_STRING)
+                return
+        self.compile_expression(builder, node.left, in_function)
+        self.compile_expression(builder, node.right, in_function)
+        op = typed_binary_op(node, self.types)
+        if op in BINARY_OPS:
+            checked = self.string_ops is not None and op in self.string_ops and can_make_string(node, self.types)
+            builder.emit(BINARY_OP, BINARY_NAMES.index(op) + (CHECKED if checked else 0))
+        else:
+            builder.emit(RAISE, builder.const(f"Unsupported operator: {node.op}"))
+
+    def compile_call(self, builder, node, in_function, op):
+        for arg in node.args:
+            self.compile_expression(builder, arg, in_function)
+        builder.calls.append((node.name, len(node.args), self.builtins.get(node.name)))
+        builder.emit(op, len(builder.calls) - 1)
+
+    def compile_cast(self, builder, type_annotation):
+        if type_annotation == 'Int':
+            builder.emit(CAST_INT)
+        elif type_annotation == 'Double':
+            builder.emit(CAST_DOUBLE)
+        elif type_annotation in ARRAY_CASTS:
+            builder.emit(CAST_ARRAY, ARRAY_CAST_NAMES.index(type_annotation))
+
+    def compile_check(self, builder, node, in_function, want_value=False, tail=False):
+        # In a function body check is an expression: with want_value set it
+        # leaves the value of the branch taken (None when none is).
+        table = dispatch_table(node.when_branches, in_function)
+        if table is not None:
+            self.compile_check_table(builder, node, table, in_function, want_value, tail)
+            return
+        # The subject stays on the stack while the patterns are tested.
+        self.compile_expression(builder, node.subject_expr, in_function)
+        to_end = []
+        for pattern, block in node.when_branches:
+            builder.emit(DUP)
+            self.compile_expression(builder, pattern, in_function)
+            builder.emit(BINARY_OP, EQ)
+            to_next = builder.emit(JUMP_IF_FALSE)
+            builder.emit(POP)
+            self.compile_check_block(builder, block, in_function, want_value, tail)
+            to_end.append(builder.emit(JUMP))
+            builder.patch(to_next)
+        builder.emit(POP)
+        self.compile_check_block(builder, node.else_block or [], in_function, want_value, tail)
+        for index in to_end:
+            builder.patch(index)
+
+    def compile_check_table(self, builder, node, table, in_function, want_value, tail):
+        # All patterns are literals: one DISPATCH jumps straight to the branch.
+        self.compile_expression(builder, node.subject_expr, in_function)
+        dispatch = DispatchTable()
+        builder.emit(DISPATCH, builder.const(dispatch))
+        starts = []
+        to_end = []
+        for _, block in node.when_branches:
+            starts.append(builder.offset())
+            self.compile_check_block(builder, block, in_function, want_value, tail)
+            to_end.append(builder.emit(JUMP))
+        dispatch.default = builder.offset()
+        self.compile_check_block(builder, node.else_block or [], in_function, want_value, tail)
+        for index in to_end:
+            builder.patch(index)
+        dispatch.targets = {value: starts[index] for value, index in table.items()}
+
+    def compile_check_block(self, builder, block, in_function, want_value=False, tail=False):
+        if in_function:
+            self.compile_function_sequence(builder, block, want_value, tail)
+        else:
+            for stmt in block:
+                self.compile_statement(builder, stmt)
+
+    def compile_loop(self, builder, node):
+        # Accumulators no enclosing loop builds are built by this one.
+        accumulators = []
+        for name, assignments in string_accumulators(node, self.function_reads).items():
+            if assignments[0] not in self.accumulating:
+                self.accumulating.update(assignments)
+                accumulators.append(name)
+        invariants = loop_invariants(node, self.hoisted)
+        if invariants:
+            hoisted = HoistedValues()
+            for expr in invariants:
+                self.hoisted[expr] = hoisted
+            builder.emit(CLEAR_HOISTED, builder.const(hoisted))
+        if node.loop_type == 'infinite':
+            start = builder.offset()
+            loop = self.compile_loop_body(builder, node, start)
+            builder.emit(JUMP, start)
+        elif node.loop_type == 'times':
+            count = node.condition_or_count
+            if isinstance(count, Constant) and isinstance(count.value, (int, float)):
+                builder.emit(LOAD_CONST, builder.const(int(count.value)))
+            else:
+                self.compile_expression(builder, count, False)
+                builder.emit(TO_COUNT)
+            start = builder.emit(COUNT_DOWN)
+            loop = self.compile_loop_body(builder, node, start)
+            builder.emit(JUMP, start)
+            builder.patch(start)
+        elif node.loop_type == 'until':
+            start = builder.offset()
+            self.compile_expression(builder, node.condition_or_count, False)
+            to_end = builder.emit(JUMP_IF_TRUE)
+            loop = self.compile_loop_body(builder, node, start)
+            builder.emit(JUMP, start)
+            builder.patch(to_end)
+        else:
+            return
+        for index in loop.breaks:
+            builder.patch(index)
+        for name in accumulators:
+            builder.emit(FINISH_STRING, builder.name_index(name))
+
+    def compile_loop_body(self, builder, node, start):
+        loop = Loop(node, start)
+        self.loops.append(loop)
+        if self.checkpoints:
+            builder.emit(CHECKPOINT)
+        self.compile_block(builder, node.body)
+        self.loops.pop()
+        return loop
+
+    def compile_hoisted(self, builder, node, in_function):
+        # A hoisted expression's code only runs while its value is unset.
+        hoisted = self.hoisted[node]
+        skip = builder.emit(LOAD_HOISTED)
+        self.compile_operation(builder, node, in_function)
+        store = builder.emit(STORE_HOISTED)
+        builder.patch(skip)
+        builder.patch(store)
+        hoisted.keys.append(builder.offset())
+
+
+def disassemble(code, indent=''):
+    lines = []
+    ops = code.ops
+    for pc in range(0, len(ops), 2):
+        op, arg = ops[pc], ops[pc + 1]
+        name = OPNAMES[op]
+        if op in (LOAD_CONST, RAISE, DISPATCH):
+            detail = repr(code.consts[arg])
+        elif op == DEFINE_FUNCTION:
+            detail = code.consts[arg].name
+        elif op == CLEAR_HOISTED:
+            detail = repr(code.consts[arg])
+        elif op == STORE_HOISTED:
+            detail = f"[{arg}]"
+        elif op in (BUILD_STRING, APPEND_STRING):
+            detail = str(arg)
+        elif op in (LOAD_NAME, LOAD_GLOBAL, STORE_GLOBAL, ASSIGN_GLOBAL, LOAD_BUILDER, FINISH_STRING):
+            detail = code.names[arg]
+        elif op in (LOAD_LOCAL, LOAD_LOCAL_OR_GLOBAL, STORE_LOCAL):
+            detail = f"{arg} ({code.varnames[arg]})"
+        elif op == BINARY_OP:
+            detail = BINARY_NAMES[arg] if arg < CHECKED else f"{BINARY_NAMES[arg - CHECKED]} (checked)"
+        elif op == CAST_ARRAY:
+            detail = ARRAY_CAST_NAMES[arg]
+        elif op in (CALL, TAIL_CALL):
+            detail = f"{code.calls[arg][0]}/{code.calls[arg][1]}"
+        elif op in (JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, COUNT_DOWN, LOAD_HOISTED):
+            detail = f"-> {arg}"
+        else:
+            detail = ''
+        lines.append(f"{indent}{pc:>5} {name:<16}{detail}")
+        if op == DEFINE_FUNCTION:
+            function = code.consts[arg]
+            lines.append(f"{indent}      {function.name} {' '.join(function.params)}:")
+            lines.append(disassemble(function.code, indent + '      '))
+    return '\n'.join(lines)
@@ -0,0 +1,714 @@
+# closure_compiler.py
+# Compiles the parsed AST into a tree of pre-bound Python closures, so that
+# node types and operators are resolved once instead of on every evaluation.
+from itertools import repeat
+
+from arrays import ARRAY_CASTS
+from ast_nodes import *
+from interpreter import Environment
+from limits import Meter, ResourceLimitExceeded
+from memo import MISSING, Memoizer, cache_key, summarize
+from loops import function_reads, has_jumps, loop_invariants, string_accumulators
+from runtime import (BINARY_OPS, BREAK, BUILTINS, CONTINUE, StringBuilder, concat_operands, dispatch,
+                     dispatch_table)
+from streams import BufferedSink, BufferedSource
+from resolver import GLOBAL, LOCAL, Resolver
+from typechecker import can_make_string, is_int_arithmetic, typed_binary_op, typed_cast
+
+
+# Function frames are lists indexed by the slots the resolver assigned;
+# locals not yet assigned hold _UNSET.
+_UNSET = object()
+
+# Type annotation -> the conversion a declaration with it applies.
+CASTS = {'Int': int, 'Double': float, **ARRAY_CASTS}
+
+
+class CompiledFunction:
+    def __init__(self, name, params, body, padding=()):
+        self.name = name
+        self.params = params
+        self.body = body
+        # Appended to the argument list to make up the rest of the frame.
+        self.padding = padding
+
+
+def _constant(value):
+    def constant(local_env):
+        return value
+    return constant
+
+
+def _fail(message):
+    def fail(local_env):
+        raise RuntimeError(message)
+    return fail
+
+
+class ClosureCompiler:
+    def __init__(self, env, memoizer, output, input_source, types=None, meter=None):
+        self.env = env
+        self.memoizer = memoizer
+        self.output = output
+        self.input_source = input_source
+        # Expression types from a clean type check, or None.
+        self.types = types
+        # The Meter the compiled code counts its steps on, and its Limits
+        # (see limits.py); None for none.
+        self.meter = meter
+        self.limits = meter.limits if meter is not None else None
+        self.builtins = self.limits.builtins if meter is not None else BUILTINS
+        self.binary_ops = self.limits.binary_ops if meter is not None else BINARY_OPS
+        self.resolution = None
+        # Loops enclosing the code being compiled.
+        self.loop_depth = 0
+        # Expression hoisted out of an enclosing loop -> (cells, index): its
+        # value once computed is kept in cells[index].
+        self.hoisted = {}
+        # Assignment appending to a string accumulator of an enclosing loop
+        # -> its StringBuilder (see loops.py).
+        self.accumulating = {}
+        self.function_reads = set()
+
+    def compile_program(self, ast):
+        self.resolution = Resolver().resolve(ast)
+        statements = []
+        for node in ast:
+            statements.extend(node if isinstance(node, list) else [node])
+        self.function_reads = function_reads(statements)
+        stmts = tuple(self.compile_node(node) for node in statements)
+
+        def program():
+            for stmt in stmts:
+                stmt(None)
+        return program
+
+    def compile_block(self, stmts):
+        fns = tuple(self.compile_node(stmt) for stmt in stmts)
+        if self.loop_depth and has_jumps(stmts):
+            # Stops at a break or continue and returns it to the loop.
+            def jumping_block(local_env):
+                for fn in fns:
+                    signal = fn(local_env)
+                    if signal is BREAK or signal is CONTINUE:
+                        return signal
+                return None
+            return jumping_block
+
+        def block(local_env):
+            for fn in fns:
+                fn(local_env)
+        return block
+
+    def compile_node(self, node):
+        # Mirrors Interpreter.eval_node for top-level code.
+        if isinstance(node, Constant):
+            return _constant(node.value)
+        elif isinstance(node, NumberLiteral):
+            return _constant(node.value)
+        elif isinstance(node, StringLiteral):
+            return _constant(node.value.strip('"'))
+        elif isinstance(node, BooleanLiteral):
+            return _constant(node.value)
+        elif isinstance(node, PutsStatement):
+            return self.compile_puts(self.compile_node(node.expr))
+        elif isinstance(node, FunctionSignature):
+            # Signatures are metadata; ignore at runtime
+            return _constant(None)
+        elif isinstance(node, FunctionDefinition):
+            return self.compile_function_definition(node)
+        elif isinstance(node, VariableAssignment):
+            return self.compile_global_assignment(node)
+        elif isinstance(node, Identifier):
+            return self.compile_global_load(node.name)
+        elif isinstance(node, IfElseStatement):
+            condition = self.compile_node(node.condition)
+            then_block = self.compile_block(node.then_block)
+            else_block = self.compile_block(node.else_block)
+
+            def if_else(local_env):
+                if condition(local_env):
+                    return then_block(local_env)
+                return else_block(local_env)
+            return if_else
+        elif isinstance(node, IfChain):
+            branches = tuple((self.compile_node(condition), self.compile_block(block))
+                             for condition, block in node.branches)
+            else_block = self.compile_block(node.else_block)
+
+            def if_chain(local_env):
+                for condition, block in branches:
+                    if condition(local_env):
+                        return block(local_env)
+                return else_block(local_env)
+            return if_chain
+        elif isinstance(node, CheckStatement):
+            return self.compile_check(node, self.compile_node, self.compile_block, False)
+        elif isinstance(node, LoopNode):
+            return self.compile_loop(node)
+        elif isinstance(node, (BreakStatement, ContinueStatement)):
+            signal = BREAK if isinstance(node, BreakStatement) else CONTINUE
+            if self.loop_depth:
+                return _constant(signal)
+            return _fail(str(signal.outside_loop()))
+        elif isinstance(node, UnaryOp):
+            return self.compile_hoistable(node, self.compile_unary(node, self.compile_node(node.expr)))
+        elif isinstance(node, BinaryOp):
+            if node.op == '++':
+                return self.compile_hoistable(node, self.compile_concat(node, self.compile_node))
+            return self.compile_hoistable(node, self.compile_binary(node, self.compile_node(node.left),
+                                                                    self.compile_node(node.right)))
+        elif isinstance(node, FunctionCall):
+            return self.compile_call(node, [self.compile_node(arg) for arg in node.args])
+        elif isinstance(node, InputCall):
+            return self.compile_input()
+        elif isinstance(node, EndOfInput):
+            return self.compile_eof()
+        elif isinstance(node, (int, float, str)):
+            return _constant(node)
+        else:
+            return _fail(f"Unknown AST node: {node}")
+
+    def compile_function_node(self, node):
+        # Mirrors Interpreter.eval_function_body for function bodies.
+        if isinstance(node, Constant):
+            return _constant(node.value)
+        elif isinstance(node, NumberLiteral):
+            return _constant(node.value)
+        elif isinstance(node, StringLiteral):
+            return _constant(node.value.strip('"'))
+        elif isinstance(node, VariableAssignment):
+            return self.compile_local_assignment(node)
+        elif isinstance(node, BinaryOp):
+            if node.op == '++':
+                return self.compile_concat(node, self.compile_function_node)
+            return self.compile_binary(node, self.compile_function_node(node.left),
+                                       self.compile_function_node(node.right))
+        elif isinstance(node, UnaryOp):
+            return self.compile_unary(node, self.compile_function_node(node.expr))
+        elif isinstance(node, CheckStatement):
+            return self.compile_check(node, self.compile_function_node, self.compile_function_sequence, True)
+        elif isinstance(node, InputCall):
+            return self.compile_input()
+        elif isinstance(node, EndOfInput):
+            return self.compile_eof()
+        elif isinstance(node, Identifier):
+            return self.compile_local_load(node)
+        elif isinstance(node, FunctionCall):
+            return self.compile_call(node, [self.compile_function_node(arg) for arg in node.args])
+        elif isinstance(node, PutsStatement):
+            return self.compile_puts(self.compile_function_node(node.expr))
+        elif isinstance(node, (int, float, str)):
+            return _constant(node)
+        else:
+            return _fail(f"Unsupported node in function body: {node}")
+
+    def compile_function_sequence(self, stmts):
+        fns = tuple(self.compile_function_node(stmt) for stmt in stmts)
+        if len(fns) == 1:
+            return fns[0]
+
+        def sequence(local_env):
+            result = None
+            for fn in fns:
+                result = fn(local_env)
+            return result
+        return sequence
+
+    def compile_function_definition(self, node):
+        functions = self.env.functions
+        name = node.name
+        frame = self.resolution.frames[node]
+        body = self.compile_function_sequence(node.body)
+        if self.meter is not None:
+            body = self.compile_step(body)
+        compiled = CompiledFunction(name, tuple(node.params), body, (_UNSET,) * (frame.size - len(node.params)))
+        memoizer = self.memoizer
+        summary = summarize(node)
+
+        def define(local_env):
+            functions[name] = compiled
+            memoizer.define(summary)
+        return define
+
+    def compile_puts(self, expr):
+        write = self.output.write
+
+        def puts(local_env):
+            write(expr(local_env))
+        return puts
+
+    def compile_input(self):
+        before_input = self.output.before_input
+        read_line = self.input_source.read_line
+
+        def get_line(local_env):
+            before_input()
+            return read_line()
+        return get_line
+
+    def compile_eof(self):
+        before_input = self.output.before_input
+        at_end = self.input_source.at_end
+
+        def eof(local_env):
+            before_input()
+            return at_end()
+        return eof
+
+    def compile_global_assignment(self, node):
+        variables = self.env.variables
+        name = node.name
+        builder = self.accumulating.get(node)
+        if builder is not None:
+            return self.compile_append(node, builder)
+        value_fn = self.compile_node(node.value)
+        if node.is_declaration:
+            cast = CASTS.get(typed_cast(node.type_annotation, node.value, self.types))
+            if cast is not None:
+
+                def declare_cast(local_env):
+                    value = variables[name] = cast(value_fn(local_env))
+                    return value
+                return declare_cast
+
+            def declare(local_env):
+                value = variables[name] = value_fn(local_env)
+                return value
+            return declare
+
+        def assign(local_env):
+            value = value_fn(local_env)
+            if name not in variables:
+                raise RuntimeError(f"Variable '{name}' used before declaration")
+            variables[name] = value
+            return value
+        return assign
+
+    def compile_append(self, node, builder):
+        # `name = name ++ ...` in a loop building name: the new pieces go to
+        # the builder.
+        variables = self.env.variables
+        operands = tuple(self.compile_node(operand) for operand in concat_operands(node.value, self.hoisted)[1:])
+        if len(operands) == 1:
+            only, = operands
+
+            def append(local_env):
+                parts = builder.parts
+                if parts is None:
+                    parts = builder.start(variables)
+                parts.append(str(only(local_env)))
+            return append
+
+        def append_many(local_env):
+            parts = builder.parts
+            if parts is None:
+                parts = builder.start(variables)
+            parts.extend([str(operand(local_env)) for operand in operands])
+        return append_many
+
+    def compile_local_assignment(self, node):
+        slot = self.resolution.bindings[node].slot
+        cast = CASTS.get(typed_cast(node.type_annotation, node.value, self.types))
+        value_fn = self.compile_function_node(node.value)
+
+        if cast is not None:
+
+            def assign_cast(local_env):
+                value = local_env[slot] = cast(value_fn(local_env))
+                return value
+            return assign_cast
+
+        def assign(local_env):
+            value = local_env[slot] = value_fn(local_env)
+            return value
+        return assign
+
+    def compile_global_load(self, name):
+        variables = self.env.variables
+
+        def load(local_env):
+            try:
+                return variables[name]
+            except KeyError:
+                raise RuntimeError(f"Variable '{name}' used before declaration") from None
+        return load
+
+    def compile_local_load(self, node):
+        scope, slot, name = self.resolution.bindings[node]
+        variables = self.env.variables
+        if scope == LOCAL:
+            def load_local(local_env):
+                return local_env[slot]
+            return load_local
+        elif scope == GLOBAL:
+            def load_global(local_env):
+                try:
+                    return variables[name]
+                except KeyError:
+                    raise RuntimeError(f"Unknown identifier: {name}") from None
+            return load_global
+
+        def load(local_env):
+            value = local_env[slot]
+            if value is not _UNSET:
+                return value
+            elif name in variables:
+                return variables[name]
+            raise RuntimeError(f"Unknown identifier: {name}")
+        return load
+
+    def compile_check(self, node, compile_expr, compile_block, in_function):
+        subject_fn = compile_expr(node.subject_expr)
+        branches = tuple((compile_expr(pattern), compile_block(block))
+                         for pattern, block in node.when_branches)
+        else_block = compile_block(node.else_block) if node.else_block else None
+
+        table = dispatch_table(node.when_branches, in_function)
+        if table is not None:
+            # All patterns are literals: select the branch by hashing.
+            blocks = {value: branches[index][1] for value, index in table.items()}
+
+            def check_table(local_env):
+                block = dispatch(blocks, subject_fn(local_env), else_block)
+                if block is not None:
+                    return block(local_env)
+                return None
+            return check_table
+
+        def check(local_env):
+            subject = subject_fn(local_env)
+            for pattern, block in branches:
+                if subject == pattern(local_env):
+                    return block(local_env)
+            if else_block is not None:
+                return else_block(local_env)
+            return None
+        return check
+
+    def compile_loop(self, node):
+        # Accumulators that no enclosing loop is building are built by this
+        # one, and stored as it exits.
+        builders = []
+        for name, assignments in string_accumulators(node, self.function_reads).items():
+            if assignments[0] not in self.accumulating:
+                builder = StringBuilder(name, self.limits)
+                self.accumulating.update((assignment, builder) for assignment in assignments)
+                builders.append(builder)
+        loop = self.compile_loop_kind(node)
+        if not builders:
+            return loop
+        variables = self.env.variables
+
+        def accumulating_loop(local_env):
+            try:
+                return loop(local_env)
+            finally:
+                for builder in builders:
+                    builder.finish(variables)
+        return accumulating_loop
+
+    def compile_loop_kind(self, node):
+        # The loop's invariant expressions get a cell each, cleared on entry.
+        invariants = loop_invariants(node, self.hoisted)
+        cells = [None] * len(invariants)
+        unset = tuple(cells)
+        for index, expr in enumerate(invariants):
+            self.hoisted[expr] = (cells, index)
+        count = node.condition_or_count
+        if node.loop_type == 'times' and isinstance(count, Constant) and isinstance(count.value, (int, float)):
+            return self.compile_constant_times(node, int(count.value), cells, unset)
+
+        count_fn = self.compile_node(count) if node.loop_type in ('times', 'until') else None
+        self.loop_depth += 1
+        body = self.compile_block(node.body)
+        self.loop_depth -= 1
+        if self.meter is not None:
+            return self.compile_metered_loop(node.loop_type, count_fn, body, cells, unset)
+        jumps = has_jumps(node.body)
+        if node.loop_type == 'infinite':
+            def loop_infinite(local_env):
+                cells[:] = unset
+                while True:
+                    if body(local_env) is BREAK:
+                        break
+            return loop_infinite
+        elif node.loop_type == 'times':
+            if not jumps:
+                def loop_times(local_env):
+                    cells[:] = unset
+                    for _ in range(int(count_fn(local_env))):
+                        body(local_env)
+                return loop_times
+
+            def loop_times_jumping(local_env):
+                cells[:] = unset
+                for _ in range(int(count_fn(local_env))):
+                    if body(local_env) is BREAK:
+                        break
+            return loop_times_jumping
+        elif node.loop_type == 'until':
+            condition = count_fn
+
+            def loop_until(local_env):
+                cells[:] = unset
+                while not condition(local_env):
+                    if body(local_env) is BREAK:
+                        break
+            return loop_until
+        return _constant(None)
+
+    def compile_constant_times(self, node, count, cells, unset):
+        # `loop N times` with N known: the body statements are bound into
+        # the loop itself rather than run through a block closure.
+        self.loop_depth += 1
+        fns = tuple(self.compile_node(stmt) for stmt in node.body)
+        self.loop_depth -= 1
+        iterations = range(count)
+        if self.meter is not None:
+            return self.compile_metered_passes(lambda local_env: iterations, fns, cells, unset)
+        if has_jumps(node.body):
+            def loop_jumping(local_env):
+                cells[:] = unset
+                for _ in iterations:
+                    for fn in fns:
+                        signal = fn(local_env)
+                        if signal is BREAK:
+                            return None
+                        if signal is CONTINUE:
+                            break
+            return loop_jumping
+        if not fns:
+            return _constant(None)
+        if len(fns) == 1:
+            only, = fns
+
+            def loop_one(local_env):
+                cells[:] = unset
+                for _ in iterations:
+                    only(local_env)
+            return loop_one
+        if len(fns) == 2:
+            first, second = fns
+
+            def loop_two(local_env):
+                cells[:] = unset
+                for _ in iterations:
+                    first(local_env)
+                    second(local_env)
+            return loop_two
+
+        def loop_many(local_env):
+            cells[:] = unset
+            for _ in iterations:
+                for fn in fns:
+                    fn(local_env)
+        return loop_many
+
+    def compile_metered_loop(self, loop_type, count_fn, body, cells, unset):
+        # The loops of compile_loop_kind, counting every pass as a step on
+        # the meter.
+        if loop_type == 'until':
+            meter = self.meter
+
+            def loop_until_metered(local_env):
+                cells[:] = unset
+                while not count_fn(local_env):
+                    meter.left -= 1
+                    if not meter.left:
+                        meter.left = meter.charge()
+                    if body(local_env) is BREAK:
+                        break
+            return loop_until_metered
+        if loop_type == 'times':
+            return self.compile_metered_passes(lambda local_env: range(int(count_fn(local_env))), (body,), cells,
+                                               unset)
+        return self.compile_metered_passes(lambda local_env: repeat(None), (body,), cells, unset)
+
+    def compile_metered_passes(self, passes, fns, cells, unset):
+        # Runs fns once for each item of passes(local_env), counting every
+        # pass as a step on the meter.
+        meter = self.meter
+
+        def loop_metered(local_env):
+            cells[:] = unset
+            for _ in passes(local_env):
+                meter.left -= 1
+                if not meter.left:
+                    meter.left = meter.charge()
+                for fn in fns:
+                    signal = fn(local_env)
+                    if signal is BREAK:
+                        return None
+                    if signal is CONTINUE:
+                        break
+        return loop_metered
+
+    def compile_step(self, fn):
+        # The function body fn, counting a step on the meter each time it
+        # runs.
+        meter = self.meter
+
+        def step(local_env):
+            meter.left -= 1
+            if not meter.left:
+                meter.left = meter.charge()
+            return fn(local_env)
+        return step
+
+    def compile_hoistable(self, node, expr):
+        # An expression hoisted out of a loop is computed once per entry to
+        # it; see loops.py.
+        hoisted = self.hoisted.get(node)
+        if hoisted is None:
+            return expr
+        cells, index = hoisted
+
+        def cached(local_env):
+            value = cells[index]
+            if value is None:
+                value = cells[index] = expr(local_env)
+            return value
+        return cached
+
+    def compile_unary(self, node, expr):
+        if node.op == 'not':
+            return lambda local_env: not expr(local_env)
+
+        def unsupported(local_env):
+            expr(local_env)
+            raise RuntimeError(f"Unsupported unary operator: {node.op}")
+        return unsupported
+
+    def compile_concat(self, node, compile_expr):
+        # A chain of ++ is joined in one go.
+        operands = concat_operands(node, self.hoisted)
+        if len(operands) == 2:
+            return self.compile_binary(node, compile_expr(node.left), compile_expr(node.right))
+        operands = tuple(compile_expr(operand) for operand in operands)
+        if self.limits is not None and self.limits.string_length is not None:
+            check_string = self.limits.check_string
+
+            def checked_concat(local_env):
+                return check_string(''.join([str(operand(local_env)) for operand in operands]))
+            return checked_concat
+
+        def concat(local_env):
+            return ''.join([str(operand(local_env)) for operand in operands])
+        return concat
+
+    def compile_binary(self, node, left, right):
+        if is_int_arithmetic(node, self.types):
+            return self.compile_int_arithmetic(node.op, left, right)
+        ops = self.binary_ops if can_make_string(node, self.types) else BINARY_OPS
+        op = ops.get(typed_binary_op(node, self.types))
+        if op is None:
+            def unsupported(local_env):
+                left(local_env)
+                right(local_env)
+                raise RuntimeError(f"Unsupported operator: {node.op}")
+            return unsupported
+
+        def binary(local_env):
+            return op(left(local_env), right(local_env))
+        return binary
+
+    def compile_int_arithmetic(self, op, left, right):
+        # Both operands are ints, so the operator can be inlined instead of
+        # called through the operator table.
+        if op == '+':
+            def add(local_env):
+                return left(local_env) + right(local_env)
+            return add
+        if op == '-':
+            def sub(local_env):
+                return left(local_env) - right(local_env)
+            return sub
+
+        def mul(local_env):
+            return left(local_env) * right(local_env)
+        return mul
+
+    def compile_call(self, node, arg_fns):
+        name = node.name
+        arg_fns = tuple(arg_fns)
+        builtin = self.builtins.get(name)
+        if builtin is not None:
+            def call_builtin(local_env):
+                return builtin([arg(local_env) for arg in arg_fns])
+            return call_builtin
+
+        functions = self.env.functions
+        caches = self.memoizer.caches
+        argc = len(arg_fns)
+
+        def call(local_env):
+            args = [arg(local_env) for arg in arg_fns]
+            func = functions.get(name)
+            if func is None:
+                raise RuntimeError(f"Function not found: {name}")
+            if argc != len(func.params):
+                raise RuntimeError(f"Argument count mismatch for {name}")
+            cache = caches.get(name)
+            if cache is not None:
+                key = cache_key(args)
+                value = cache.get(key)
+                if value is MISSING:
+                    value = cache.store(key, func.body(args + list(func.padding)))
+                return value
+            if func.padding:
+                args += func.padding
+            return func.body(args)
+        return call
+
+
+class ClosureInterpreter:
+    def __init__(self, ast, memoizer=None, output=None, input_source=None, types=None, limits=None):
+        self.ast = ast
+        self.types = types
+        self.meter = Meter(limits) if limits is not None else None
+        self.builtins = limits.builtins if limits is not None else BUILTINS
+        self.env = Environment()
+        self.memoizer = memoizer if memoizer is not None else Memoizer()
+        self.output = output if output is not None else BufferedSink()
+        self.input_source = input_source if input_source is not None else BufferedSource()
+        self.program = None
+
+    def compile(self):
+        self.program = ClosureCompiler(self.env, self.memoizer, self.output, self.input_source,
+                                       self.types, self.meter).compile_program(self.ast)
+        return self.program
+
+    def interpret(self):
+        if self.program is None:
+            self.compile()
+        if self.meter is not None:
+            self.meter.start()
+        try:
+            self.program()
+        except ResourceLimitExceeded as e:
+            self.meter.record(e)
+            raise
+        finally:
+            self.output.flush()
+
+    def call_function(self, name, args):
+        # Calls a Belasova function from Python, once interpret() has run
+        # its definition.
+        builtin = self.builtins.get(name)
+        if builtin is not None:
+            return builtin(list(args))
+        func = self.env.functions.get(name)
+        if func is None:
+            raise RuntimeError(f"Function not found: {name}")
+        if len(args) != len(func.params):
+            raise RuntimeError(f"Argument count mismatch for {name}")
+        frame = list(args) + list(func.padding)
+        cache = self.memoizer.caches.get(name)
+        if cache is not None:
+            key = cache_key(args)
+            value = cache.get(key)
+            if value is MISSING:
+                value = cache.store(key, func.body(frame))
+            return value
+        return func.body(frame)
@@ -0,0 +1,21 @@
+# engines.py
+# Registry of the interchangeable execution engines.
+from interpreter import Interpreter
+from closure_compiler import ClosureInterpreter
+from vm import VMInterpreter
+from transpiler import PythonInterpreter
+
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'vm': VMInterpreter,
+    'python': PythonInterpreter,
+}
+
+DEFAULT_ENGINE = 'tree'
+
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise RuntimeError(f"Unknown engine: {name} (choose from {', '.join(ENGINES)})")
+    return ENGINES[name]
@@ -0,0 +1,310 @@
+# incremental.py
+# Incremental front end for editors and REPLs that reparse a buffer after
+# every edit. It keeps the previous parse, and after an edit re-lexes only
+# the lines that changed and reparses only the top-level statements they
+# touch; every other statement's AST is reused.
+#
+#   front = IncrementalParser(text)
+#   front.replace_lines(10, 11, ['let x :: Int = 2'])   # like lines[10:11] = ...
+#   front.update(new_text)                               # or diff a new buffer
+#   front.ast()                                          # what Parser.parse gives
+#
+# No token spans a line unless a string literal does, so each line's tokens
+# depend on that line alone and are kept per line. A buffer holding a
+# string across lines is tokenized and parsed whole after every edit.
+#
+# Top-level statements are kept in groups: a group is one statement, or
+# several that share a line, with the lines its tokens start and end on.
+# Top-level parsing keeps no state between statements, so a statement
+# parses the same wherever the tokens from its start onward are the same.
+# After an edit, parsing restarts at the group before it (whose end may
+# depend on what follows) and stops at the first old group past the edit
+# that a new statement starts exactly on; the groups from there are reused.
+#
+# A syntax error leaves the lines it could not parse dirty: the error is
+# raised, and the next edit reparses them along with its own.
+from operator import attrgetter
+
+from ast_nodes import *
+from belasova_parser import Parser, StreamingParser
+from tokenizer import Token, tokenize
+
+# The parser looks at most this many tokens ahead.
+LOOKAHEAD = 2
+
+
+class Group:
+    __slots__ = ('start', 'end', 'nodes', 'statements')
+
+    def __init__(self, start, end, nodes):
+        # Indexes of the first and last line holding the group's tokens.
+        self.start = start
+        self.end = end
+        self.nodes = nodes
+        # Every node in the group with a line, for moving them.
+        self.statements = _statements(nodes, [])
+
+    def add(self, end, nodes):
+        self.end = end
+        self.nodes.extend(nodes)
+        _statements(nodes, self.statements)
+
+    def shift(self, delta):
+        self.start += delta
+        self.end += delta
+        for node in self.statements:
+            node.line += delta
+
+
+_START = attrgetter('start')
+_END = attrgetter('end')
+
+
+def _search(groups, line, key):
+    # Index of the first group whose key is at least line.
+    low, high = 0, len(groups)
+    while low < high:
+        middle = (low + high) // 2
+        if key(groups[middle]) < line:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class UpdateStats:
+    def __init__(self):
+        self.lines_lexed = 0
+        self.statements_parsed = 0
+        self.groups_reused = 0
+        self.full = False
+
+    def __str__(self):
+        kind = 'full' if self.full else 'incremental'
+        return (f"{kind}: {self.lines_lexed} lines lexed, {self.statements_parsed} statements parsed, "
+                f"{self.groups_reused} groups reused")
+
+
+# Group parsers know the line of the last token consumed, where a statement
+# ends: one over a whole token list, one over tokens generated from a line on.
+class _ListGroupParser(Parser):
+    @property
+    def last_line(self):
+        return self.tokens[self.pos - 1][2] if self.pos else None
+
+
+class _StreamGroupParser(StreamingParser):
+    def __init__(self, tokens):
+        StreamingParser.__init__(self, tokens)
+        self.last_line = None
+
+    def advance(self):
+        self.last_line = self.lookahead.popleft()[2]
+
+
+def _lex_lines(lines):
+    # The tokens of lines, and each line's tokens as (kind, value) pairs,
+    # or None for those when a string spans lines.
+    tokens = tokenize('\n'.join(lines))
+    line_tokens = [[] for _ in lines]
+    for kind, value, line in tokens[:-1]:
+        if kind == 'STRING' and '\n' in value:
+            return tokens, None
+        line_tokens[line - 1].append((kind, value))
+    return tokens, line_tokens
+
+
+def _statements(nodes, found):
+    # Appends the nodes with a line to found: statements, and the
+    # statements in their blocks.
+    for node in nodes:
+        if getattr(node, 'line', None) is not None:
+            found.append(node)
+        if isinstance(node, (FunctionDefinition, LoopNode)):
+            _statements(node.body, found)
+        elif isinstance(node, IfChain):
+            for _, block in node.branches:
+                _statements(block, found)
+            _statements(node.else_block, found)
+        elif isinstance(node, IfElseStatement):
+            _statements(node.then_block, found)
+            _statements(node.else_block, found)
+        elif isinstance(node, CheckStatement):
+            for _, block in node.when_branches:
+                _statements(block, found)
+            _statements(node.else_block or [], found)
+    return found
+
+
+class IncrementalParser:
+    def __init__(self, text=''):
+        self.lines = []
+        # Per line, its tokens as (kind, value) pairs; None while a string
+        # spans lines.
+        self.line_tokens = None
+        self.groups = []
+        # [start, end) of the lines not parsed into groups yet, or None.
+        self.dirty = None
+        self.stats = UpdateStats()
+        self.set_text(text)
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def ast(self):
+        # The top-level statements, as Parser(tokenize(text)).parse() gives
+        # them. Raises while a syntax error remains.
+        if self.dirty is not None:
+            self.reparse()
+        return [node for group in self.groups for node in group.nodes]
+
+    def tokens(self):
+        # The token stream, as tokenize(text) gives it.
+        if self.line_tokens is None:
+            return tokenize(self.text())
+        return list(self.iter_tokens(0))
+
+    def iter_tokens(self, start):
+        # Tokens from line index start to the end.
+        make_token = tuple.__new__
+        line_tokens = self.line_tokens
+        for index in range(start, len(line_tokens)):
+            line = index + 1
+            for kind, value in line_tokens[index]:
+                yield make_token(Token, (kind, value, line))
+        yield Token('EOF', '', len(line_tokens))
+
+    def set_text(self, text):
+        self.lines = text.split('\n')
+        self.rebuild()
+
+    def update(self, text):
+        # Takes the whole new buffer and replaces the lines that differ.
+        lines = text.split('\n')
+        old = self.lines
+        limit = min(len(old), len(lines))
+        start = 0
+        while start < limit and old[start] == lines[start]:
+            start += 1
+        end = 0
+        while end < limit - start and old[-1 - end] == lines[-1 - end]:
+            end += 1
+        self.replace_lines(start, len(old) - end, lines[start:len(lines) - end])
+
+    def edit(self, start_line, start_column, end_line, end_column, text):
+        # Replaces the text between two (line, column) positions, both
+        # counted from 0, the way editors report changes.
+        head = self.lines[start_line][:start_column]
+        tail = self.lines[end_line][end_column:]
+        self.replace_lines(start_line, end_line + 1, (head + text + tail).split('\n'))
+
+    def replace_lines(self, start, end, new_lines):
+        # Replaces self.lines[start:end] with new_lines (without line
+        # endings), then reparses what changed.
+        new_lines = list(new_lines)
+        if not 0 <= start <= end <= len(self.lines):
+            raise RuntimeError(f"Bad line range {start}:{end} for {len(self.lines)} lines")
+        if self.line_tokens is None:
+            self.lines[start:end] = new_lines
+            return self.rebuild()
+        try:
+            lexed = _lex_lines(new_lines)[1]
+        except RuntimeError:
+            lexed = None
+        self.lines[start:end] = new_lines
+        if lexed is None:
+            # An error, or a string that may now span lines: only a whole
+            # tokenize can tell.
+            return self.rebuild()
+        self.line_tokens[start:end] = lexed
+        self.stats = UpdateStats()
+        self.stats.lines_lexed = len(new_lines)
+
+        delta = len(new_lines) - (end - start)
+        dirty_start, dirty_end = start, start + len(new_lines)
+        if self.dirty is not None:
+            old_start, old_end = self.dirty
+            dirty_start = min(dirty_start, old_start if old_start < end else old_start + delta)
+            dirty_end = max(dirty_end, old_end if old_end <= start else max(old_end + delta, start))
+        # Groups the edit touches are dropped and their lines reparsed;
+        # groups after it move with their lines.
+        groups = self.groups
+        first = _search(groups, start, _END)
+        after = _search(groups, end, _START)
+        if first < after:
+            dirty_start = min(dirty_start, groups[first].start)
+            dirty_end = max(dirty_end, groups[after - 1].end + 1 + delta)
+        if delta:
+            for group in groups[after:]:
+                group.shift(delta)
+        del groups[first:after]
+        self.dirty = (dirty_start, min(dirty_end, len(self.lines)))
+        self.reparse()
+
+    def rebuild(self):
+        # Tokenizes and parses the whole buffer.
+        self.stats = UpdateStats()
+        self.stats.full = True
+        self.stats.lines_lexed = len(self.lines)
+        self.groups = []
+        self.dirty = (0, len(self.lines))
+        self.line_tokens = None
+        tokens, self.line_tokens = _lex_lines(self.lines)
+        self.groups = self.parse_groups(_ListGroupParser(tokens), [], 0)[0]
+        self.dirty = None
+
+    def reparse(self):
+        if self.line_tokens is None:
+            return self.rebuild()
+        dirty_start, dirty_end = self.dirty
+        groups = self.groups
+        # The groups before the dirty lines stay, except the last: where a
+        # statement ends can depend on the tokens after it. So can where the
+        # one before that ends, if the last has too few tokens for the
+        # parser's lookahead.
+        restart = _search(groups, dirty_start, _START)
+        if restart:
+            restart -= 1
+            while restart > 0 and self.count_tokens(groups[restart].start, dirty_start) < LOOKAHEAD:
+                restart -= 1
+            start_line = groups[restart].start
+        else:
+            start_line = dirty_start
+        after = _search(groups, dirty_end, _START)
+        try:
+            new_groups, resumed = self.parse_groups(_StreamGroupParser(self.iter_tokens(start_line)), groups, after)
+        except RuntimeError:
+            # Nothing from the restart point to the dirty end is parsed.
+            del groups[restart:after]
+            self.dirty = (start_line, dirty_end)
+            raise
+        groups[restart:resumed] = new_groups
+        self.dirty = None
+        self.stats.groups_reused = len(groups) - len(new_groups)
+
+    def count_tokens(self, start, end):
+        return sum(len(tokens) for tokens in self.line_tokens[start:end])
+
+    def parse_groups(self, parser, old_groups, index):
+        # Parses statements into groups until the tokens run out, or a
+        # statement starts on the first line of one of old_groups from index
+        # on; returns the new groups and the index of the old group parsing
+        # stopped at (len(old_groups) at the end).
+        groups = []
+        while True:
+            token = parser.current()
+            if token[0] == 'EOF':
+                return groups, len(old_groups)
+            line = token[2] - 1
+            starts_line = parser.last_line is None or parser.last_line - 1 < line
+            while index < len(old_groups) and old_groups[index].start < line:
+                index += 1
+            if starts_line and index < len(old_groups) and old_groups[index].start == line:
+                return groups, index
+            nodes = parser.parse_function() if token[0] == 'FN' else [parser.parse_statement()]
+            self.stats.statements_parsed += 1
+            end = parser.last_line - 1
+            if groups and not starts_line:
+                groups[-1].add(end, nodes)
+            else:
+                groups.append(Group(line, end, nodes))
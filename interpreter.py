@@ -1,5 +1,12 @@
 # interpreter.py
+from arrays import ARRAY_CASTS
 from ast_nodes import *
+from limits import Meter, ResourceLimitExceeded
+from loops import function_reads, has_jumps, string_accumulators
+from memo import MISSING, Memoizer, cache_key, summarize
+from runtime import (BREAK, BUILTINS, CONTINUE, LoopSignal, StringBuilder, concat_operands, dispatch,
+                     dispatch_table, is_concat_chain)
+from streams import BufferedSink, BufferedSource
 
 class Environment:
     def __init__(self):
@@ -7,20 +14,54 @@ class Environment:
         self.variables = {}
 
 class Interpreter:
-    def __init__(self, ast):
+    def __init__(self, ast, memoizer=None, output=None, input_source=None, types=None, limits=None):
+        # types is accepted for symmetry with the other engines and ignored:
+        # this is the reference engine, so it never specializes.
         self.ast = ast
         self.env = Environment()
+        self.output = output if output is not None else BufferedSink()
+        self.input_source = input_source if input_source is not None else BufferedSource()
+        # CheckStatement -> dispatch table (None when a pattern is not a literal)
+        self.check_tables = {}
+        # LoopNode -> whether its body can break or continue
+        self.loop_jumps = {}
+        # LoopNode -> its string accumulators (see loops.py)
+        self.accumulators = {}
+        # Assignment appending to a string accumulator -> its StringBuilder,
+        # while the loop accumulating it runs
+        self.builders = {}
+        # Names the functions defined so far may read as globals
+        self.function_reads = set()
+        self.memoizer = memoizer if memoizer is not None else Memoizer()
+        # FunctionDefinition -> FunctionSummary
+        self.summaries = {}
+        # Limits (see limits.py), and the Meter counting steps against them;
+        # None for none.
+        self.limits = limits
+        self.meter = Meter(limits) if limits is not None else None
+        self.builtins = limits.builtins if limits is not None else BUILTINS
+        self.string_ops = limits.string_ops if limits is not None else None
+        self.check_string = limits.check_string if self.string_ops is not None else None
 
     def interpret(self):
-        for node in self.ast:
-            if isinstance(node, list):
-                for subnode in node:
-                    self.eval_node(subnode)
-            else:
-                self.eval_node(node)
+        if self.meter is not None:
+            self.meter.start()
+        try:
+            for node in self.ast:
+                for subnode in (node if isinstance(node, list) else [node]):
+                    signal = self.eval_node(subnode)
+                    if isinstance(signal, LoopSignal):
+                        raise signal.outside_loop()
+        except ResourceLimitExceeded as e:
+            self.meter.record(e)
+            raise
+        finally:
+            self.output.flush()
 
     def eval_node(self, node):
-        if isinstance(node, NumberLiteral):
+        if isinstance(node, Constant):
+            return node.value
+        elif isinstance(node, NumberLiteral):
             return node.value
         elif isinstance(node, StringLiteral):
             return node.value.strip('"')
@@ -28,15 +69,28 @@ class Interpreter:
             return node.value
         elif isinstance(node, PutsStatement):
             result = self.eval_node(node.expr)
-            print(result)
+            self.output.write(result)
             return None
         elif isinstance(node, FunctionSignature):
             # Signatures are metadata; ignore at runtime
             return None
         elif isinstance(node, FunctionDefinition):
             self.env.functions[node.name] = node
+            summary = self.summaries.get(node)
+            if summary is None:
+                summary = self.summaries[node] = summarize(node)
+            self.memoizer.define(summary)
+            self.function_reads |= function_reads([node])
             return None
         elif isinstance(node, VariableAssignment):
+            if self.builders:
+                builder = self.builders.get(node)
+                if builder is not None:
+                    parts = builder.parts
+                    if parts is None:
+                        parts = builder.start(self.env.variables)
+                    parts.extend([str(self.eval_node(operand)) for operand in concat_operands(node.value)[1:]])
+                    return None
             value = self.eval_node(node.value)
             if node.is_declaration:
                 # Cast to type if annotation given
@@ -44,6 +98,8 @@ class Interpreter:
                     value = int(value)
                 elif node.type_annotation == 'Double':
                     value = float(value)
+                elif node.type_annotation in ARRAY_CASTS:
+                    value = ARRAY_CASTS[node.type_annotation](value)
                 self.env.variables[node.name] = value
                 return value
             else:
@@ -58,48 +114,37 @@ class Interpreter:
                 raise RuntimeError(f"Variable '{node.name}' used before declaration")
         elif isinstance(node, IfElseStatement):
             condition = self.eval_node(node.condition)
-            if condition:
-                for stmt in node.then_block:
-                    self.eval_node(stmt)
-            else:
-                for stmt in node.else_block:
-                    self.eval_node(stmt)
-            return None
+            return self.eval_block(node.then_block if condition else node.else_block)
         elif isinstance(node, IfChain):
             for condition, then_block in node.branches:
                 if self.eval_node(condition):
-                    for stmt in then_block:
-                        self.eval_node(stmt)
-                    return None
-            for stmt in node.else_block:
-                self.eval_node(stmt)
-            return None
+                    return self.eval_block(then_block)
+            return self.eval_block(node.else_block)
         elif isinstance(node, CheckStatement):
             subject = self.eval_node(node.subject_expr)
+            table = self.check_table(node, False)
+            if table is not None:
+                index = dispatch(table, subject)
+                return self.eval_block(node.else_block if index is None else node.when_branches[index][1])
             for pattern_expr, block in node.when_branches:
                 if subject == self.eval_node(pattern_expr):
-                    for stmt in block:
-                        self.eval_node(stmt)
-                    return None
-            if node.else_block:
-                for stmt in node.else_block:
-                    self.eval_node(stmt)
-            return None
+                    return self.eval_block(block)
+            return self.eval_block(node.else_block)
         elif isinstance(node, LoopNode):
-            if node.loop_type == 'infinite':
-                while True:
-                    for stmt in node.body:
-                        self.eval_node(stmt)
-            elif node.loop_type == 'times':
-                count = int(self.eval_node(node.condition_or_count))
-                for _ in range(count):
-                    for stmt in node.body:
-                        self.eval_node(stmt)
-            elif node.loop_type == 'until':
-                while not self.eval_node(node.condition_or_count):
-                    for stmt in node.body:
-                        self.eval_node(stmt)
-            return None
+            accumulators = self.accumulators.get(node)
+            if accumulators is None:
+                accumulators = self.accumulators[node] = string_accumulators(node)
+            builders = self.start_builders(accumulators) if accumulators else None
+            if not builders:
+                return self.eval_loop(node)
+            try:
+                return self.eval_loop(node)
+            finally:
+                self.finish_builders(builders)
+        elif isinstance(node, BreakStatement):
+            return BREAK
+        elif isinstance(node, ContinueStatement):
+            return CONTINUE
         elif isinstance(node, UnaryOp):
             val = self.eval_node(node.expr)
             if node.op == 'not':
@@ -107,8 +152,13 @@ class Interpreter:
             else:
                 raise RuntimeError(f"Unsupported unary operator: {node.op}")
         elif isinstance(node, BinaryOp):
+            if node.op == '++' and is_concat_chain(node):
+                value = ''.join([str(self.eval_node(operand)) for operand in concat_operands(node)])
+                return value if self.check_string is None else self.check_string(value)
             left = self.eval_node(node.left)
             right = self.eval_node(node.right)
+            if self.string_ops is not None and node.op in self.string_ops:
+                return self.string_ops[node.op](left, right)
             if node.op == '+':
                 return left + right
             elif node.op == '-':
@@ -139,7 +189,11 @@ class Interpreter:
             args = [self.eval_node(arg) for arg in node.args]
             return self.call_function(node.name, args)
         elif isinstance(node, InputCall):
-            return input()
+            self.output.before_input()
+            return self.input_source.read_line()
+        elif isinstance(node, EndOfInput):
+            self.output.before_input()
+            return self.input_source.at_end()
         elif isinstance(node, int):
             return node
         elif isinstance(node, float):
@@ -149,31 +203,148 @@ class Interpreter:
         else:
             raise RuntimeError(f"Unknown AST node: {node}")
 
+    def eval_loop(self, node):
+        if self.meter is not None:
+            return self.eval_metered_loop(node)
+        jumps = self.loop_jumps.get(node)
+        if jumps is None:
+            jumps = self.loop_jumps[node] = has_jumps(node.body)
+        if not jumps:
+            # Nothing can leave the body early: run it statement by
+            # statement without looking for signals.
+            if node.loop_type == 'infinite':
+                while True:
+                    for stmt in node.body:
+                        self.eval_node(stmt)
+            elif node.loop_type == 'times':
+                count = int(self.eval_node(node.condition_or_count))
+                for _ in range(count):
+                    for stmt in node.body:
+                        self.eval_node(stmt)
+            elif node.loop_type == 'until':
+                while not self.eval_node(node.condition_or_count):
+                    for stmt in node.body:
+                        self.eval_node(stmt)
+        elif node.loop_type == 'infinite':
+            while True:
+                if self.eval_block(node.body) is BREAK:
+                    break
+        elif node.loop_type == 'times':
+            count = int(self.eval_node(node.condition_or_count))
+            for _ in range(count):
+                if self.eval_block(node.body) is BREAK:
+                    break
+        elif node.loop_type == 'until':
+            while not self.eval_node(node.condition_or_count):
+                if self.eval_block(node.body) is BREAK:
+                    break
+        return None
+
+    def eval_metered_loop(self, node):
+        # As eval_loop, with every pass counted as a step on the meter, by
+        # hand rather than with tick(), and eval_block inlined: both cost
+        # too much once a pass.
+        meter = self.meter
+        body = node.body or ()
+        signal = None
+        if node.loop_type == 'infinite':
+            while signal is not BREAK:
+                meter.left -= 1
+                if not meter.left:
+                    meter.left = meter.charge()
+                for stmt in body:
+                    signal = self.eval_node(stmt)
+                    if signal is BREAK or signal is CONTINUE:
+                        break
+        elif node.loop_type == 'times':
+            count = int(self.eval_node(node.condition_or_count))
+            for _ in range(count):
+                meter.left -= 1
+                if not meter.left:
+                    meter.left = meter.charge()
+                for stmt in body:
+                    signal = self.eval_node(stmt)
+                    if signal is BREAK or signal is CONTINUE:
+                        break
+                if signal is BREAK:
+                    break
+        elif node.loop_type == 'until':
+            while not self.eval_node(node.condition_or_count):
+                meter.left -= 1
+                if not meter.left:
+                    meter.left = meter.charge()
+                for stmt in body:
+                    signal = self.eval_node(stmt)
+                    if signal is BREAK or signal is CONTINUE:
+                        break
+                if signal is BREAK:
+                    break
+        return None
+
+    def start_builders(self, accumulators):
+        # Builders for the accumulators of a loop being entered, leaving out
+        # those an enclosing loop is already building and those functions
+        # may read.
+        builders = []
+        for name, assignments in accumulators.items():
+            if name in self.function_reads or assignments[0] in self.builders:
+                continue
+            builder = StringBuilder(name, self.limits)
+            for assignment in assignments:
+                self.builders[assignment] = builder
+            builders.append((builder, assignments))
+        return builders
+
+    def finish_builders(self, builders):
+        for builder, assignments in builders:
+            for assignment in assignments:
+                del self.builders[assignment]
+            builder.finish(self.env.variables)
+
+    def eval_block(self, stmts):
+        # Runs stmts until one of them breaks or continues a loop, and
+        # returns that statement's LoopSignal (None if none did).
+        for stmt in stmts or ():
+            signal = self.eval_node(stmt)
+            if signal is BREAK or signal is CONTINUE:
+                return signal
+        return None
+
+    def check_table(self, node, in_function):
+        # Built on first use, then reused every time the check runs.
+        try:
+            return self.check_tables[node]
+        except KeyError:
+            table = self.check_tables[node] = dispatch_table(node.when_branches, in_function)
+            return table
+
     def call_function(self, name, args):
-        if name == 'toInt':
-            if len(args) != 1:
-                raise RuntimeError("toInt expects exactly 1 argument")
-            try:
-                return int(args[0])
-            except Exception as e:
-                raise RuntimeError(f"toInt conversion error: {e}")
-        if name == 'toDouble':
-            if len(args) != 1:
-                raise RuntimeError("toDouble expects exactly 1 argument")
-            try:
-                return float(args[0])
-            except Exception as e:
-                raise RuntimeError(f"toDouble conversion error: {e}")
+        builtin = self.builtins.get(name)
+        if builtin is not None:
+            return builtin(args)
         if name not in self.env.functions:
             raise RuntimeError(f"Function not found: {name}")
         func = self.env.functions[name]
         if len(args) != len(func.params):
             raise RuntimeError(f"Argument count mismatch for {name}")
         local_env = dict(zip(func.params, args))
+        cache = self.memoizer.caches.get(name)
+        if cache is not None:
+            key = cache_key(args)
+            value = cache.get(key)
+            if value is MISSING:
+                if self.meter is not None:
+                    self.meter.tick()
+                value = cache.store(key, self.eval_function_body_sequence(func.body, local_env))
+            return value
+        if self.meter is not None:
+            self.meter.tick()
         return self.eval_function_body_sequence(func.body, local_env)
 
     def eval_function_body(self, node, local_env):
-        if isinstance(node, NumberLiteral):
+        if isinstance(node, Constant):
+            return node.value
+        elif isinstance(node, NumberLiteral):
             return node.value
         elif isinstance(node, StringLiteral):
             return node.value.strip('"')
@@ -183,11 +354,19 @@ class Interpreter:
                 value = int(value)
             elif node.type_annotation == 'Double':
                 value = float(value)
+            elif node.type_annotation in ARRAY_CASTS:
+                value = ARRAY_CASTS[node.type_annotation](value)
             local_env[node.name] = value
             return value
         elif isinstance(node, BinaryOp):
+            if node.op == '++' and is_concat_chain(node):
+                value = ''.join([str(self.eval_function_body(operand, local_env))
+                                 for operand in concat_operands(node)])
+                return value if self.check_string is None else self.check_string(value)
             left = self.eval_function_body(node.left, local_env)
             right = self.eval_function_body(node.right, local_env)
+            if self.string_ops is not None and node.op in self.string_ops:
+                return self.string_ops[node.op](left, right)
             if node.op == '+':
                 return left + right
             elif node.op == '-':
@@ -222,15 +401,25 @@ class Interpreter:
                 raise RuntimeError(f"Unsupported unary operator: {node.op}")
         elif isinstance(node, CheckStatement):
             subject = self.eval_function_body(node.subject_expr, local_env)
+            # In a function body check is an expression: its value is that of
+            # the branch taken, or None when no branch is.
+            table = self.check_table(node, True)
+            if table is not None:
+                index = dispatch(table, subject)
+                block = node.else_block if index is None else node.when_branches[index][1]
+                return self.eval_function_body_sequence(block or [], local_env)
             for pattern_expr, block in node.when_branches:
                 if subject == self.eval_function_body(pattern_expr, local_env):
-                    self.eval_function_body_sequence(block, local_env)
-                    return None
+                    return self.eval_function_body_sequence(block, local_env)
             if node.else_block:
-                self.eval_function_body_sequence(node.else_block, local_env)
-                return None
+                return self.eval_function_body_sequence(node.else_block, local_env)
+            return None
         elif isinstance(node, InputCall):
-            return input()
+            self.output.before_input()
+            return self.input_source.read_line()
+        elif isinstance(node, EndOfInput):
+            self.output.before_input()
+            return self.input_source.at_end()
         elif isinstance(node, Identifier):
             if node.name in local_env:
                 return local_env[node.name]
@@ -243,7 +432,7 @@ class Interpreter:
             return self.call_function(node.name, args)
         elif isinstance(node, PutsStatement):
             result = self.eval_function_body(node.expr, local_env)
-            print(result)
+            self.output.write(result)
             return None
         elif isinstance(node, int):
             return node
@@ -0,0 +1,234 @@
+# limits.py
+# Execution budgets, for running programs that cannot be trusted to stop,
+# or to stay small, in a process that has other work to do.
+#
+#   program = Program.from_file('untrusted.sova', limits=Limits(steps=10 ** 6, seconds=2))
+#   try:
+#       program.run(ListSource(lines), CollectingSink())
+#   except ResourceLimitExceeded as e:
+#       print(e, e.usage)
+#
+# A step is a pass through a loop or a call to a Belasova function, so a
+# program that never stops takes steps without end. Every engine counts
+# them on a Meter, one per run, which stops the run once it has taken more
+# steps than allowed or has run for too long. The clock is read every
+# CHECK_INTERVAL steps, so a deadline is noticed within that many steps of
+# passing; a run waiting for input, or inside one builtin, does not notice.
+#
+# Strings are checked as ++, + and * and the loops building strings make
+# them (* before it makes one), and arrays before arrayRange and arrayFill
+# make them, those being the only builtins whose arrays can be longer than
+# their arguments. Other values never outgrow the ones they are made from.
+#
+# Engines given no Limits count nothing, and run as fast as they always
+# have.
+import time
+
+from arrays import ARRAY_LENGTHS
+from runtime import BINARY_OPS, BUILTINS, concat
+
+STEPS, SECONDS, STRING_LENGTH, ARRAY_LENGTH = 'steps', 'seconds', 'string length', 'array length'
+MESSAGES = {
+    STEPS: "Step limit of {maximum} exceeded",
+    SECONDS: "Time limit of {maximum:g}s exceeded",
+    STRING_LENGTH: "String length limit of {maximum} exceeded: {used} characters",
+    ARRAY_LENGTH: "Array length limit of {maximum} exceeded: {used} elements",
+}
+# Steps between reads of the clock.
+CHECK_INTERVAL = 1000
+
+
+class ResourceLimitExceeded(RuntimeError):
+    # limit is STEPS, SECONDS, STRING_LENGTH or ARRAY_LENGTH; maximum is
+    # what the Limits allow of it, and used what the run went to. usage is
+    # the run's Usage when it stopped.
+    def __init__(self, limit, maximum, used, usage=None):
+        super().__init__(MESSAGES[limit].format(maximum=maximum, used=used))
+        self.limit = limit
+        self.maximum = maximum
+        self.used = used
+        self.usage = usage
+
+
+class Usage:
+    __slots__ = ('steps', 'seconds')
+
+    def __init__(self, steps, seconds):
+        self.steps = steps
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"Usage(steps={self.steps}, seconds={self.seconds:.6f})"
+
+    def __str__(self):
+        return f"{self.steps} steps in {self.seconds:.3f}s"
+
+
+class Limits:
+    # What a run may use, with None for no limit. Never changes once made,
+    # so any number of runs can share one.
+    def __init__(self, steps=None, seconds=None, string_length=None, array_length=None):
+        for limit, value in ((STEPS, steps), (SECONDS, seconds), (STRING_LENGTH, string_length),
+                             (ARRAY_LENGTH, array_length)):
+            if value is not None and value <= 0:
+                raise RuntimeError(f"The {limit} limit must be positive, not {value}")
+        self.steps = steps
+        self.seconds = seconds
+        self.string_length = string_length
+        self.array_length = array_length
+        # The builtins and operators for runs under these limits. string_ops
+        # are the operators that can make strings, checked, or None.
+        self.builtins = BUILTINS
+        if array_length is not None:
+            self.builtins = {**BUILTINS, **{name: self.checked_builtin(name) for name in ARRAY_LENGTHS}}
+        self.string_ops = None
+        self.binary_ops = BINARY_OPS
+        if string_length is not None:
+            self.string_ops = {'+': self.add, '*': self.multiply, '++': self.concat}
+            self.binary_ops = {**BINARY_OPS, **self.string_ops}
+
+    def __repr__(self):
+        return (f"Limits(steps={self.steps}, seconds={self.seconds}, string_length={self.string_length}, "
+                f"array_length={self.array_length})")
+
+    def checked_builtin(self, name):
+        builtin = BUILTINS[name]
+        length = ARRAY_LENGTHS[name]
+        maximum = self.array_length
+
+        def checked(args):
+            used = length(args)
+            if used > maximum:
+                raise ResourceLimitExceeded(ARRAY_LENGTH, maximum, used)
+            return builtin(args)
+        return checked
+
+    def check_string(self, value):
+        # value, unless it is longer than the string length limit allows.
+        if len(value) > self.string_length:
+            raise ResourceLimitExceeded(STRING_LENGTH, self.string_length, len(value))
+        return value
+
+    def add(self, left, right):
+        value = left + right
+        if type(value) is str and len(value) > self.string_length:
+            raise ResourceLimitExceeded(STRING_LENGTH, self.string_length, len(value))
+        return value
+
+    def multiply(self, left, right):
+        # Checked before multiplying, as the string could be any length.
+        text, count = (left, right) if isinstance(left, str) else (right, left)
+        if isinstance(text, str) and isinstance(count, int) and len(text) * count > self.string_length:
+            raise ResourceLimitExceeded(STRING_LENGTH, self.string_length, len(text) * count)
+        return left * right
+
+    def concat(self, left, right):
+        return self.check_string(concat(left, right))
+
+    def pieces(self, first):
+        # The list a StringBuilder collects pieces in, starting with first.
+        if self.string_length is None:
+            return [first]
+        return Pieces(self.string_length, first)
+
+
+class Pieces(list):
+    # The pieces of a string being built, which fail to add up to more than
+    # maximum characters. Nothing is added by an append that fails.
+    __slots__ = ('maximum', 'length')
+
+    def __init__(self, maximum, first):
+        super().__init__((first,))
+        self.maximum = maximum
+        self.length = len(first)
+
+    def append(self, piece):
+        self.grow(len(piece))
+        super().append(piece)
+
+    def extend(self, pieces):
+        pieces = list(pieces)
+        self.grow(sum(map(len, pieces)))
+        super().extend(pieces)
+
+    def grow(self, length):
+        if self.length + length > self.maximum:
+            raise ResourceLimitExceeded(STRING_LENGTH, self.maximum, self.length + length)
+        self.length += length
+
+
+class Meter:
+    # Counts the steps of one run against its Limits. Engines count a step
+    # with tick(), or, saving the call, by counting left down to 0
+    # themselves, then calling charge() and setting left to what it returns.
+    def __init__(self, limits, interval=CHECK_INTERVAL):
+        self.limits = limits
+        self.interval = interval
+        self.start()
+
+    def start(self):
+        # Called as the run starts.
+        self.started = time.monotonic()
+        seconds = self.limits.seconds
+        self.deadline = None if seconds is None else self.started + seconds
+        # Steps counted so far, not including the ones granted since.
+        self.steps = 0
+        self.granted = self.left = self.grant()
+
+    def grant(self):
+        # Steps allowed until the limits are checked again.
+        steps = self.limits.steps
+        if steps is None:
+            return self.interval
+        return min(self.interval, steps + 1 - self.steps)
+
+    def tick(self):
+        self.left -= 1
+        if not self.left:
+            self.left = self.charge()
+
+    def charge(self):
+        # Counts the steps granted last, all of them taken now, and checks
+        # the limits.
+        self.steps += self.granted
+        self.granted = self.left = 0
+        limits = self.limits
+        if limits.steps is not None and self.steps > limits.steps:
+            self.fail(ResourceLimitExceeded(STEPS, limits.steps, self.steps, self.usage()))
+        if self.deadline is not None:
+            now = time.monotonic()
+            if now > self.deadline:
+                self.fail(ResourceLimitExceeded(SECONDS, limits.seconds, now - self.started, self.usage()))
+        self.granted = self.grant()
+        return self.granted
+
+    def fail(self, error):
+        # Leaves one step to take, so a run that goes on regardless (say, by
+        # calling a function afterwards) fails again on its next step.
+        self.granted = self.left = 1
+        raise error
+
+    def usage(self):
+        return Usage(self.steps + self.granted - self.left, time.monotonic() - self.started)
+
+    def record(self, error):
+        # Size limits are checked without a meter: their errors get the
+        # run's usage as they leave it.
+        if error.usage is None:
+            error.usage = self.usage()
+
+
+def add_limit_arguments(arg_parser):
+    arg_parser.add_argument('--max-steps', type=int,
+                            help="stop the program after this many loop passes and function calls")
+    arg_parser.add_argument('--max-seconds', type=float, help="stop the program after running this long")
+    arg_parser.add_argument('--max-string', type=int, help="longest string the program may build")
+    arg_parser.add_argument('--max-array', type=int, help="longest array the program may make")
+
+
+def limits_from_options(options):
+    # The Limits add_limit_arguments's options ask for, or None for none.
+    values = (options.max_steps, options.max_seconds, options.max_string, options.max_array)
+    if all(value is None for value in values):
+        return None
+    return Limits(*values)
@@ -0,0 +1,184 @@
+# loops.py
+# Loop analysis shared by the compiling engines.
+#
+# An expression in a loop is invariant when it only reads variables the
+# loop never assigns and has no effects: no calls and no input. Functions
+# cannot assign globals, so such an expression has the same value on every
+# pass. The engines compute it at its first use after the loop is entered
+# and reuse that value until the loop is entered again. Computing it at
+# first use rather than ahead of the loop means an expression that fails,
+# or sits in a branch that is never taken, behaves exactly as it did.
+#
+# A hoisted value is never None: operators always produce a value, and
+# only calls, which are never hoisted, can return None. The engines use
+# None to mark a value not computed yet.
+#
+# A string accumulator is a global that a loop only ever appends to, as in
+# `let s = s ++ x`: every assignment to it in the loop has that form and
+# nothing else in the loop reads it, nor does any function (which could be
+# called from the loop). The engines collect what such a loop appends in a
+# StringBuilder and set the variable once, as the loop exits, since nothing
+# can read it before then.
+from ast_nodes import *
+
+JUMPS = (BreakStatement, ContinueStatement)
+
+
+def assigned_names(stmts, names=None):
+    # Names assigned anywhere in stmts, nested blocks and loops included.
+    # Function bodies are skipped: their assignments are local.
+    if names is None:
+        names = set()
+    for node in stmts:
+        if isinstance(node, VariableAssignment):
+            names.add(node.name)
+        elif isinstance(node, IfElseStatement):
+            assigned_names(node.then_block, names)
+            assigned_names(node.else_block, names)
+        elif isinstance(node, IfChain):
+            for _, block in node.branches:
+                assigned_names(block, names)
+            assigned_names(node.else_block, names)
+        elif isinstance(node, CheckStatement):
+            for _, block in node.when_branches:
+                assigned_names(block, names)
+            assigned_names(node.else_block or [], names)
+        elif isinstance(node, LoopNode):
+            assigned_names(node.body, names)
+    return names
+
+
+def is_invariant(node, assigned):
+    if isinstance(node, (Constant, NumberLiteral, StringLiteral, BooleanLiteral, int, float, str)):
+        return True
+    elif isinstance(node, Identifier):
+        return node.name not in assigned
+    elif isinstance(node, UnaryOp):
+        return is_invariant(node.expr, assigned)
+    elif isinstance(node, BinaryOp):
+        return is_invariant(node.left, assigned) and is_invariant(node.right, assigned)
+    return False
+
+
+def loop_invariants(node, hoisted=()):
+    # The largest invariant operator expressions evaluated on each pass of
+    # loop node, in source order. Those in hoisted already belong to an
+    # enclosing loop and are left out along with their parts.
+    assigned = assigned_names([node])
+    found = []
+
+    def expression(expr):
+        if not isinstance(expr, (UnaryOp, BinaryOp, FunctionCall)) or expr in hoisted:
+            return
+        if isinstance(expr, FunctionCall):
+            for arg in expr.args:
+                expression(arg)
+        elif is_invariant(expr, assigned):
+            found.append(expr)
+        elif isinstance(expr, UnaryOp):
+            expression(expr.expr)
+        else:
+            expression(expr.left)
+            expression(expr.right)
+
+    def block(stmts):
+        for stmt in stmts:
+            if isinstance(stmt, (PutsStatement, VariableAssignment)):
+                expression(stmt.expr if isinstance(stmt, PutsStatement) else stmt.value)
+            elif isinstance(stmt, IfElseStatement):
+                expression(stmt.condition)
+                block(stmt.then_block)
+                block(stmt.else_block)
+            elif isinstance(stmt, IfChain):
+                for condition, branch in stmt.branches:
+                    expression(condition)
+                    block(branch)
+                block(stmt.else_block)
+            elif isinstance(stmt, CheckStatement):
+                expression(stmt.subject_expr)
+                for pattern, branch in stmt.when_branches:
+                    expression(pattern)
+                    block(branch)
+                block(stmt.else_block or [])
+            elif isinstance(stmt, LoopNode):
+                if stmt.loop_type in ('times', 'until'):
+                    expression(stmt.condition_or_count)
+                block(stmt.body)
+            else:
+                expression(stmt)
+
+    # A times count is evaluated once per entry, so only the condition of an
+    # until loop is evaluated on each pass.
+    if node.loop_type == 'until':
+        expression(node.condition_or_count)
+    block(node.body)
+    return found
+
+
+def has_jumps(stmts):
+    # Whether stmts contain a break or continue for the loop they are in;
+    # those inside nested loops belong to the nested loop.
+    for node in stmts:
+        if isinstance(node, JUMPS):
+            return True
+        elif isinstance(node, IfElseStatement):
+            if has_jumps(node.then_block) or has_jumps(node.else_block):
+                return True
+        elif isinstance(node, IfChain):
+            if any(has_jumps(block) for _, block in node.branches) or has_jumps(node.else_block):
+                return True
+        elif isinstance(node, CheckStatement):
+            if any(has_jumps(block) for _, block in node.when_branches) or has_jumps(node.else_block or []):
+                return True
+    return False
+
+
+def _walk(values, found):
+    # Appends every node below values to found.
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            _walk(value, found)
+        elif isinstance(value, Node):
+            found.append(value)
+            _walk([field for _, field in iter_fields(value)], found)
+    return found
+
+
+def function_reads(stmts):
+    # Names the functions defined in stmts read, other than parameters:
+    # those may be globals.
+    names = set()
+    for node in stmts:
+        if isinstance(node, FunctionDefinition):
+            names.update({found.name for found in _walk(node.body, []) if isinstance(found, Identifier)}
+                         - set(node.params))
+    return names
+
+
+def is_append(node):
+    # Whether assignment node is `name = name ++ ...`, with no cast.
+    value = node.value
+    if node.type_annotation not in (None, 'String') or not isinstance(value, BinaryOp) or value.op != '++':
+        return False
+    while isinstance(value, BinaryOp) and value.op == '++':
+        value = value.left
+    return isinstance(value, Identifier) and value.name == node.name
+
+
+def string_accumulators(node, excluded=()):
+    # The string accumulators of loop node, other than names in excluded,
+    # each mapped to its assignments in the loop.
+    appends = {}
+    reads = {}
+    others = set()
+    for found in _walk([node.condition_or_count, node.body], []):
+        if isinstance(found, Identifier):
+            reads[found.name] = reads.get(found.name, 0) + 1
+        elif isinstance(found, VariableAssignment):
+            if is_append(found):
+                appends.setdefault(found.name, []).append(found)
+            else:
+                others.add(found.name)
+    # Each append reads its own name once.
+    return {name: assignments for name, assignments in appends.items()
+            if name not in others and name not in excluded and reads[name] == len(assignments)}
@@ -0,0 +1,206 @@
+# memo.py
+# Memoization of pure Belasova functions. A function is pure when its body
+# does no I/O (no puts, no getLine), reads no globals (every name it reads
+# is a parameter or a local assigned on every path before the read) and
+# calls only pure functions and builtins. Functions cannot write globals,
+# so a pure function's result depends on its arguments alone and can be
+# cached, keyed by the argument tuple, in a bounded LRU.
+#
+# Purity is decided as definitions run: a call to a function that is not
+# defined yet cannot succeed, so it does not make the caller impure, but
+# every new definition can change what other functions compute, so each
+# one clears the caches and re-derives which functions are memoized.
+import math
+from collections import OrderedDict, namedtuple
+
+from arrays import ARRAY_BUILTINS
+from ast_nodes import *
+from resolver import LOCAL, Resolver
+from runtime import BUILTINS
+
+# Policies: which pure functions are memoized.
+#   recursive  only those that can call themselves, directly or not
+#   all        every pure function
+#   off        none
+RECURSIVE, ALL, OFF = 'recursive', 'all', 'off'
+POLICIES = (RECURSIVE, ALL, OFF)
+DEFAULT_CACHE_SIZE = 4096
+
+# Builtins whose result depends on their arguments alone.
+PURE_BUILTINS = frozenset({'toInt', 'toDouble', *ARRAY_BUILTINS})
+
+# Returned by LRUCache.get for keys not in the cache.
+MISSING = object()
+
+FunctionSummary = namedtuple('FunctionSummary', ['name', 'pure', 'callees'])
+
+
+def cache_key(args):
+    # 1, 1.0 and True compare (and hash) equal but are not interchangeable
+    # as arguments, so the types are part of the key. So are the signs of
+    # float zeros: -0.0 == 0.0, but they print differently.
+    if 0.0 in args:
+        return (*args, *map(type, args), *[math.copysign(1.0, arg) for arg in args if type(arg) is float])
+    return (*args, *map(type, args))
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+
+def memoized(function, cache):
+    # For engines that call Python functions directly.
+    def call(*args):
+        key = cache_key(args)
+        value = cache.get(key)
+        if value is MISSING:
+            value = cache.store(key, function(*args))
+        return value
+    call.__wrapped__ = function
+    return call
+
+
+def summarize(node):
+    # Whether a FunctionDefinition's own body is pure, and the names it calls.
+    bindings = Resolver().resolve([node]).bindings
+    callees = set()
+    pure = _pure_block(node.body, bindings, callees)
+    return FunctionSummary(node.name, pure, tuple(sorted(callees)))
+
+
+def _pure_block(stmts, bindings, callees):
+    return all(_pure(stmt, bindings, callees) for stmt in stmts)
+
+
+def _pure(node, bindings, callees):
+    if isinstance(node, (Constant, NumberLiteral, StringLiteral, int, float, str)):
+        return True
+    elif isinstance(node, Identifier):
+        return bindings[node].scope == LOCAL
+    elif isinstance(node, VariableAssignment):
+        return _pure(node.value, bindings, callees)
+    elif isinstance(node, UnaryOp):
+        return _pure(node.expr, bindings, callees)
+    elif isinstance(node, BinaryOp):
+        return _pure(node.left, bindings, callees) and _pure(node.right, bindings, callees)
+    elif isinstance(node, FunctionCall):
+        if node.name in BUILTINS and node.name not in PURE_BUILTINS:
+            return False
+        callees.add(node.name)
+        return _pure_block(node.args, bindings, callees)
+    elif isinstance(node, CheckStatement):
+        return (_pure(node.subject_expr, bindings, callees)
+                and all(_pure(pattern, bindings, callees) and _pure_block(block, bindings, callees)
+                        for pattern, block in node.when_branches)
+                and _pure_block(node.else_block or [], bindings, callees))
+    # puts, getLine, and nodes a function body rejects.
+    return False
+
+
+class Memoizer:
+    def __init__(self, policy=RECURSIVE, maxsize=DEFAULT_CACHE_SIZE):
+        if policy not in POLICIES:
+            raise RuntimeError(f"Unknown memoization policy: {policy} (choose from {', '.join(POLICIES)})")
+        if maxsize < 1:
+            raise RuntimeError("Memoization cache size must be at least 1")
+        self.policy = policy
+        self.maxsize = maxsize
+        # Function name -> FunctionSummary of its current definition.
+        self.summaries = {}
+        # Function name -> LRUCache, for the functions memoized right now.
+        # Updated in place, so engines may hold on to it.
+        self.caches = {}
+        # Every cache ever used, so counts survive redefinitions.
+        self.all_caches = {}
+
+    def define(self, summary):
+        if self.policy == OFF:
+            return
+        self.summaries[summary.name] = summary
+        names = self.memoized_names()
+        for cache in self.all_caches.values():
+            cache.clear()
+        self.caches.clear()
+        for name in names:
+            cache = self.all_caches.get(name)
+            if cache is None:
+                cache = self.all_caches[name] = LRUCache(self.maxsize)
+            self.caches[name] = cache
+
+    def reset(self):
+        # Forgets every definition and cache, as if newly created.
+        self.summaries.clear()
+        self.caches.clear()
+        self.all_caches.clear()
+
+    def memoized_names(self):
+        summaries = self.summaries
+        pure = {name for name, summary in summaries.items() if summary.pure}
+        # Calling an impure function makes the caller impure.
+        changed = True
+        while changed:
+            changed = False
+            for name in list(pure):
+                if any(callee in summaries and callee not in pure for callee in summaries[name].callees):
+                    pure.discard(name)
+                    changed = True
+        if self.policy == ALL:
+            return pure
+        return {name for name in pure if self.is_recursive(name)}
+
+    def is_recursive(self, name):
+        seen = set()
+        pending = list(self.summaries[name].callees)
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                return True
+            if callee in seen or callee not in self.summaries:
+                continue
+            seen.add(callee)
+            pending.extend(self.summaries[callee].callees)
+        return False
+
+    @property
+    def hits(self):
+        return sum(cache.hits for cache in self.all_caches.values())
+
+    @property
+    def misses(self):
+        return sum(cache.misses for cache in self.all_caches.values())
+
+    @property
+    def evictions(self):
+        return sum(cache.evictions for cache in self.all_caches.values())
+
+    def report(self):
+        lines = [f"memo {name}: {cache.hits} hits, {cache.misses} misses, {cache.evictions} evictions"
+                 for name, cache in sorted(self.all_caches.items())]
+        lines.append(f"memo total: {self.hits} hits, {self.misses} misses, {self.evictions} evictions")
+        return '\n'.join(lines)
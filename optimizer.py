@@ -0,0 +1,235 @@
+# optimizer.py
+# AST-to-AST pass run between parsing and execution. It folds operators
+# over constant operands, decodes literals once into Constant nodes, drops
+# branches and loops whose conditions are known, and removes statements
+# that can never run.
+#
+# Every rewrite keeps the program's observable behaviour, errors included:
+# an operation that would fail at run time is left in place to fail there,
+# and nodes the engines reject inside function bodies are not touched.
+import math
+
+from ast_nodes import *
+from runtime import BINARY_OPS
+
+# Folded strings longer than this stay as expressions, so a small program
+# cannot expand into a huge tree.
+MAX_FOLDED_LENGTH = 4096
+
+# Nothing in a block after one of these statements can run.
+TERMINATORS = (ReturnStatement, BreakStatement, ContinueStatement)
+
+
+def _located(nodes, original):
+    # Rewritten statements keep the source line of the one they replace;
+    # statements spliced in from a nested block already have their own.
+    line = line_of(original)
+    if line is not None:
+        for node in nodes:
+            if line_of(node) is None and isinstance(node, Node):
+                node.line = line
+    return nodes
+
+
+def _foldable(value):
+    if isinstance(value, float):
+        # inf and nan have no literal form, and -0.0 would share a constant
+        # slot with 0.0.
+        return math.isfinite(value) and (value != 0 or math.copysign(1.0, value) > 0)
+    if isinstance(value, str):
+        return len(value) <= MAX_FOLDED_LENGTH
+    return True
+
+
+def _string_length(op, left, right):
+    # The length of the string op would make of the constants left and
+    # right, without making it, or 0 if it makes none.
+    if op == '*':
+        for text, count in ((left, right), (right, left)):
+            if isinstance(text, str) and isinstance(count, int):
+                return len(text) * count
+        return 0
+    if op in ('+', '++') and (isinstance(left, str) or isinstance(right, str)):
+        return len(str(left)) + len(str(right))
+    return 0
+
+
+class Optimizer:
+    def __init__(self):
+        self.folded = 0
+        self.removed = 0
+
+    def optimize(self, ast):
+        return list(self.iter_program(ast))
+
+    def iter_program(self, statements):
+        # Works on any iterable of top-level statements, so it can sit in
+        # front of the streaming parser too.
+        for node in statements:
+            for stmt in (node if isinstance(node, list) else [node]):
+                yield from _located(self.statement(stmt), stmt)
+                if isinstance(stmt, TERMINATORS):
+                    # The top level raises on these, so nothing after runs.
+                    return
+
+    def block(self, stmts):
+        result = []
+        for index, stmt in enumerate(stmts):
+            result.extend(_located(self.statement(stmt), stmt))
+            if isinstance(stmt, TERMINATORS):
+                self.removed += len(stmts) - index - 1
+                break
+        return result
+
+    # Top-level statements (and the blocks nested in them). Returns the
+    # list of statements that replaces node.
+    def statement(self, node):
+        if isinstance(node, PutsStatement):
+            return [PutsStatement(self.expression(node.expr, False))]
+        elif isinstance(node, FunctionDefinition):
+            return [FunctionDefinition(node.name, node.params, self.function_body(node.body))]
+        elif isinstance(node, VariableAssignment):
+            return [VariableAssignment(node.name, self.expression(node.value, False),
+                                       node.type_annotation, node.is_declaration)]
+        elif isinstance(node, IfElseStatement):
+            condition = self.expression(node.condition, False)
+            if isinstance(condition, Constant):
+                self.removed += 1
+                return self.block(node.then_block if condition.value else node.else_block)
+            return [IfElseStatement(condition, self.block(node.then_block), self.block(node.else_block))]
+        elif isinstance(node, IfChain):
+            return self.if_chain(node)
+        elif isinstance(node, CheckStatement):
+            return self.check(node)
+        elif isinstance(node, LoopNode):
+            return self.loop(node)
+        elif isinstance(node, (NumberLiteral, StringLiteral, BooleanLiteral, Identifier, UnaryOp,
+                               BinaryOp, FunctionCall, InputCall)):
+            expr = self.expression(node, False)
+            if isinstance(expr, Constant):
+                # A bare value statement does nothing once it is known.
+                self.removed += 1
+                return []
+            return [expr]
+        # Signatures, and the nodes the top level rejects, stay as they are.
+        return [node]
+
+    def if_chain(self, node):
+        kept = []
+        else_block = node.else_block
+        for condition, block in node.branches:
+            condition = self.expression(condition, False)
+            if isinstance(condition, Constant):
+                self.removed += 1
+                if condition.value:
+                    # Always taken: later branches and the else are dead.
+                    else_block = block
+                    break
+                continue
+            kept.append((condition, self.block(block)))
+        else_block = self.block(else_block)
+        if not kept:
+            return else_block
+        return [IfChain(kept, else_block)]
+
+    def check(self, node):
+        subject = self.expression(node.subject_expr, False)
+        branches = [(self.expression(pattern, False), self.block(block))
+                    for pattern, block in node.when_branches]
+        else_block = self.block(node.else_block) if node.else_block else node.else_block
+        if isinstance(subject, Constant):
+            # Leading constant patterns can be decided now.
+            while branches and isinstance(branches[0][0], Constant):
+                pattern, block = branches.pop(0)
+                self.removed += 1
+                if subject.value == pattern.value:
+                    return block
+            if not branches:
+                return else_block or []
+        return [CheckStatement(subject, branches, else_block)]
+
+    def loop(self, node):
+        condition = node.condition_or_count
+        if node.loop_type in ('times', 'until'):
+            condition = self.expression(condition, False)
+        if isinstance(condition, Constant):
+            if node.loop_type == 'until' and condition.value:
+                self.removed += 1
+                return []
+            if (node.loop_type == 'times' and isinstance(condition.value, (int, float))
+                    and int(condition.value) <= 0):
+                self.removed += 1
+                return []
+        return [LoopNode(node.loop_type, condition, self.block(node.body))]
+
+    def function_body(self, body):
+        # The last statement's value is the function's result, so only the
+        # ones before it may be dropped when they are bare constants.
+        result = []
+        for index, stmt in enumerate(body):
+            stmt, = _located([self.function_statement(stmt)], stmt)
+            is_last = index == len(body) - 1
+            if isinstance(stmt, Constant) and not is_last:
+                self.removed += 1
+            else:
+                result.append(stmt)
+            if isinstance(stmt, TERMINATORS):
+                self.removed += len(body) - index - 1
+                break
+        return result
+
+    # Function bodies: only the statements Interpreter.eval_function_body
+    # supports are rewritten; anything else must still fail as it did.
+    def function_statement(self, node):
+        if isinstance(node, VariableAssignment):
+            return VariableAssignment(node.name, self.expression(node.value, True),
+                                      node.type_annotation, node.is_declaration)
+        elif isinstance(node, PutsStatement):
+            return PutsStatement(self.expression(node.expr, True))
+        elif isinstance(node, CheckStatement):
+            return CheckStatement(self.expression(node.subject_expr, True),
+                                  [(self.expression(pattern, True), self.function_body(block))
+                                   for pattern, block in node.when_branches],
+                                  self.function_body(node.else_block) if node.else_block else node.else_block)
+        elif isinstance(node, (NumberLiteral, StringLiteral, Identifier, UnaryOp, BinaryOp,
+                               FunctionCall, InputCall)):
+            return self.expression(node, True)
+        return node
+
+    def expression(self, node, in_function):
+        if isinstance(node, NumberLiteral):
+            return Constant(node.value)
+        elif isinstance(node, StringLiteral):
+            return Constant(node.value.strip('"'))
+        elif isinstance(node, BooleanLiteral) and not in_function:
+            return Constant(node.value)
+        elif isinstance(node, UnaryOp):
+            operand = self.expression(node.expr, in_function)
+            if node.op == 'not' and isinstance(operand, Constant):
+                self.folded += 1
+                return Constant(not operand.value)
+            return UnaryOp(node.op, operand)
+        elif isinstance(node, BinaryOp):
+            left = self.expression(node.left, in_function)
+            right = self.expression(node.right, in_function)
+            op = BINARY_OPS.get(node.op)
+            if (op is not None and isinstance(left, Constant) and isinstance(right, Constant)
+                    and _string_length(node.op, left.value, right.value) <= MAX_FOLDED_LENGTH):
+                try:
+                    value = op(left.value, right.value)
+                except Exception:
+                    # Division by zero, mismatched types, ...: leave it to
+                    # raise at run time, where it would have.
+                    pass
+                else:
+                    if _foldable(value):
+                        self.folded += 1
+                        return Constant(value)
+            return BinaryOp(left, node.op, right)
+        elif isinstance(node, FunctionCall):
+            return FunctionCall(node.name, [self.expression(arg, in_function) for arg in node.args])
+        return node
+
+
+def optimize(ast):
+    return Optimizer().optimize(ast)
@@ -0,0 +1,283 @@
+# profiler.py
+# Profiles Belasova programs on the tree engine (test_sova.py --profile).
+#
+# Time is attributed to Belasova stacks: the chain of function calls from
+# the top level down, each frame labelled with the source line of the
+# statement it most recently started. From those the report derives call
+# counts, inclusive and exclusive time per function and time per line, and
+# collapsed() writes the stacks in the one-line-per-stack format that
+# flamegraph tools read.
+#
+# Two modes:
+#   sample  a background thread reads the Belasova stack off the
+#           interpreter's Python stack every interval. The interpreter
+#           itself only counts calls, so this is cheap enough to leave on.
+#   exact   every statement and call is timed as it happens. Complete, but
+#           the program runs several times slower.
+import sys
+import threading
+import time
+
+from ast_nodes import line_of
+from interpreter import Interpreter
+from runtime import BUILTINS
+
+SAMPLE, EXACT = 'sample', 'exact'
+PROFILE_MODES = (SAMPLE, EXACT)
+DEFAULT_INTERVAL = 0.001
+MAIN = '<main>'
+
+# The Interpreter methods the sampler recognizes on the Python stack.
+_CALL_CODE = Interpreter.call_function.__code__
+_STATEMENT_CODES = (Interpreter.eval_node.__code__, Interpreter.eval_function_body.__code__)
+
+
+class StackNode:
+    # One frame of a Belasova stack, (function, line), under its caller's.
+    __slots__ = ('children', 'time', 'hits')
+
+    def __init__(self):
+        self.children = {}
+        # Seconds spent with this frame on top of the stack.
+        self.time = 0.0
+        # Statements started (exact) or samples taken (sample) here.
+        self.hits = 0
+
+    def child(self, frame):
+        node = self.children.get(frame)
+        if node is None:
+            node = self.children[frame] = StackNode()
+        return node
+
+
+class FunctionStats:
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+
+
+class Profiler:
+    def __init__(self, mode=SAMPLE, interval=DEFAULT_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise RuntimeError(f"Unknown profile mode: {mode} (choose from {', '.join(PROFILE_MODES)})")
+        if interval <= 0:
+            raise RuntimeError("Profile interval must be positive")
+        self.mode = mode
+        self.interval = interval
+        self.root = StackNode()
+        self.calls = {}
+        self.samples = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        # exact mode: the StackNode of each active frame's caller, and of
+        # the statement running in the innermost frame.
+        self.callers = []
+        self.current = None
+        self.last = 0.0
+        self.names = [MAIN]
+        # sample mode
+        self.thread = None
+        self.stopped = None
+        self.target = None
+        self.switch_interval = None
+
+    def interpreter(self, ast, memoizer=None, output=None, input_source=None, types=None, limits=None):
+        # A tree engine that reports to this profiler.
+        cls = TracingInterpreter if self.mode == EXACT else CountingInterpreter
+        return cls(ast, memoizer, output, input_source, types, limits, profiler=self)
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.mode == EXACT:
+            self.current = self.root.child((MAIN, None))
+            self.last = time.perf_counter()
+            return
+        self.target = threading.get_ident()
+        # The sampler can only run when the interpreter thread gives up the
+        # GIL, which by default it does every 5ms.
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample_loop, name='belasova-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.mode == EXACT:
+            self.charge()
+        elif self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+            sys.setswitchinterval(self.switch_interval)
+        self.elapsed += time.perf_counter() - self.started
+
+    # exact mode events
+    def charge(self):
+        now = time.perf_counter()
+        self.current.time += now - self.last
+        self.last = now
+
+    def statement(self, line):
+        self.charge()
+        caller = self.callers[-1] if self.callers else self.root
+        self.current = caller.child((self.names[-1], line))
+        self.current.hits += 1
+
+    def enter(self, name):
+        self.charge()
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.callers.append(self.current)
+        self.names.append(name)
+        self.current = self.current.child((name, None))
+
+    def leave(self):
+        self.charge()
+        self.names.pop()
+        self.current = self.callers.pop()
+
+    # sample mode
+    def sample_loop(self):
+        # A sample stands for the time since the one before: the thread can
+        # wake late while the interpreter holds the GIL.
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            now = time.perf_counter()
+            if frame is not None:
+                self.sample(frame, now - last)
+            last = now
+
+    def sample(self, frame, weight):
+        # Walks the Python stack outermost first: every call_function frame
+        # starts a Belasova frame, and the innermost statement being
+        # evaluated under it gives that frame's line.
+        python_frames = []
+        while frame is not None:
+            python_frames.append(frame)
+            frame = frame.f_back
+        stack = [[MAIN, None]]
+        for frame in reversed(python_frames):
+            code = frame.f_code
+            if code is _CALL_CODE:
+                name = frame.f_locals.get('name')
+                if name not in BUILTINS:
+                    stack.append([name, None])
+            elif code in _STATEMENT_CODES:
+                line = line_of(frame.f_locals.get('node'))
+                if line is not None:
+                    stack[-1][1] = line
+        node = self.root
+        for name, line in stack:
+            node = node.child((name, line))
+        node.time += weight
+        node.hits += 1
+        self.samples += 1
+
+    # Results
+    def stacks(self):
+        # Yields (frames, StackNode) for every stack that was seen.
+        pending = [((frame,), child) for frame, child in self.root.children.items()]
+        while pending:
+            frames, node = pending.pop()
+            yield frames, node
+            pending.extend((frames + (frame,), child) for frame, child in node.children.items())
+
+    def function_stats(self):
+        stats = {}
+        for frames, node in self.stacks():
+            if not node.time:
+                continue
+            stats.setdefault(frames[-1][0], FunctionStats()).exclusive += node.time
+            # A recursive function counts once per stack.
+            for name in {name for name, _ in frames}:
+                stats.setdefault(name, FunctionStats()).inclusive += node.time
+        for name, calls in self.calls.items():
+            stats.setdefault(name, FunctionStats()).calls = calls
+        if MAIN in stats:
+            stats[MAIN].calls = 1
+        return stats
+
+    def line_stats(self):
+        # (function, line) -> [time, hits], for the statement on top.
+        lines = {}
+        for frames, node in self.stacks():
+            name, line = frames[-1]
+            if line is not None and (node.time or node.hits):
+                entry = lines.setdefault((name, line), [0.0, 0])
+                entry[0] += node.time
+                entry[1] += node.hits
+        return lines
+
+    def collapsed(self):
+        # One 'frame;frame;... weight' line per stack, weights in
+        # microseconds.
+        lines = []
+        for frames, node in self.stacks():
+            weight = round(node.time * 1e6)
+            if weight:
+                labels = ';'.join(name if line is None else f"{name}:{line}" for name, line in frames)
+                lines.append(f"{labels} {weight}")
+        return '\n'.join(sorted(lines)) + '\n' if lines else ''
+
+    def report(self, limit=20):
+        hits = 'hits' if self.mode == EXACT else 'samples'
+        if self.mode == EXACT:
+            header = f"profile (exact): {self.elapsed:.3f}s"
+        else:
+            header = (f"profile (sample): {self.elapsed:.3f}s, "
+                      f"{self.samples} samples every {self.interval * 1000:g}ms")
+        out = [header, '', f"{'function':<24} {'calls':>9} {'inclusive (s)':>14} {'exclusive (s)':>14}"]
+        stats = self.function_stats()
+        for name, entry in sorted(stats.items(), key=lambda item: -item[1].inclusive)[:limit]:
+            out.append(f"{name:<24} {entry.calls:>9} {entry.inclusive:>14.4f} {entry.exclusive:>14.4f}")
+        out += ['', f"{'line':<24} {'time (s)':>14} {hits:>9}"]
+        lines = self.line_stats()
+        for (name, line), (seconds, count) in sorted(lines.items(), key=lambda item: -item[1][0])[:limit]:
+            out.append(f"{f'{line} ({name})':<24} {seconds:>14.4f} {count:>9}")
+        return '\n'.join(out)
+
+
+class CountingInterpreter(Interpreter):
+    # For sampling: counts calls and leaves everything else to the sampler.
+    def __init__(self, ast, memoizer=None, output=None, input_source=None, types=None, limits=None, profiler=None):
+        Interpreter.__init__(self, ast, memoizer, output, input_source, types, limits)
+        self.profiler = profiler
+
+    def interpret(self):
+        self.profiler.start()
+        try:
+            Interpreter.interpret(self)
+        finally:
+            self.profiler.stop()
+
+    def call_function(self, name, args):
+        if name not in BUILTINS:
+            calls = self.profiler.calls
+            calls[name] = calls.get(name, 0) + 1
+        return Interpreter.call_function(self, name, args)
+
+
+class TracingInterpreter(CountingInterpreter):
+    # For exact profiles: reports every statement, call and return.
+    def eval_node(self, node):
+        line = line_of(node)
+        if line is not None:
+            self.profiler.statement(line)
+        return Interpreter.eval_node(self, node)
+
+    def eval_function_body(self, node, local_env):
+        line = line_of(node)
+        if line is not None:
+            self.profiler.statement(line)
+        return Interpreter.eval_function_body(self, node, local_env)
+
+    def call_function(self, name, args):
+        if name in BUILTINS:
+            return Interpreter.call_function(self, name, args)
+        profiler = self.profiler
+        profiler.enter(name)
+        try:
+            return Interpreter.call_function(self, name, args)
+        finally:
+            profiler.leave()
@@ -0,0 +1,225 @@
+# program.py
+# Embedding API: a Program is parsed, optimized and compiled once, then run
+# any number of times, from any number of threads.
+#
+#   program = Program.from_file('fib.sova', engine='vm')
+#   program.run(ListSource(lines), CollectingSink())
+#   program.call('fib', 20)
+#
+# A Program only holds what every run can share, and never changes once
+# built: the AST, its expression types and the engine's compiled form
+# (bytecode for vm, a code object for python; the tree engine shares the
+# dispatch tables and summaries it builds as it goes). Each run gets its own
+# Context, with fresh globals, functions, memoization caches and streams,
+# so runs cannot see each other.
+#
+# Under Limits (see limits.py) every run is metered on its own: each
+# context's engine has a Meter of its own, started as the context runs.
+#
+# The closure engine binds its closures to one context's state as it
+# compiles them, so they cannot be shared. Its Programs keep a pool of
+# compiled contexts instead and hand each run one that is not in use,
+# cleared, with its streams pointed at the run's.
+import threading
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from ast_nodes import FunctionDefinition, FunctionSignature
+from bytecode import Compiler
+from closure_compiler import ClosureInterpreter
+from engines import DEFAULT_ENGINE, get_engine
+from interpreter import Interpreter
+from limits import ResourceLimitExceeded
+from memo import DEFAULT_CACHE_SIZE, RECURSIVE, Memoizer
+from optimizer import optimize
+from streams import BufferedSink, BufferedSource, InputSource, OutputSink
+from transpiler import PythonInterpreter, PythonTranspiler
+from typechecker import TypeChecker
+from vm import VMInterpreter
+
+# What a context runs: the whole program, or only its function definitions.
+PROGRAM, DEFINITIONS = 'program', 'definitions'
+
+
+class Program:
+    def __init__(self, ast, engine=DEFAULT_ENGINE, optimized=True, typecheck=False,
+                 memoize=RECURSIVE, memo_size=DEFAULT_CACHE_SIZE, limits=None):
+        self.engine = engine
+        self.engine_cls = get_engine(engine)
+        # Raises on a bad policy or size now rather than on the first run.
+        Memoizer(memoize, memo_size)
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self.limits = limits
+        if optimized:
+            ast = optimize(ast)
+        statements = []
+        for node in ast:
+            statements.extend(node if isinstance(node, list) else [node])
+        self.ast = tuple(statements)
+        # The program with only its function definitions, which call() runs
+        # to have the functions without running anything else.
+        definitions = tuple(node for node in statements
+                            if isinstance(node, (FunctionSignature, FunctionDefinition)))
+        self.asts = {PROGRAM: self.ast, DEFINITIONS: definitions}
+        self.types = None
+        if typecheck:
+            typing = TypeChecker().check(self.ast)
+            if typing.errors:
+                raise RuntimeError(f"Type errors: {'; '.join(typing.errors)}")
+            self.types = typing.types
+        # What each run of the tree engine would otherwise rebuild. Filled
+        # as the runs need them; two threads building the same entry store
+        # equal values.
+        self.check_tables = {}
+        self.loop_jumps = {}
+        self.accumulators = {}
+        self.summaries = {}
+        # PROGRAM or DEFINITIONS -> compiled form, for vm and python.
+        self.compiled = {part: self.compile(ast) for part, ast in self.asts.items()}
+        # PROGRAM or DEFINITIONS -> idle closure engine contexts.
+        self.pools = {PROGRAM: [], DEFINITIONS: []}
+        self.pool_lock = threading.Lock()
+
+    @classmethod
+    def from_source(cls, source, **options):
+        return cls(Parser(tokenize(source)).parse(), **options)
+
+    @classmethod
+    def from_file(cls, path, cache=None, **options):
+        # cache is a ProgramCache to take the parsed program from, and store
+        # it in when it is not there.
+        with open(path, 'r') as f:
+            source = f.read()
+        ast = cache.load(path, source, 'ast') if cache is not None else None
+        if ast is None:
+            ast = Parser(tokenize(source)).parse()
+            if cache is not None:
+                cache.store(path, source, 'ast', ast)
+        return cls(ast, **options)
+
+    def compile(self, ast):
+        if self.engine_cls is VMInterpreter:
+            return Compiler(self.types, limits=self.limits).compile_program(ast)
+        if self.engine_cls is PythonInterpreter:
+            return compile(PythonTranspiler(self.types, self.limits).transpile(ast), '<belasova>', 'exec')
+        return None
+
+    def context(self, input_source=None, output=None):
+        # A fresh context for running the program and then calling its
+        # functions; close it when done.
+        return Context(self, PROGRAM, input_source, output)
+
+    def run(self, input_source=None, output=None):
+        # Runs the whole program in a context of its own. With no streams,
+        # it reads stdin and writes stdout.
+        with self.context(input_source, output) as context:
+            context.run()
+
+    def call(self, name, *args, input_source=None, output=None):
+        # Calls one function in a context where only the function
+        # definitions have run, so the call cannot read globals.
+        with Context(self, DEFINITIONS, input_source, output) as context:
+            context.run()
+            return context.call(name, *args)
+
+    def engine_for(self, part, input_source, output):
+        if self.engine_cls is ClosureInterpreter:
+            return self.acquire(part, input_source, output)
+        memoizer = Memoizer(self.memoize, self.memo_size)
+        engine = self.engine_cls(self.asts[part], memoizer, output, input_source, self.types, self.limits)
+        if self.engine_cls is Interpreter:
+            engine.check_tables = self.check_tables
+            engine.loop_jumps = self.loop_jumps
+            engine.accumulators = self.accumulators
+            engine.summaries = self.summaries
+        else:
+            engine.code = self.compiled[part]
+        return engine
+
+    def acquire(self, part, input_source, output):
+        with self.pool_lock:
+            pool = self.pools[part]
+            engine = pool.pop() if pool else None
+        if engine is None:
+            engine = ClosureInterpreter(self.asts[part], Memoizer(self.memoize, self.memo_size), _SinkSwitch(),
+                                        _SourceSwitch(), self.types, self.limits)
+            engine.compile()
+        engine.output.target = output if output is not None else BufferedSink()
+        engine.input_source.target = input_source if input_source is not None else BufferedSource()
+        return engine
+
+    def release(self, part, engine):
+        engine.env.functions.clear()
+        engine.env.variables.clear()
+        engine.memoizer.reset()
+        engine.output.target = None
+        engine.input_source.target = None
+        with self.pool_lock:
+            self.pools[part].append(engine)
+
+
+class Context:
+    # One execution of a Program: its globals, functions, memoization
+    # caches and streams.
+    def __init__(self, program, part, input_source, output):
+        self.program = program
+        self.part = part
+        self.engine = program.engine_for(part, input_source, output)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self):
+        self.checked().interpret()
+
+    def call(self, name, *args):
+        # Calls a Belasova function the run has defined and returns its
+        # result.
+        engine = self.checked()
+        try:
+            return engine.call_function(name, list(args))
+        except ResourceLimitExceeded as e:
+            engine.meter.record(e)
+            raise
+        finally:
+            engine.output.flush()
+
+    def checked(self):
+        if self.engine is None:
+            raise RuntimeError("Context is closed")
+        return self.engine
+
+    def close(self):
+        if self.engine is not None and self.program.engine_cls is ClosureInterpreter:
+            self.program.release(self.part, self.engine)
+        self.engine = None
+
+
+class _SinkSwitch(OutputSink):
+    # Forwards to the sink of the run a pooled context is serving.
+    def __init__(self):
+        self.target = None
+
+    def write(self, value):
+        self.target.write(value)
+
+    def before_input(self):
+        self.target.before_input()
+
+    def flush(self):
+        self.target.flush()
+
+
+class _SourceSwitch(InputSource):
+    def __init__(self):
+        self.target = None
+
+    def read_line(self):
+        return self.target.read_line()
+
+    def at_end(self):
+        return self.target.at_end()
@@ -0,0 +1,171 @@
+# program_cache.py
+# On-disk cache of parsed programs, in the spirit of __pycache__.
+#
+# Each script gets entries in a __sovacache__ directory next to it (or in a
+# shared cache directory), named <script>.<tag>-v<version>.<hash>.pickle, where
+# hash is taken over the source text. An entry is a header pickle followed by
+# the AST pickled as a NodeArena (flat arrays load far faster than a pickled
+# object graph); the header is validated on load and anything unexpected
+# counts as a miss, so callers always fall back to a full parse.
+#
+#   python program_cache.py stats [dir ...] [--cache-dir DIR]
+#   python program_cache.py prune [dir ...] [--cache-dir DIR]
+import argparse
+import hashlib
+import os
+import pickle
+import tempfile
+
+from tokenizer import tokenize
+from belasova_parser import Parser
+from ast_arena import NodeArena
+
+# Bump whenever the tokenizer, parser or AST classes change shape.
+LANGUAGE_VERSION = 6
+CACHE_DIRNAME = '__sovacache__'
+MAGIC = 'belasova-cache'
+SUFFIX = '.pickle'
+
+
+def source_digest(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def __str__(self):
+        return (f"cache: {self.hits} hits, {self.misses} misses ({self.invalid} invalid), "
+                f"{self.bytes_read} bytes read, {self.bytes_written} bytes written")
+
+
+class ProgramCache:
+    def __init__(self, cache_dir=None):
+        # With no cache_dir each script is cached next to itself.
+        self.cache_dir = cache_dir
+        self.stats = CacheStats()
+
+    def entry_path(self, source_path, digest, tag):
+        source_path = os.path.abspath(source_path)
+        directory = self.cache_dir or os.path.join(os.path.dirname(source_path), CACHE_DIRNAME)
+        name = os.path.basename(source_path)
+        return os.path.join(directory, f"{name}.{tag}-v{LANGUAGE_VERSION}.{digest[:16]}{SUFFIX}")
+
+    def load(self, source_path, source, tag):
+        digest = source_digest(source)
+        path = self.entry_path(source_path, digest, tag)
+        try:
+            with open(path, 'rb') as f:
+                header = pickle.load(f)
+                if not (isinstance(header, dict) and header.get('magic') == MAGIC
+                        and header.get('version') == LANGUAGE_VERSION
+                        and header.get('tag') == tag and header.get('digest') == digest):
+                    raise ValueError(f"stale cache entry {path}")
+                arena = pickle.load(f)
+                size = f.tell()
+            ast = arena.decode()
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        except Exception:
+            self.stats.misses += 1
+            self.stats.invalid += 1
+            return None
+        self.stats.hits += 1
+        self.stats.bytes_read += size
+        return ast
+
+    def store(self, source_path, source, tag, ast):
+        digest = source_digest(source)
+        path = self.entry_path(source_path, digest, tag)
+        header = {
+            'magic': MAGIC,
+            'version': LANGUAGE_VERSION,
+            'tag': tag,
+            'digest': digest,
+            'source_path': os.path.abspath(source_path),
+        }
+        try:
+            data = (pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+                    + pickle.dumps(NodeArena.encode(ast), protocol=pickle.HIGHEST_PROTOCOL))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see a partial entry.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, RecursionError):
+            return False
+        self.stats.bytes_written += len(data)
+        return True
+
+    def parse(self, source_path, source, tag='ast'):
+        ast = self.load(source_path, source, tag)
+        if ast is None:
+            ast = Parser(tokenize(source)).parse()
+            self.store(source_path, source, tag, ast)
+        return ast
+
+
+def cache_dirs(paths):
+    for path in paths:
+        for root, dirs, _ in os.walk(path):
+            if os.path.basename(root) == CACHE_DIRNAME:
+                yield root
+
+
+def is_stale(entry_path):
+    # Stale entries belong to an older language version, or to a script that
+    # has since been deleted or edited. Leftover temporary files are stale too.
+    if not entry_path.endswith(SUFFIX):
+        return True
+    try:
+        with open(entry_path, 'rb') as f:
+            header = pickle.load(f)
+        if header.get('magic') != MAGIC or header.get('version') != LANGUAGE_VERSION:
+            return True
+        with open(header['source_path'], 'r') as f:
+            source = f.read()
+    except Exception:
+        return True
+    return source_digest(source) != header['digest']
+
+
+def scan(directories):
+    entries = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                entries.append((path, os.path.getsize(path), is_stale(path)))
+    return entries
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Inspect or prune Belasova program caches.')
+    arg_parser.add_argument('command', choices=['stats', 'prune'])
+    arg_parser.add_argument('paths', nargs='*', help=f"directories searched for {CACHE_DIRNAME} (default: .)")
+    arg_parser.add_argument('--cache-dir', action='append', default=[],
+                            help="shared cache directory to include (repeatable)")
+    options = arg_parser.parse_args()
+
+    paths = options.paths or ([] if options.cache_dir else ['.'])
+    entries = scan(list(cache_dirs(paths)) + options.cache_dir)
+    stale = [(path, size) for path, size, is_old in entries if is_old]
+    if options.command == 'stats':
+        print(f"{len(entries)} entries, {sum(size for _, size, _ in entries)} bytes")
+        print(f"{len(stale)} stale entries, {sum(size for _, size in stale)} bytes")
+    else:
+        for path, _ in stale:
+            os.remove(path)
+            print(f"removed {path}")
+        print(f"pruned {len(stale)} entries, {sum(size for _, size in stale)} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# resolver.py
+# Static scope resolution, run once before compiling. Inside function
+# bodies every Identifier and VariableAssignment is bound to a slot in a
+# fixed-size frame (or to the global of that name), so the compiling
+# engines index a list instead of probing dicts on every access. The
+# bindings live in side tables keyed by node; the AST is not modified.
+#
+# Functions cannot declare globals, so globals are resolved by name and
+# stay in Environment.variables, where top-level code creates them as it
+# runs.
+#
+# The resolver also reports reads that can only fail: a top-level read of
+# a variable with no declaration before it in the program text, and a
+# function reading a name that is neither assigned before it in the body
+# nor declared anywhere at top level.
+from collections import namedtuple
+
+from ast_nodes import *
+
+# Binding scopes:
+#   LOCAL        the slot is assigned on every path to this point
+#   MAYBE_LOCAL  the slot is assigned on some paths; fall back to the global
+#   GLOBAL       no assignment can have run yet (slot is None)
+LOCAL, MAYBE_LOCAL, GLOBAL = 'local', 'maybe_local', 'global'
+Binding = namedtuple('Binding', ['scope', 'slot', 'name'])
+
+
+class FrameLayout:
+    # Parameters take the first slots, then locals in order of first
+    # assignment.
+    def __init__(self, params):
+        self.slots = {}
+        for index, param in enumerate(params):
+            # A repeated parameter name binds the last argument.
+            self.slots[param] = index
+        self.nparams = len(params)
+        self.size = len(params)
+
+    def slot(self, name):
+        if name not in self.slots:
+            self.slots[name] = self.size
+            self.size += 1
+        return self.slots[name]
+
+    def names(self):
+        names = [None] * self.size
+        for name, slot in self.slots.items():
+            names[slot] = name
+        return names
+
+
+class Resolution:
+    def __init__(self):
+        # Identifier / VariableAssignment in a function body -> Binding
+        self.bindings = {}
+        # FunctionDefinition -> FrameLayout
+        self.frames = {}
+        self.diagnostics = []
+
+
+class Resolver:
+    def resolve(self, ast):
+        self.resolution = Resolution()
+        statements = []
+        for node in ast:
+            statements.extend(node if isinstance(node, list) else [node])
+        self.globals = set()
+        self.collect_globals(statements)
+        self.declared = set()
+        self.block(statements)
+        return self.resolution
+
+    def report(self, message):
+        if message not in self.resolution.diagnostics:
+            self.resolution.diagnostics.append(message)
+
+    def collect_globals(self, values):
+        # Names declared anywhere outside function bodies.
+        for value in values:
+            if isinstance(value, (list, tuple)):
+                self.collect_globals(value)
+            elif isinstance(value, Node) and not isinstance(value, FunctionDefinition):
+                if isinstance(value, VariableAssignment):
+                    self.globals.add(value.name)
+                self.collect_globals([field for _, field in iter_fields(value)])
+
+    # Top-level code, visited in program text order.
+    def block(self, stmts):
+        for stmt in stmts:
+            self.statement(stmt)
+
+    def statement(self, node):
+        if isinstance(node, FunctionDefinition):
+            self.function(node)
+        elif isinstance(node, VariableAssignment):
+            self.expression(node.value)
+            self.declared.add(node.name)
+        elif isinstance(node, PutsStatement):
+            self.expression(node.expr)
+        elif isinstance(node, IfElseStatement):
+            self.expression(node.condition)
+            self.block(node.then_block)
+            self.block(node.else_block)
+        elif isinstance(node, IfChain):
+            for condition, block in node.branches:
+                self.expression(condition)
+                self.block(block)
+            self.block(node.else_block)
+        elif isinstance(node, CheckStatement):
+            self.expression(node.subject_expr)
+            for pattern, block in node.when_branches:
+                self.expression(pattern)
+                self.block(block)
+            self.block(node.else_block or [])
+        elif isinstance(node, LoopNode):
+            if node.loop_type in ('times', 'until'):
+                self.expression(node.condition_or_count)
+            self.block(node.body)
+        else:
+            self.expression(node)
+
+    def expression(self, node):
+        if isinstance(node, Identifier):
+            if node.name not in self.declared:
+                self.report(f"Variable '{node.name}' used before declaration")
+        elif isinstance(node, UnaryOp):
+            self.expression(node.expr)
+        elif isinstance(node, BinaryOp):
+            self.expression(node.left)
+            self.expression(node.right)
+        elif isinstance(node, FunctionCall):
+            for arg in node.args:
+                self.expression(arg)
+
+    # Function bodies. definite holds the names assigned on every path to
+    # the current point, possible those assigned on at least one.
+    def function(self, node):
+        frame = FrameLayout(node.params)
+        self.resolution.frames[node] = frame
+        self.function_name = node.name
+        self.function_block(node.body, frame, set(node.params), set(node.params))
+
+    def function_block(self, stmts, frame, definite, possible):
+        for stmt in stmts:
+            self.function_statement(stmt, frame, definite, possible)
+
+    def function_statement(self, node, frame, definite, possible):
+        if isinstance(node, VariableAssignment):
+            self.function_expression(node.value, frame, definite, possible)
+            self.resolution.bindings[node] = Binding(LOCAL, frame.slot(node.name), node.name)
+            definite.add(node.name)
+            possible.add(node.name)
+        elif isinstance(node, PutsStatement):
+            self.function_expression(node.expr, frame, definite, possible)
+        elif isinstance(node, CheckStatement):
+            self.function_expression(node.subject_expr, frame, definite, possible)
+            # Patterns run before any branch does, and at most one branch runs.
+            branch_possible = set()
+            for pattern, block in node.when_branches:
+                self.function_expression(pattern, frame, definite, possible)
+                block_possible = set(possible)
+                self.function_block(block, frame, set(definite), block_possible)
+                branch_possible |= block_possible
+            if node.else_block:
+                block_possible = set(possible)
+                self.function_block(node.else_block, frame, set(definite), block_possible)
+                branch_possible |= block_possible
+            possible |= branch_possible
+        elif isinstance(node, (Identifier, UnaryOp, BinaryOp, FunctionCall)):
+            self.function_expression(node, frame, definite, possible)
+
+    def function_expression(self, node, frame, definite, possible):
+        if isinstance(node, Identifier):
+            name = node.name
+            if name in definite:
+                binding = Binding(LOCAL, frame.slots[name], name)
+            elif name in possible:
+                binding = Binding(MAYBE_LOCAL, frame.slots[name], name)
+            else:
+                binding = Binding(GLOBAL, None, name)
+                if name not in self.globals:
+                    self.report(f"Unknown identifier: {name} (in function {self.function_name})")
+            self.resolution.bindings[node] = binding
+        elif isinstance(node, UnaryOp):
+            self.function_expression(node.expr, frame, definite, possible)
+        elif isinstance(node, BinaryOp):
+            self.function_expression(node.left, frame, definite, possible)
+            self.function_expression(node.right, frame, definite, possible)
+        elif isinstance(node, FunctionCall):
+            for arg in node.args:
+                self.function_expression(arg, frame, definite, possible)
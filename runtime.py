@@ -0,0 +1,160 @@
+# runtime.py
+# Operator table and builtins shared by the execution engines.
+import operator
+
+from arrays import ARRAY_BUILTINS
+from ast_nodes import BinaryOp, BooleanLiteral, Constant, NumberLiteral, StringLiteral
+
+
+def divide(left, right):
+    if right == 0:
+        raise RuntimeError("Division by zero")
+    return left / right
+
+
+def concat(left, right):
+    return str(left) + str(right)
+
+
+def is_concat_chain(node):
+    # Whether the ++ node has another ++ for an operand.
+    left, right = node.left, node.right
+    return ((isinstance(left, BinaryOp) and left.op == '++')
+            or (isinstance(right, BinaryOp) and right.op == '++'))
+
+
+def concat_operands(node, leaves=()):
+    # The operands of the chain of ++ operators node heads, in evaluation
+    # order: a ++ b ++ c, parsed as (a ++ b) ++ c, gives [a, b, c]. Joining
+    # them once gives what the pairwise concatenations would, without the
+    # strings in between. Chains in leaves are kept whole.
+    operands = []
+    stack = [node.right, node.left]
+    while stack:
+        operand = stack.pop()
+        if isinstance(operand, BinaryOp) and operand.op == '++' and operand not in leaves:
+            stack.append(operand.right)
+            stack.append(operand.left)
+        else:
+            operands.append(operand)
+    return operands
+
+
+class StringBuilder:
+    # A global a loop only appends to (see loops.py). While the loop runs
+    # the appended strings are collected here, and the variable is set to
+    # them joined when it exits, so building a string is linear in its
+    # length rather than quadratic. Under Limits (see limits.py) the pieces
+    # cannot add up to more than the string length limit.
+    __slots__ = ('name', 'parts', 'limits')
+
+    def __init__(self, name, limits=None):
+        self.name = name
+        self.parts = None
+        self.limits = limits
+
+    def start(self, variables):
+        # At the first append: the pieces, starting with the value the
+        # variable has. Fails as reading the variable would.
+        if self.name not in variables:
+            raise RuntimeError(f"Variable '{self.name}' used before declaration")
+        first = str(variables[self.name])
+        parts = self.parts = [first] if self.limits is None else self.limits.pieces(first)
+        return parts
+
+    def finish(self, variables):
+        # Called as the loop exits, however it does. An append that failed
+        # after start leaves the variable as it was.
+        parts = self.parts
+        self.parts = None
+        if parts is not None and len(parts) > 1:
+            variables[self.name] = ''.join(parts)
+
+
+BINARY_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': divide,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'not=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '++': concat,
+}
+
+
+def to_int(args):
+    if len(args) != 1:
+        raise RuntimeError("toInt expects exactly 1 argument")
+    try:
+        return int(args[0])
+    except Exception as e:
+        raise RuntimeError(f"toInt conversion error: {e}")
+
+
+def to_double(args):
+    if len(args) != 1:
+        raise RuntimeError("toDouble expects exactly 1 argument")
+    try:
+        return float(args[0])
+    except Exception as e:
+        raise RuntimeError(f"toDouble conversion error: {e}")
+
+
+class LoopSignal:
+    # What a break or continue statement evaluates to: engines without real
+    # jumps return it, rather than raise it, up through the enclosing blocks
+    # to the loop it belongs to.
+    def __init__(self, name):
+        self.name = name
+
+    def outside_loop(self):
+        return RuntimeError(f"'{self.name}' outside a loop")
+
+
+BREAK = LoopSignal('break')
+CONTINUE = LoopSignal('continue')
+
+
+# Builtins take precedence over user functions of the same name.
+BUILTINS = {
+    'toInt': to_int,
+    'toDouble': to_double,
+    **ARRAY_BUILTINS,
+}
+
+
+
+def dispatch_table(when_branches, in_function=False):
+    # For a check whose when patterns are all literals, maps each pattern
+    # value to the index of the branch it selects; when values repeat the
+    # first branch wins, as in the ordered scan. None if some pattern has
+    # to be evaluated. Booleans are not literals inside function bodies.
+    table = {}
+    for index, (pattern, _) in enumerate(when_branches):
+        if isinstance(pattern, (Constant, NumberLiteral)):
+            value = pattern.value
+        elif isinstance(pattern, StringLiteral):
+            value = pattern.value.strip('"')
+        elif isinstance(pattern, BooleanLiteral) and not in_function:
+            value = pattern.value
+        else:
+            return None
+        table.setdefault(value, index)
+    return table
+
+
+def dispatch(table, subject, default=None):
+    # Looks subject up in a table keyed by dispatch_table's pattern values.
+    try:
+        return table.get(subject, default)
+    except TypeError:
+        # Unhashable subject: compare against each value in branch order.
+        for value, target in table.items():
+            if subject == value:
+                return target
+        return default
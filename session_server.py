@@ -0,0 +1,112 @@
+# session_server.py
+# Serves a Belasova program over TCP or a Unix socket. Every connection is
+# a session of its own (see sessions.py): its getLine reads the lines the
+# client sends, its puts output goes back to the client, and the connection
+# closes when the program ends. A session that fails sends
+# "error: <message>" as its last line.
+#
+#   python session_server.py PROGRAM.sova [--host HOST] [--port N | --unix PATH] [--max-sessions N]
+#                            [--slice N] [--no-optimize] [--typecheck] [--memoize POLICY]
+#                            [--max-steps N] [--max-seconds S] [--max-string N] [--max-array N]
+#
+# The --max options (see limits.py) apply to each session on its own;
+# --max-seconds counts the time it spends waiting for its client, too.
+import argparse
+import asyncio
+import contextlib
+import sys
+
+from limits import add_limit_arguments, limits_from_options
+from memo import POLICIES, RECURSIVE
+from program import Program
+from sessions import SLICE_STEPS, SessionHost, StreamReaderSource, StreamWriterSink
+
+DEFAULT_PORT = 7878
+# Connections not yet accepted that may queue up.
+BACKLOG = 1024
+# The longest line a client may send, in bytes.
+LINE_LIMIT = 1 << 20
+
+
+class SessionServer:
+    def __init__(self, host, max_sessions=0):
+        self.host = host
+        # Connections past max_sessions wait for a session to end.
+        self.slots = asyncio.Semaphore(max_sessions) if max_sessions else None
+
+    async def start(self, address='127.0.0.1', port=DEFAULT_PORT, path=None):
+        # Listens on the Unix socket path, or else on address and port (0
+        # picks a free one); returns the asyncio Server.
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT, backlog=BACKLOG)
+        return await asyncio.start_server(self.handle, address, port, limit=LINE_LIMIT, backlog=BACKLOG)
+
+    async def handle(self, reader, writer):
+        output = StreamWriterSink(writer)
+        try:
+            if self.slots is None:
+                await self.serve(reader, output)
+            else:
+                async with self.slots:
+                    await self.serve(reader, output)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def serve(self, reader, output):
+        try:
+            await self.host.session(StreamReaderSource(reader), output).run()
+        except Exception as e:
+            output.write(f"error: {e}")
+            await output.drain()
+
+
+async def serve_forever(host, options):
+    server = await SessionServer(host, options.max_sessions).start(options.host, options.port, options.unix)
+    where = options.unix or ':'.join(map(str, server.sockets[0].getsockname()[:2]))
+    print(f"serving {options.program} on {where}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serve a Belasova program to many concurrent sessions.')
+    arg_parser.add_argument('program', help="the .sova program every session runs")
+    arg_parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    arg_parser.add_argument('--unix', help="listen on this Unix socket instead of TCP")
+    arg_parser.add_argument('--max-sessions', type=int, default=0,
+                            help="sessions run at once; later connections wait (default: no limit)")
+    arg_parser.add_argument('--slice', type=int, default=SLICE_STEPS,
+                            help=f"loop passes and calls a session runs before letting others run "
+                                 f"(default: {SLICE_STEPS})")
+    arg_parser.add_argument('--no-optimize', action='store_true', help="skip the AST optimizer")
+    arg_parser.add_argument('--typecheck', action='store_true', help="type check the program first")
+    arg_parser.add_argument('--memoize', choices=POLICIES, default=RECURSIVE,
+                            help=f"cache results of pure functions (default: {RECURSIVE})")
+    add_limit_arguments(arg_parser)
+    options = arg_parser.parse_args()
+    if options.max_sessions < 0:
+        arg_parser.error("--max-sessions cannot be negative")
+    if options.slice < 1:
+        arg_parser.error("--slice must be at least 1")
+
+    try:
+        program = Program.from_file(options.program, engine='vm', optimized=not options.no_optimize,
+                                    typecheck=options.typecheck, memoize=options.memoize,
+                                    limits=limits_from_options(options))
+    except (OSError, RuntimeError) as e:
+        arg_parser.error(str(e))
+    host = SessionHost(program, options.slice)
+    try:
+        asyncio.run(serve_forever(host, options))
+    except KeyboardInterrupt:
+        pass
+    print(f"{host.finished} sessions finished, {host.failed} failed, {host.active} cut off", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
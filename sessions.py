@@ -0,0 +1,199 @@
+# sessions.py
+# Interactive sessions on an asyncio event loop. Each session runs a
+# Program on the VM, whose state lives in its own frames rather than on the
+# Python stack, so a session waiting for its next line is suspended rather
+# than blocking a thread: thousands of them share one thread.
+#
+#   host = SessionHost(Program.from_file('chat.sova'))
+#   await host.session(StreamReaderSource(reader), StreamWriterSink(writer)).run()
+#
+# getLine and eof await the session's AsyncInputSource. Output goes to an
+# ordinary sink, which is flushed (and, for an AsyncOutputSink, drained)
+# whenever the session waits, so a prompt reaches the user before the
+# session waits for the answer.
+#
+# Sessions run code compiled with checkpoints: every slice_steps loop
+# passes and function calls a session lets the others run, so a long
+# computation slows the rest down without stopping them. A Program with
+# Limits (see limits.py) meters each session on its own.
+import asyncio
+from collections import deque
+
+from bytecode import Compiler
+from interpreter import Environment
+from limits import Meter, ResourceLimitExceeded
+from memo import Memoizer
+from streams import OutputSink
+from vm import AT_END, READ_LINE, SLICE_STEPS, VM
+
+
+class AsyncInputSource:
+    # As InputSource, but read_line and at_end are coroutines.
+    async def read_line(self):
+        raise NotImplementedError
+
+    async def at_end(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class StreamReaderSource(AsyncInputSource):
+    # Lines from an asyncio StreamReader, such as a socket's.
+    def __init__(self, reader, encoding='utf-8', errors='strict'):
+        self.reader = reader
+        self.encoding = encoding
+        self.errors = errors
+        # The line at_end read ahead, if any.
+        self.pending = None
+        self.exhausted = False
+
+    async def fill(self):
+        # Reads the next line ahead unless it has been; False at the end.
+        if self.pending is None and not self.exhausted:
+            data = await self.reader.readline()
+            if data:
+                line = data.decode(self.encoding, self.errors)
+                if line.endswith('\n'):
+                    line = line[:-2] if line.endswith('\r\n') else line[:-1]
+                self.pending = line
+            else:
+                self.exhausted = True
+        return self.pending is not None
+
+    async def read_line(self):
+        if not await self.fill():
+            return ''
+        line = self.pending
+        self.pending = None
+        return line
+
+    async def at_end(self):
+        return not await self.fill()
+
+
+class QueueSource(AsyncInputSource):
+    # Lines handed over by other code as they arrive, for embedding:
+    # feed(line) for each, then end().
+    def __init__(self):
+        self.lines = deque()
+        self.ended = False
+        self.arrived = asyncio.Event()
+
+    def feed(self, line):
+        self.lines.append(line)
+        self.arrived.set()
+
+    def end(self):
+        self.ended = True
+        self.arrived.set()
+
+    async def read_line(self):
+        if await self.at_end():
+            return ''
+        return self.lines.popleft()
+
+    async def at_end(self):
+        while not self.lines and not self.ended:
+            self.arrived.clear()
+            await self.arrived.wait()
+        return not self.lines
+
+
+class AsyncOutputSink(OutputSink):
+    # A sink whose flushed output may still be on its way: drain() waits
+    # until the stream can take more.
+    async def drain(self):
+        self.flush()
+
+
+class StreamWriterSink(AsyncOutputSink):
+    # Writes to an asyncio StreamWriter, in one write per flush.
+    def __init__(self, writer, encoding='utf-8'):
+        self.writer = writer
+        self.encoding = encoding
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(f"{value}\n")
+
+    def flush(self):
+        if self.parts:
+            self.writer.write(''.join(self.parts).encode(self.encoding))
+            self.parts = []
+
+    async def drain(self):
+        self.flush()
+        await self.writer.drain()
+
+
+class SessionHost:
+    # Compiles a Program once for any number of sessions, and counts them.
+    def __init__(self, program, slice_steps=SLICE_STEPS):
+        self.program = program
+        self.slice_steps = slice_steps
+        self.code = Compiler(program.types, checkpoints=True, limits=program.limits).compile_program(program.ast)
+        self.active = 0
+        self.finished = 0
+        self.failed = 0
+
+    def session(self, input_source, output):
+        return Session(self, input_source, output)
+
+
+class Session:
+    # One run of the host's program, with its own globals, functions,
+    # memoization caches and streams.
+    def __init__(self, host, input_source, output):
+        self.host = host
+        self.input_source = input_source
+        self.output = output
+        self.env = Environment()
+        program = host.program
+        self.memoizer = Memoizer(program.memoize, program.memo_size)
+        # Checks the limits as often as the session would pause anyway.
+        self.meter = Meter(program.limits, host.slice_steps) if program.limits is not None else None
+
+    async def run(self):
+        host = self.host
+        if self.meter is not None:
+            self.meter.start()
+        vm = VM(self.env, self.memoizer, self.output, None, host.slice_steps, self.meter)
+        steps = vm.execute(host.code)
+        input_source = self.input_source
+        host.active += 1
+        try:
+            request = next(steps)
+            while True:
+                await self.wait()
+                if request is READ_LINE:
+                    request = steps.send(await input_source.read_line())
+                elif request is AT_END:
+                    request = steps.send(await input_source.at_end())
+                else:
+                    # A slice is over: let the other sessions run.
+                    await asyncio.sleep(0)
+                    request = next(steps)
+        except StopIteration:
+            host.finished += 1
+        except ResourceLimitExceeded as e:
+            host.failed += 1
+            self.meter.record(e)
+            raise
+        except BaseException:
+            host.failed += 1
+            raise
+        finally:
+            host.active -= 1
+            # A loop left by an error has not stored the strings it built.
+            for builder in vm.builders.values():
+                builder.finish(self.env.variables)
+            await self.wait()
+
+    async def wait(self):
+        # Sends what the session has written before it waits.
+        if isinstance(self.output, AsyncOutputSink):
+            await self.output.drain()
+        else:
+            self.output.flush()
@@ -0,0 +1,226 @@
+# streams.py
+# Program input and output. Every engine writes puts output through a sink
+# and reads getLine input from a source, instead of calling print() and
+# input() per line, so output can be batched into large writes, input read
+# in bulk, and both kept in memory when embedding.
+#
+# A sink has write(value), which outputs value and a newline the way
+# print() would, before_input(), called before getLine reads, and flush().
+# Engines flush their sink when the program ends, whether or not it fails.
+#
+# A source has read_line(), which returns the next line without its line
+# ending, or '' once the input is exhausted, and at_end(), which is what
+# `eof` tests: true once no line is left. Deciding that may wait for the
+# next line to arrive.
+import codecs
+import mmap
+import os
+import sys
+
+# Flush policies for BufferedSink:
+#   auto   line when the stream is an interactive terminal, block otherwise
+#   line   write every line as soon as it is produced
+#   block  write once buffer_size characters have accumulated
+AUTO, LINE, BLOCK = 'auto', 'line', 'block'
+FLUSH_POLICIES = (AUTO, LINE, BLOCK)
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+
+class OutputSink:
+    def write(self, value):
+        raise NotImplementedError
+
+    def before_input(self):
+        pass
+
+    def flush(self):
+        pass
+
+
+class BufferedSink(OutputSink):
+    # Collects lines and writes them in chunks, as bytes to the binary
+    # buffer underneath a text stream when it has one.
+    def __init__(self, stream=None, policy=AUTO, buffer_size=DEFAULT_BUFFER_SIZE, flush_on_input=True):
+        if policy not in FLUSH_POLICIES:
+            raise RuntimeError(f"Unknown flush policy: {policy} (choose from {', '.join(FLUSH_POLICIES)})")
+        self.stream = stream if stream is not None else sys.stdout
+        self.binary = getattr(self.stream, 'buffer', None)
+        if policy == AUTO:
+            isatty = getattr(self.stream, 'isatty', None)
+            policy = LINE if isatty is not None and isatty() else BLOCK
+        self.policy = policy
+        # A line policy is a block policy with nothing held back.
+        self.limit = 0 if policy == LINE else buffer_size
+        self.flush_on_input = flush_on_input
+        self.parts = []
+        self.size = 0
+
+    def write(self, value):
+        text = f"{value}\n"
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self.flush()
+
+    def before_input(self):
+        # So a prompt written with puts shows before getLine waits.
+        if self.flush_on_input:
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        text = ''.join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        if self.binary is None:
+            self.stream.write(text)
+            self.stream.flush()
+            return
+        # Anything already written through the text layer goes first.
+        self.stream.flush()
+        self.binary.write(text.encode(self.stream.encoding or 'utf-8', self.stream.errors or 'strict'))
+        self.binary.flush()
+
+
+class CollectingSink(OutputSink):
+    # Keeps every line in memory, for embedding and tests.
+    def __init__(self):
+        self.lines = []
+
+    def write(self, value):
+        self.lines.append(f"{value}")
+
+    def getvalue(self):
+        return ''.join(f"{line}\n" for line in self.lines)
+
+
+def _decode(decoder, data):
+    if not data:
+        # Raises if the input ends inside a character.
+        decoder.decode(b'', True)
+        return None
+    return decoder.decode(data)
+
+
+class InputSource:
+    def read_line(self):
+        raise NotImplementedError
+
+    def at_end(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ChunkedSource(InputSource):
+    # Reads the input a chunk at a time and hands out the lines it holds,
+    # so a line costs a list index rather than a readline call. Only one
+    # chunk is in memory at a time.
+    def __init__(self):
+        self.lines = []
+        self.position = 0
+        # The incomplete line at the end of the last chunk.
+        self.tail = ''
+        self.exhausted = False
+
+    def read_chunk(self):
+        # The next piece of input as text, None at the end.
+        raise NotImplementedError
+
+    def fill(self):
+        # Loads the next chunk's complete lines; False once none are left.
+        while not self.exhausted:
+            chunk = self.read_chunk()
+            if chunk is None:
+                self.exhausted = True
+                break
+            text = self.tail + chunk
+            if '\r' in text:
+                text = text.replace('\r\n', '\n')
+            lines = text.split('\n')
+            self.tail = lines.pop()
+            if lines:
+                self.lines = lines
+                self.position = 0
+                return True
+        if self.tail:
+            # A last line without a line ending.
+            self.lines = [self.tail]
+            self.position = 0
+            self.tail = ''
+            return True
+        return False
+
+    def read_line(self):
+        if self.position >= len(self.lines) and not self.fill():
+            return ''
+        line = self.lines[self.position]
+        self.position += 1
+        return line
+
+    def at_end(self):
+        return self.position >= len(self.lines) and not self.fill()
+
+
+class BufferedSource(ChunkedSource):
+    # Reads the binary buffer underneath a text stream (stdin by default)
+    # when it has one, and the text stream itself otherwise.
+    def __init__(self, stream=None, chunk_size=DEFAULT_BUFFER_SIZE):
+        self.stream = stream if stream is not None else sys.stdin
+        self.binary = getattr(self.stream, 'buffer', None)
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder(getattr(self.stream, 'encoding', None) or 'utf-8')(
+            getattr(self.stream, 'errors', None) or 'strict')
+        ChunkedSource.__init__(self)
+
+    def read_chunk(self):
+        if self.binary is None:
+            return self.stream.read(self.chunk_size) or None
+        # read1 returns what is available instead of waiting for a full
+        # chunk, so an interactive stdin still answers line by line.
+        return _decode(self.decoder, self.binary.read1(self.chunk_size))
+
+
+class FileSource(ChunkedSource):
+    # Reads a memory-mapped file: the OS pages the file in as it is read,
+    # so memory use stays flat whatever the file's size.
+    def __init__(self, path, encoding='utf-8', errors='strict', chunk_size=DEFAULT_BUFFER_SIZE):
+        ChunkedSource.__init__(self)
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors)
+        self.map = None
+        with open(path, 'rb') as f:
+            # mmap cannot map an empty file.
+            if os.fstat(f.fileno()).st_size:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(self.map, 'madvise'):
+                    self.map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def read_chunk(self):
+        if self.map is None:
+            return None
+        return _decode(self.decoder, self.map.read(self.chunk_size))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class ListSource(InputSource):
+    # Serves a list of lines, for embedding and tests.
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.position = 0
+
+    def read_line(self):
+        if self.position >= len(self.lines):
+            return ''
+        line = self.lines[self.position]
+        self.position += 1
+        return line
+
+    def at_end(self):
+        return self.position >= len(self.lines)
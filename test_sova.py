@@ -1,32 +1,179 @@
+import argparse
 import sys
-from tokenizer import tokenize
-from belasova_parser import Parser
-from interpreter import Interpreter
+from tokenizer import tokenize, stream_file
+from belasova_parser import Parser, StreamingParser
+from engines import ENGINES, DEFAULT_ENGINE, get_engine
+from transpiler import PythonTranspiler
+from program_cache import ProgramCache
+from optimizer import Optimizer, optimize
+from resolver import Resolver
+from memo import DEFAULT_CACHE_SIZE, POLICIES, RECURSIVE, Memoizer
+from typechecker import TypeChecker
+from profiler import DEFAULT_INTERVAL, PROFILE_MODES, SAMPLE, Profiler
+from limits import ResourceLimitExceeded, add_limit_arguments, limits_from_options
+from streams import AUTO, DEFAULT_BUFFER_SIZE, FLUSH_POLICIES, BufferedSink, BufferedSource, FileSource
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python sovarun.py <source-file.sova>")
-        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(prog='sovarun.py', description='Run a Belasova program.')
+    arg_parser.add_argument('source', metavar='source-file.sova')
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                            help=f"execution engine (default: {DEFAULT_ENGINE})")
+    arg_parser.add_argument('--dump-python', action='store_true',
+                            help="print the Python source generated for the program")
+    arg_parser.add_argument('--cache', action='store_true',
+                            help="reuse the parsed program from __sovacache__ when the source is unchanged")
+    arg_parser.add_argument('--cache-dir', help="keep cache entries in this directory (implies --cache)")
+    arg_parser.add_argument('--cache-stats', action='store_true', help="report cache hits and misses")
+    arg_parser.add_argument('-q', '--quiet', action='store_true', help="do not print tokens and AST")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="tokenize, parse and run statement by statement (tree engine only)")
+    arg_parser.add_argument('--no-optimize', action='store_true',
+                            help="run the AST exactly as parsed, without constant folding or dead code removal")
+    arg_parser.add_argument('--dump-optimized', action='store_true',
+                            help="print the optimized AST (also shown without -q)")
+    arg_parser.add_argument('--strict', action='store_true',
+                            help="do not run programs with reads that can only fail")
+    arg_parser.add_argument('--memoize', choices=POLICIES, default=RECURSIVE,
+                            help=f"cache results of pure functions: recursive ones, all, or none (default: {RECURSIVE})")
+    arg_parser.add_argument('--memo-size', type=int, default=DEFAULT_CACHE_SIZE,
+                            help=f"entries kept per memoized function (default: {DEFAULT_CACHE_SIZE})")
+    arg_parser.add_argument('--memo-stats', action='store_true',
+                            help="report memoization hits, misses and evictions")
+    arg_parser.add_argument('--flush', choices=FLUSH_POLICIES, default=AUTO,
+                            help="when program output is written: per line, per block, "
+                                 "or per line only on a terminal (default: auto)")
+    arg_parser.add_argument('--output-buffer', type=int, default=DEFAULT_BUFFER_SIZE,
+                            help=f"characters of output held before a block write (default: {DEFAULT_BUFFER_SIZE})")
+    arg_parser.add_argument('--input', metavar='FILE',
+                            help="read getLine input from FILE (memory-mapped) instead of stdin")
+    arg_parser.add_argument('--typecheck', action='store_true',
+                            help="check types against declarations and signatures before running; "
+                                 "well-typed programs run with typed fast paths")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="profile the run per function and per line (tree engine only); "
+                                 "the report goes to stderr")
+    arg_parser.add_argument('--profile-mode', choices=PROFILE_MODES, default=SAMPLE,
+                            help="sample the interpreter's stack, or time every statement and call "
+                                 f"(default: {SAMPLE})")
+    arg_parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL * 1000,
+                            help=f"milliseconds between samples (default: {DEFAULT_INTERVAL * 1000:g})")
+    arg_parser.add_argument('--profile-output', metavar='FILE',
+                            help="also write collapsed stacks for flamegraph tools to FILE")
+    add_limit_arguments(arg_parser)
+    options = arg_parser.parse_args()
+    if options.memo_size < 1:
+        arg_parser.error("--memo-size must be at least 1")
+    try:
+        limits = limits_from_options(options)
+    except RuntimeError as e:
+        arg_parser.error(str(e))
+    profiler = None
+    if options.profile:
+        if options.engine != 'tree':
+            arg_parser.error("--profile is only supported by the tree engine")
+        if options.profile_interval <= 0:
+            arg_parser.error("--profile-interval must be positive")
+        profiler = Profiler(options.profile_mode, options.profile_interval / 1000)
+    elif options.profile_output:
+        arg_parser.error("--profile-output needs --profile")
+    memoizer = Memoizer(options.memoize, options.memo_size)
+    output = BufferedSink(policy=options.flush, buffer_size=options.output_buffer)
+    input_source = FileSource(options.input) if options.input else BufferedSource()
 
-    source_path = sys.argv[1]
+    if options.stream:
+        if options.engine != 'tree':
+            arg_parser.error("--stream is only supported by the tree engine")
+        if options.typecheck:
+            arg_parser.error("--typecheck needs the whole program and cannot be combined with --stream")
+        statements = StreamingParser(stream_file(options.source)).iter_statements()
+        if not options.no_optimize:
+            statements = Optimizer().iter_program(statements)
+        engine = profiler.interpreter if profiler is not None else get_engine(options.engine)
+        try:
+            engine(statements, memoizer, output, input_source, None, limits).interpret()
+        except ResourceLimitExceeded as e:
+            sys.exit(f"{options.source}: stopped, {e} after {e.usage}")
+        finally:
+            report_profile(profiler, options)
+        if options.memo_stats:
+            print(memoizer.report(), file=sys.stderr)
+        return
 
-    with open(source_path, 'r') as f:
+    with open(options.source, 'r') as f:
         code = f.read()
 
-    tokens = tokenize(code)
-    print("Tokens:")
-    for t in tokens:
-        print(t)
+    cache = None
+    ast = None
+    if options.cache or options.cache_dir:
+        cache = ProgramCache(options.cache_dir)
+        ast = cache.load(options.source, code, 'ast')
 
-    parser = Parser(tokens)
-    ast = parser.parse()
+    if ast is None:
+        tokens = tokenize(code)
+        if not options.quiet:
+            print("Tokens:")
+            for t in tokens:
+                print(t)
 
-    print("\nAST:")
-    for node in ast:
-        print(node)
+        parser = Parser(tokens)
+        ast = parser.parse()
+        if cache is not None:
+            cache.store(options.source, code, 'ast', ast)
 
-    interpreter = Interpreter(ast)
-    interpreter.interpret()
+    if not options.quiet:
+        print("\nAST:")
+        for node in ast:
+            print(node)
+
+    if not options.no_optimize:
+        ast = optimize(ast)
+        if not options.quiet or options.dump_optimized:
+            print("\nOptimized AST:")
+            for node in ast:
+                print(node)
+
+    diagnostics = Resolver().resolve(ast).diagnostics
+    for message in diagnostics:
+        print(f"warning: {message}", file=sys.stderr)
+    if diagnostics and options.strict:
+        sys.exit(f"{options.source}: not run, {len(diagnostics)} unresolved name(s)")
+
+    types = None
+    if options.typecheck:
+        typing = TypeChecker().check(ast)
+        for message in typing.errors:
+            print(f"type error: {message}", file=sys.stderr)
+        if typing.errors:
+            sys.exit(f"{options.source}: not run, {len(typing.errors)} type error(s)")
+        types = typing.types
+
+    if options.dump_python:
+        print("\nPython:")
+        print(PythonTranspiler(types, limits).transpile(ast))
+
+    engine = profiler.interpreter if profiler is not None else get_engine(options.engine)
+    try:
+        engine(ast, memoizer, output, input_source, types, limits).interpret()
+    except ResourceLimitExceeded as e:
+        sys.exit(f"{options.source}: stopped, {e} after {e.usage}")
+    finally:
+        report_profile(profiler, options)
+
+    if options.memo_stats:
+        print(memoizer.report(), file=sys.stderr)
+
+    if options.cache_stats and cache is not None:
+        print(cache.stats, file=sys.stderr)
+
+def report_profile(profiler, options):
+    # Also run when the program fails, which is often when a profile is
+    # wanted most.
+    if profiler is None:
+        return
+    print(profiler.report(), file=sys.stderr)
+    if options.profile_output:
+        with open(options.profile_output, 'w') as f:
+            f.write(profiler.collapsed())
 
 if __name__ == '__main__':
     main()
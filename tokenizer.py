@@ -1,85 +1,165 @@
+import mmap
+import os
 import re
+import sys
+from collections import namedtuple
 
+# Tokens are (kind, value, line) records; they still index like the plain
+# tuples the parser was written against.
+Token = namedtuple('Token', ['kind', 'value', 'line'])
+
+# Identifiers are matched once and then classified here, so keywords no
+# longer have to be tried one by one (and `endpoint` is no longer END + point).
+keywords = {
+    'fn': 'FN',
+    'let': 'LET',
+    'if': 'IF',
+    'elseif': 'ELSEIF',
+    'else': 'ELSE',
+    'then': 'THEN',
+    'end': 'END',
+    'check': 'CHECK',
+    'when': 'WHEN',
+    'not': 'NOT',
+    'and': 'AND',
+    'or': 'OR',
+    'loop': 'LOOP',
+    'times': 'TIMES',
+    'until': 'UNTIL',
+    'infinite': 'INFINITE',
+    'break': 'BREAK',
+    'continue': 'CONTINUE',
+    'return': 'RETURN',
+    'true': 'TRUE',
+    'false': 'FALSE',
+    'puts': 'PUTS',
+    # Not EOF, which is the token ending the stream.
+    'eof': 'END_OF_INPUT',
+    'Int': 'INT_TYPE',
+    'String': 'STRING_TYPE',
+    'Double': 'DOUBLE_TYPE',
+    'Bool': 'BOOL_TYPE',
+    'Array': 'ARRAY_TYPE',
+}
+
+# Single characters that never start a longer token; they share one
+# character-class alternative instead of one branch each.
+punctuation = {
+    '(': 'LPAREN',
+    ')': 'RPAREN',
+    '*': 'MULTIPLY',
+    '/': 'DIVIDE',
+}
+
+# Longest first. Note `<-` lexes as LT MINUS; the parser accepts that pair.
+operators = {
+    '::': 'COLON2',
+    '->>': 'ARROW2',
+    '->': 'ARROW',
+    '==': 'EQEQ',
+    '!=': 'NOTEQ',
+    '<>': 'NOTEQ',
+    '<=': 'LTE',
+    '>=': 'GTE',
+    '++': 'CONCAT',
+    '<': 'LT',
+    '>': 'GT',
+    '=': 'ASSIGN',
+    '+': 'PLUS',
+    '-': 'MINUS',
+    ':': 'COLON',
+}
+
+# Whitespace is consumed as a prefix of the following token rather than as
+# a token of its own; SKIP matches whatever is left at the end of the input.
 token_specification = [
-    ('FN', r'fn'),
-    ('LET', r'let'),
-    ('IF', r'if'),
-    ('ELSEIF', r'elseif'),
-    ('ELSE', r'else'),
-    ('THEN', r'then'),
-    ('END', r'end'),
-    ('CHECK', r'check'),
-    ('WHEN', r'when'),
-    ('NOT', r'not'),
-    ('AND', r'and'),
-    ('OR', r'or'),
-    ('LOOP', r'loop'),
-    ('TIMES', r'times'),
-    ('UNTIL', r'until'),
-    ('INFINITE', r'infinite'),
-    ('BREAK', r'break'),
-    ('CONTINUE', r'continue'),
-    ('RETURN', r'return'),
-    ('TRUE', r'true'),
-    ('FALSE', r'false'),
-    ('COLON2', r'::'),
-    ('ARROW2', r'->>'),
-    ('ARROW', r'->'),
-    ('EQEQ', r'=='),
-    ('NOTEQ', r'!=|<>'),
-    ('LTE', r'<='),
-    ('GTE', r'>='),
-    ('LT', r'<'),
-    ('GT', r'>'),
-    ('ASSIGN_INPUT', r'<-'),
-    ('ASSIGN', r'='),
-    ('COMMENT', r'--.*'),
-    ('CONCAT', r'\+\+'),
-    ('PLUS', r'\+'),
-    ('MINUS', r'-'),
-    ('MULTIPLY', r'\*'),
-    ('DIVIDE', r'/'),
-    ('COLON', r':'),
-    ('PUTS', r'puts'),
-    ('INT_TYPE', r'Int'),
-    ('STRING_TYPE', r'String'),
-    ('DOUBLE_TYPE', r'Double'),
-    ('BOOL_TYPE', r'Bool'),
-    ('NUMBER', r'\d+(\.\d+)?'),
     ('IDENT', r'[a-zA-Z_][a-zA-Z0-9_]*'),
-    ('STRING', r'"[^"]*"'),
     ('NEWLINE', r'\n'),
-    ('SKIP', r'[ \t]+'),
-    ('LPAREN', r'\('),
-    ('RPAREN', r'\)'),
+    ('PUNCT', '[' + re.escape(''.join(punctuation)) + ']'),
+    ('NUMBER', r'\d+(?:\.\d+)?'),
+    ('STRING', r'"[^"]*"'),
+    ('COMMENT', r'--.*'),
+    ('OP', '|'.join(re.escape(op) for op in operators)),
+    ('SKIP', r'\Z'),
     ('MISMATCH', r'.'),
 ]
 
-tok_regex = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in token_specification)
-get_token = re.compile(tok_regex).match
+tok_regex = r'[ \t\r]*(?:' + '|'.join(f'(?P<{name}>{pattern})' for name, pattern in token_specification) + ')'
+token_pattern = re.compile(tok_regex)
+# Same table for bytes-like sources such as memory-mapped files.
+token_pattern_bytes = re.compile(tok_regex.encode())
 
-def tokenize(code):
-    pos = 0
-    tokens = []
+
+class LexTables:
+    # Lookup tables keyed the way matches come back for one source type:
+    # str for str sources, bytes for bytes-like ones.
+    def __init__(self, pattern, decode):
+        self.pattern = pattern
+        self.decode = decode
+        encode = (lambda text: text) if decode is None else str.encode
+        self.keywords = {encode(word): (kind, word) for word, kind in keywords.items()}
+        self.operators = {encode(op): (kind, op) for op, kind in operators.items()}
+        self.operators.update((encode(char), (kind, char)) for char, kind in punctuation.items())
+
+
+str_tables = LexTables(token_pattern, None)
+bytes_tables = LexTables(token_pattern_bytes, bytes.decode)
+
+
+def iter_tokens(code):
+    # Yields tokens one at a time; code may be a str or a bytes-like object
+    # holding UTF-8 (bytes, mmap, ...). Every position of the input is covered
+    # by some alternative, so the matches are contiguous.
+    tables = str_tables if isinstance(code, str) else bytes_tables
+    decode = tables.decode
+    keyword_table = tables.keywords
+    operator_table = tables.operators
+    make_token = tuple.__new__
+    intern = sys.intern
     line_num = 1
-    
-    while pos < len(code):
-        m = get_token(code, pos)
-        if m:
-            kind = m.lastgroup
+
+    for m in tables.pattern.finditer(code):
+        kind = m.lastgroup
+        if kind == 'IDENT':
             value = m.group(kind)
-            if kind in ('NEWLINE', 'SKIP', 'COMMENT'):
-                if kind == 'NEWLINE':
-                    line_num += 1
-                pos = m.end()
-                continue
-            elif kind == 'MISMATCH':
-                raise RuntimeError(f'Unexpected character: {value} at line {line_num}')
+            keyword = keyword_table.get(value)
+            if keyword is not None:
+                yield make_token(Token, (keyword[0], keyword[1], line_num))
+            else:
+                if decode is not None:
+                    value = decode(value)
+                yield make_token(Token, ('IDENT', intern(value), line_num))
+        elif kind == 'NEWLINE':
+            line_num += 1
+        elif kind == 'PUNCT' or kind == 'OP':
+            kind, value = operator_table[m.group(kind)]
+            yield make_token(Token, (kind, value, line_num))
+        elif kind == 'COMMENT' or kind == 'SKIP':
+            pass
+        elif kind == 'MISMATCH':
+            if decode is None:
+                value = m.group(kind)
             else:
-                tokens.append((kind, value, line_num))
-            pos = m.end()
+                start = m.start(kind)
+                value = bytes(code[start:start + 4]).decode(errors='replace')[0]
+            raise RuntimeError(f'Unexpected character: {value} at line {line_num}')
         else:
-            raise RuntimeError(f'Unexpected character at position {pos}, line {line_num}')
-    
-    tokens.append(('EOF', '', line_num))
-    return tokens
\ No newline at end of file
+            value = m.group(kind)
+            if decode is not None:
+                value = decode(value)
+            yield make_token(Token, (kind, value, line_num))
+
+    yield Token('EOF', '', line_num)
+
+def tokenize(code):
+    return list(iter_tokens(code))
+
+def stream_file(path):
+    # Tokenizes a file through a memory map, so the source is never read
+    # into memory as a whole.
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield Token('EOF', '', 1)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            yield from iter_tokens(source)
@@ -0,0 +1,551 @@
+# transpiler.py
+# Translates a Belasova program into Python source and runs it through
+# compile()/exec, so CPython's own bytecode interpreter does the work.
+#
+# Belasova names are prefixed in the generated code: g_ for globals, l_ for
+# function locals and f_ for functions, which keeps them clear of Python
+# keywords and of the helpers the generated code calls.
+#
+# Under Limits (see limits.py) the code counts its steps on _meter, and
+# makes strings through the checked helpers instead of inline operators.
+import math
+import re
+
+from arrays import ARRAY_DOUBLE, ARRAY_INT, to_double_array, to_int_array
+from ast_nodes import *
+from limits import Meter, ResourceLimitExceeded
+from memo import FunctionSummary, Memoizer, memoized, summarize
+from loops import function_reads, loop_invariants, string_accumulators
+from runtime import BREAK, BUILTINS, CONTINUE, concat_operands, dispatch, dispatch_table, divide
+from streams import BufferedSink, BufferedSource
+from typechecker import can_make_string, typed_binary_op, typed_cast
+
+INLINE_OPS = {
+    '+': '+', '-': '-', '*': '*',
+    '==': '==', '!=': '!=', 'not=': '!=',
+    '<': '<', '>': '>', '<=': '<=', '>=': '>=',
+}
+HELPER_OPS = {'/': '_div'}
+# The operators that can make strings, under a string length limit.
+STRING_OPS = {'+': '_add', '*': '_multiply'}
+CASTS = {'Int': 'int', 'Double': 'float', ARRAY_INT: '_to_int_array', ARRAY_DOUBLE: '_to_double_array'}
+# Dispatch on a branch index falls back to an if/elif chain for this many
+# branches or fewer; above that the range is bisected.
+DISPATCH_CHAIN = 4
+
+
+class UndefinedFunction:
+    # Placeholder bound to f_<name> until the definition statement runs.
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *args):
+        raise RuntimeError(f"Function not found: {self.name}")
+
+
+def _fail(message, *operands):
+    # Operands are evaluated as arguments before the error is raised.
+    raise RuntimeError(message)
+
+
+def _checked_call(function, name, *args):
+    # Used where the call site's arity does not match every definition.
+    if isinstance(function, UndefinedFunction):
+        function()
+    if getattr(function, '__wrapped__', function).__code__.co_argcount != len(args):
+        raise RuntimeError(f"Argument count mismatch for {name}")
+    return function(*args)
+
+
+def _assign_missing(name):
+    raise RuntimeError(f"Variable '{name}' used before declaration")
+
+
+HELPERS = {
+    '_div': divide,
+    '_fail': _fail,
+    '_checked_call': _checked_call,
+    '_assign_missing': _assign_missing,
+    '_dispatch': dispatch,
+    '_to_int_array': to_int_array,
+    '_to_double_array': to_double_array,
+}
+HELPERS.update((f"_builtin_{name}", builtin) for name, builtin in BUILTINS.items())
+
+
+def _collect(nodes, kind, found, skip=()):
+    # Collects every node of the given class below nodes (statement lists,
+    # branch tuples and expression trees alike), without descending into
+    # nodes of the skip classes.
+    for node in nodes:
+        if isinstance(node, kind):
+            found.append(node)
+        if isinstance(node, skip):
+            continue
+        if isinstance(node, (list, tuple)):
+            _collect(node, kind, found, skip)
+        elif isinstance(node, Node):
+            _collect([value for _, value in iter_fields(node)], kind, found, skip)
+    return found
+
+
+class FunctionScope:
+    def __init__(self, node):
+        self.params = set(node.params)
+        self.assigned = {n.name for n in _collect(node.body, VariableAssignment, [])}
+        self.read = {n.name for n in _collect(node.body, Identifier, [])}
+
+    def is_local(self, name):
+        return name in self.params or name in self.assigned
+
+
+class PythonTranspiler:
+    def __init__(self, types=None, limits=None):
+        # Expression types from a clean type check, or None.
+        self.types = types
+        self.limits = limits
+        self.checks_strings = limits is not None and limits.string_length is not None
+        self.lines = []
+        self.indent = 0
+        self.temp_count = 0
+        self.arities = {}
+        # Module-level lines defining check dispatch tables.
+        self.tables = []
+        # Loops enclosing the code being emitted.
+        self.loop_depth = 0
+        # Expression hoisted out of an enclosing loop -> the _main local
+        # holding its value once computed (see loops.py).
+        self.hoisted = {}
+        # Assignment appending to a string accumulator of an enclosing loop
+        # -> the _main local holding the pieces appended so far.
+        self.accumulating = {}
+        self.function_reads = set()
+
+    def transpile(self, ast):
+        nodes = []
+        for node in ast:
+            nodes.extend(node if isinstance(node, list) else [node])
+        for node in _collect(nodes, FunctionDefinition, []):
+            self.arities.setdefault(node.name, set()).add(len(node.params))
+        called = {call.name for call in _collect(nodes, FunctionCall, []) if call.name not in BUILTINS}
+        assigned = {n.name for n in _collect(nodes, VariableAssignment, [], FunctionDefinition)}
+        self.function_reads = function_reads(nodes)
+
+        self.emit("# Generated from Belasova source")
+        for name in sorted(called | set(self.arities)):
+            self.emit(f"f_{name} = UndefinedFunction({name!r})")
+        self.emit("")
+        main_start = len(self.lines)
+        self.emit("def _main():")
+        self.indent += 1
+        global_names = [f"g_{name}" for name in sorted(assigned)] + [f"f_{name}" for name in sorted(self.arities)]
+        if global_names:
+            self.emit(f"global {', '.join(global_names)}")
+        self.emit_block(nodes, None)
+        self.indent -= 1
+        if self.tables:
+            self.lines[main_start:main_start] = self.tables + ['']
+        return '\n'.join(self.lines) + '\n'
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line if line else '')
+
+    def temp(self, prefix):
+        self.temp_count += 1
+        return f"_{prefix}{self.temp_count}"
+
+    def emit_step(self):
+        # Counts a loop pass or a call on the meter.
+        if self.limits is not None:
+            self.emit("_meter.left -= 1")
+            self.emit("if not _meter.left:")
+            self.emit("    _meter.left = _meter.charge()")
+
+    def emit_block(self, stmts, scope, is_last=False):
+        start = len(self.lines)
+        for index, stmt in enumerate(stmts):
+            if scope is None:
+                self.emit_statement(stmt)
+            else:
+                self.emit_function_statement(stmt, scope, is_last and index == len(stmts) - 1)
+        if len(self.lines) == start:
+            self.emit("pass")
+
+    # Top-level code: mirrors Interpreter.eval_node.
+    def emit_statement(self, node):
+        if isinstance(node, PutsStatement):
+            self.emit(f"_puts({self.expr(node.expr, None)})")
+        elif isinstance(node, FunctionSignature):
+            self.emit(f"# {node.name} :: {' -> '.join(node.param_types)} ->> {node.return_type}")
+        elif isinstance(node, FunctionDefinition):
+            self.emit_function(node)
+        elif isinstance(node, VariableAssignment) and node in self.accumulating:
+            parts = self.accumulating[node]
+            operands = concat_operands(node.value, self.hoisted)[1:]
+            self.emit(f"if {parts} is None:")
+            if self.checks_strings:
+                self.emit(f"    {parts} = _pieces(str(g_{node.name}))")
+            else:
+                self.emit(f"    {parts} = [str(g_{node.name})]")
+            self.emit(f"{parts}.append({self.concat([self.expr(operand, None) for operand in operands])})")
+        elif isinstance(node, VariableAssignment):
+            if node.is_declaration:
+                self.emit(f"g_{node.name} = {self.cast(node, self.expr(node.value, None))}")
+            else:
+                value_temp = self.temp('v')
+                self.emit(f"{value_temp} = {self.expr(node.value, None)}")
+                self.emit("try:")
+                self.emit(f"    g_{node.name}")
+                self.emit("except NameError:")
+                self.emit(f"    _assign_missing({node.name!r})")
+                self.emit(f"g_{node.name} = {value_temp}")
+        elif isinstance(node, IfElseStatement):
+            self.emit(f"if {self.expr(node.condition, None)}:")
+            self.emit_nested(node.then_block, None)
+            self.emit("else:")
+            self.emit_nested(node.else_block, None)
+        elif isinstance(node, IfChain):
+            keyword = 'if'
+            for condition, block in node.branches:
+                self.emit(f"{keyword} {self.expr(condition, None)}:")
+                self.emit_nested(block, None)
+                keyword = 'elif'
+            if node.else_block:
+                self.emit("else:")
+                self.emit_nested(node.else_block, None)
+        elif isinstance(node, CheckStatement):
+            self.emit_check(node, None)
+        elif isinstance(node, LoopNode):
+            self.emit_loop(node)
+        elif isinstance(node, (BreakStatement, ContinueStatement)):
+            signal = BREAK if isinstance(node, BreakStatement) else CONTINUE
+            if self.loop_depth:
+                self.emit(signal.name)
+            else:
+                self.emit(f"_fail({str(signal.outside_loop())!r})")
+        elif isinstance(node, (Constant, NumberLiteral, StringLiteral, BooleanLiteral, Identifier, UnaryOp,
+                               BinaryOp, FunctionCall, InputCall, EndOfInput, int, float, str)):
+            self.emit(self.expr(node, None))
+        else:
+            self.emit(f"_fail({f'Unknown AST node: {node}'!r})")
+
+    def emit_loop(self, node):
+        if node.loop_type not in ('infinite', 'times', 'until'):
+            return
+        # Accumulators no enclosing loop builds are built by this one, and
+        # stored however it exits.
+        accumulators = []
+        for name, assignments in string_accumulators(node, self.function_reads).items():
+            if assignments[0] not in self.accumulating:
+                parts = self.temp('parts')
+                self.accumulating.update((assignment, parts) for assignment in assignments)
+                accumulators.append((name, parts))
+        if accumulators:
+            self.emit(f"{' = '.join(parts for _, parts in accumulators)} = None")
+            self.emit("try:")
+            self.indent += 1
+        invariants = loop_invariants(node, self.hoisted)
+        if invariants:
+            cells = [self.temp('h') for _ in invariants]
+            self.hoisted.update(zip(invariants, cells))
+            self.emit(f"{' = '.join(cells)} = None")
+        count = node.condition_or_count
+        if node.loop_type == 'infinite':
+            self.emit("while True:")
+        elif node.loop_type == 'times':
+            if isinstance(count, Constant) and isinstance(count.value, (int, float)):
+                self.emit(f"for _ in range({int(count.value)}):")
+            else:
+                self.emit(f"for _ in range(int({self.expr(count, None)})):")
+        else:
+            self.emit(f"while not {self.expr(count, None)}:")
+        self.loop_depth += 1
+        self.indent += 1
+        self.emit_step()
+        self.indent -= 1
+        self.emit_nested(node.body, None)
+        self.loop_depth -= 1
+        if accumulators:
+            self.indent -= 1
+            self.emit("finally:")
+            for name, parts in accumulators:
+                self.emit(f"    if {parts} is not None and len({parts}) > 1:")
+                self.emit(f"        g_{name} = ''.join({parts})")
+
+    def emit_nested(self, stmts, scope, is_last=False):
+        self.indent += 1
+        self.emit_block(stmts, scope, is_last)
+        self.indent -= 1
+
+    def emit_function(self, node):
+        scope = FunctionScope(node)
+        # A repeated parameter name binds the last argument.
+        params = [f"_unused{index}" if param in node.params[index + 1:] else f"l_{param}"
+                  for index, param in enumerate(node.params)]
+        self.emit(f"def f_{node.name}({', '.join(params)}):")
+        self.indent += 1
+        self.emit_step()
+        # A local is read from the global of the same name until it is first
+        # assigned; globals cannot change while a function runs.
+        for name in sorted((scope.assigned & scope.read) - scope.params):
+            self.emit("try:")
+            self.emit(f"    l_{name} = g_{name}")
+            self.emit("except NameError:")
+            self.emit("    pass")
+        for stmt in node.body[:-1]:
+            self.emit_function_statement(stmt, scope, False)
+        if node.body:
+            self.emit_function_statement(node.body[-1], scope, True)
+        else:
+            self.emit("return None")
+        self.indent -= 1
+        self.emit(f"f_{node.name} = _define(f_{node.name}, {summarize(node)!r})")
+
+    # Function bodies: mirrors Interpreter.eval_function_body. The last
+    # statement of a body is compiled to return its value.
+    def emit_function_statement(self, node, scope, is_last):
+        if isinstance(node, VariableAssignment):
+            self.emit(f"l_{node.name} = {self.cast(node, self.expr(node.value, scope))}")
+            if is_last:
+                self.emit(f"return l_{node.name}")
+        elif isinstance(node, PutsStatement):
+            self.emit(f"_puts({self.expr(node.expr, scope)})")
+        elif isinstance(node, CheckStatement):
+            # The last check returns the value of the branch taken; falling
+            # out of it (no branch, or one ending in puts) returns None.
+            self.emit_check(node, scope, is_last)
+            if is_last:
+                self.emit("return None")
+        elif isinstance(node, (Constant, NumberLiteral, StringLiteral, Identifier, UnaryOp, BinaryOp,
+                               FunctionCall, InputCall, EndOfInput, int, float, str)):
+            value = self.expr(node, scope)
+            self.emit(f"return {value}" if is_last else value)
+        else:
+            self.emit(f"_fail({f'Unsupported node in function body: {node}'!r})")
+
+    def emit_check(self, node, scope, is_last=False):
+        table = dispatch_table(node.when_branches, scope is not None)
+        if table is not None and all(math.isfinite(value) for value in table
+                                     if isinstance(value, float)):
+            self.emit_check_table(node, table, scope, is_last)
+            return
+        subject = self.temp('s')
+        self.emit(f"{subject} = {self.expr(node.subject_expr, scope)}")
+        keyword = 'if'
+        for pattern, block in node.when_branches:
+            self.emit(f"{keyword} {subject} == {self.expr(pattern, scope)}:")
+            self.emit_nested(block, scope, is_last)
+            keyword = 'elif'
+        if node.else_block:
+            self.emit("else:" if node.when_branches else "if True:")
+            self.emit_nested(node.else_block, scope, is_last)
+
+    def emit_check_table(self, node, table, scope, is_last):
+        # All patterns are literals: look the branch up in a module-level
+        # table, then narrow the index down with range tests.
+        reachable = sorted(set(table.values()))
+        position = {index: n for n, index in enumerate(reachable)}
+        blocks = [node.when_branches[index][1] for index in reachable] + [node.else_block or []]
+        name = self.temp('table')
+        entries = ', '.join(f"{value!r}: {position[index]}" for value, index in table.items())
+        self.tables.append(f"{name} = {{{entries}}}")
+        subject = self.temp('s')
+        selected = self.temp('k')
+        default = len(blocks) - 1
+        self.emit(f"{subject} = {self.expr(node.subject_expr, scope)}")
+        self.emit("try:")
+        self.emit(f"    {selected} = {name}.get({subject}, {default})")
+        self.emit("except TypeError:")
+        self.emit(f"    {selected} = _dispatch({name}, {subject}, {default})")
+        self.emit_dispatch(selected, blocks, 0, len(blocks), scope, is_last)
+
+    def emit_dispatch(self, selected, blocks, low, high, scope, is_last):
+        # Emits code running blocks[selected], given low <= selected < high.
+        if high - low <= DISPATCH_CHAIN:
+            for n in range(low, high):
+                if n == high - 1:
+                    self.emit("else:" if n > low else "if True:")
+                else:
+                    self.emit(f"{'if' if n == low else 'elif'} {selected} == {n}:")
+                self.emit_nested(blocks[n], scope, is_last)
+            return
+        middle = (low + high) // 2
+        self.emit(f"if {selected} < {middle}:")
+        self.indent += 1
+        self.emit_dispatch(selected, blocks, low, middle, scope, is_last)
+        self.indent -= 1
+        self.emit("else:")
+        self.indent += 1
+        self.emit_dispatch(selected, blocks, middle, high, scope, is_last)
+        self.indent -= 1
+
+    def cast(self, node, value):
+        # value converted as the declaration node requires.
+        type_annotation = typed_cast(node.type_annotation, node.value, self.types)
+        if type_annotation in CASTS:
+            return f"{CASTS[type_annotation]}({value})"
+        return value
+
+    def operation(self, node, scope):
+        if isinstance(node, UnaryOp):
+            operand = self.expr(node.expr, scope)
+            if node.op == 'not':
+                return f"(not {operand})"
+            return f"_fail({f'Unsupported unary operator: {node.op}'!r}, {operand})"
+        op = typed_binary_op(node, self.types)
+        if node.op == '++':
+            # Two strings are added with +; anything else is formatted.
+            operands = concat_operands(node, self.hoisted)
+            if len(operands) > 2 or op == '++':
+                value = self.concat([self.expr(operand, scope) for operand in operands])
+                return f"_check_string({value})" if self.checks_strings else value
+        left = self.expr(node.left, scope)
+        right = self.expr(node.right, scope)
+        if self.checks_strings and op in STRING_OPS and can_make_string(node, self.types):
+            return f"{STRING_OPS[op]}({left}, {right})"
+        if op in INLINE_OPS:
+            return f"({left} {INLINE_OPS[op]} {right})"
+        elif op in HELPER_OPS:
+            return f"{HELPER_OPS[op]}({left}, {right})"
+        return f"_fail({f'Unsupported operator: {node.op}'!r}, {left}, {right})"
+
+    def concat(self, values):
+        # %s formats with str(), as ++ converts its operands.
+        if len(values) == 1:
+            return f"str({values[0]})"
+        return f"({'%s' * len(values)!r} % ({', '.join(values)}))"
+
+    def expr(self, node, scope):
+        if isinstance(node, Constant):
+            return repr(node.value)
+        elif isinstance(node, NumberLiteral):
+            return repr(node.value)
+        elif isinstance(node, StringLiteral):
+            return repr(node.value.strip('"'))
+        elif isinstance(node, BooleanLiteral) and scope is None:
+            return repr(node.value)
+        elif isinstance(node, Identifier):
+            if scope is not None and scope.is_local(node.name):
+                return f"l_{node.name}"
+            return f"g_{node.name}"
+        elif isinstance(node, (UnaryOp, BinaryOp)):
+            value = self.operation(node, scope)
+            cell = self.hoisted.get(node)
+            if cell is None:
+                return value
+            return f"({cell} if {cell} is not None else ({cell} := {value}))"
+        elif isinstance(node, FunctionCall):
+            args = [self.expr(arg, scope) for arg in node.args]
+            if node.name in BUILTINS:
+                return f"_builtin_{node.name}([{', '.join(args)}])"
+            if self.arities.get(node.name, {len(args)}) == {len(args)}:
+                return f"f_{node.name}({', '.join(args)})"
+            return f"_checked_call(f_{node.name}, {node.name!r}, {', '.join(args)})"
+        elif isinstance(node, InputCall):
+            return "_input()"
+        elif isinstance(node, EndOfInput):
+            return "_eof()"
+        elif isinstance(node, (int, float, str)):
+            return repr(node)
+        elif scope is not None:
+            return f"_fail({f'Unsupported node in function body: {node}'!r})"
+        return f"_fail({f'Unknown AST node: {node}'!r})"
+
+
+_UNBOUND_NAME = re.compile(r"'([gl]_\w+)'")
+
+
+class PythonInterpreter:
+    def __init__(self, ast, memoizer=None, output=None, input_source=None, types=None, limits=None):
+        self.ast = ast
+        self.types = types
+        self.limits = limits
+        self.meter = Meter(limits) if limits is not None else None
+        self.memoizer = memoizer if memoizer is not None else Memoizer()
+        self.output = output if output is not None else BufferedSink()
+        self.input_source = input_source if input_source is not None else BufferedSource()
+        self.source = None
+        self.code = None
+        self.namespace = None
+        # Function name -> the Python function of its current definition.
+        self.functions = {}
+
+    def compile(self):
+        self.source = PythonTranspiler(self.types, self.limits).transpile(self.ast)
+        self.code = compile(self.source, '<belasova>', 'exec')
+        return self.code
+
+    def interpret(self):
+        if self.code is None:
+            self.compile()
+        namespace = self.namespace = dict(HELPERS, UndefinedFunction=UndefinedFunction,
+                                          FunctionSummary=FunctionSummary, _define=self.define,
+                                          _puts=self.output.write, _input=self.get_line,
+                                          _eof=self.at_eof)
+        limits = self.limits
+        if limits is not None:
+            self.meter.start()
+            namespace.update((f"_builtin_{name}", builtin) for name, builtin in limits.builtins.items())
+            namespace.update(_meter=self.meter, _pieces=limits.pieces, _check_string=limits.check_string,
+                             _add=limits.add, _multiply=limits.multiply)
+        exec(self.code, namespace)
+        try:
+            namespace['_main']()
+        except NameError as e:
+            raise self.translate_name_error(e) from e
+        except ResourceLimitExceeded as e:
+            self.meter.record(e)
+            raise
+        finally:
+            self.output.flush()
+
+    def call_function(self, name, args):
+        # Calls a Belasova function from Python, once interpret() has run
+        # its definition.
+        builtin = (self.limits.builtins if self.limits is not None else BUILTINS).get(name)
+        if builtin is not None:
+            return builtin(list(args))
+        function = self.namespace.get(f"f_{name}") if self.namespace is not None else None
+        if function is None:
+            raise RuntimeError(f"Function not found: {name}")
+        try:
+            return _checked_call(function, name, *args)
+        except NameError as e:
+            raise self.translate_name_error(e) from e
+
+    def get_line(self):
+        self.output.before_input()
+        return self.input_source.read_line()
+
+    def at_eof(self):
+        self.output.before_input()
+        return self.input_source.at_end()
+
+    def define(self, function, summary):
+        # Run after each def. A definition can change which functions are
+        # memoized, so every f_ name is rebound to its memoized or plain
+        # form; the ones left plain pay nothing per call.
+        self.functions[summary.name] = function
+        self.memoizer.define(summary)
+        caches = self.memoizer.caches
+        for name, plain in self.functions.items():
+            cache = caches.get(name)
+            self.namespace[f"f_{name}"] = plain if cache is None else memoized(plain, cache)
+        return self.namespace[f"f_{summary.name}"]
+
+    def translate_name_error(self, error):
+        # Reports unbound g_/l_ names the way Interpreter does.
+        name = error.name
+        if name is None:
+            match = _UNBOUND_NAME.search(str(error))
+            if match is None:
+                return error
+            name = match.group(1)
+        if not name.startswith(('g_', 'l_')):
+            return error
+        tb = error.__traceback__
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        if tb.tb_frame.f_code.co_name == '_main':
+            return RuntimeError(f"Variable '{name[2:]}' used before declaration")
+        return RuntimeError(f"Unknown identifier: {name[2:]}")
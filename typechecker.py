@@ -0,0 +1,458 @@
+# typechecker.py
+# Static type checking against `let` annotations and function signatures,
+# run before execution when asked for (test_sova.py --typecheck).
+#
+# Types describe the Python values a Belasova expression evaluates to:
+#   Int, Double, String, Bool   exactly int, float, str, bool
+#   Array Int, Array Double     exactly the arrays.py classes
+#   Number                      int or float: a Double parameter or return
+#                               value, since arguments are not converted
+#   Any                         unknown
+# Any is never an error; it only means the value gets no fast path. An
+# expression given a type other than Any is guaranteed to produce a value
+# of that type whenever it produces one, which is what lets the engines
+# drop casts and pick specialized operations (see typed_cast and
+# typed_binary_op).
+#
+# Globals are typed in program order at top level, joining at branches and
+# over loops, the types at a break with those at loop exit and the types
+# at a continue with those at the loop head. Inside function bodies a
+# global may have any type it is ever declared with. A call has its
+# signature's return type once every definition of the function has been
+# checked to return that type, assuming the same of the functions it
+# calls. Arguments are not converted on the way in, so a parameter has its
+# declared type only while no call passes it an Any value; once one does,
+# it is Any.
+from arrays import ARRAY_DOUBLE, ARRAY_INT, DoubleArray, IntArray
+from ast_nodes import *
+from resolver import GLOBAL, LOCAL, Resolver
+from runtime import BUILTINS
+
+INT, DOUBLE, STRING, BOOL = 'Int', 'Double', 'String', 'Bool'
+NUMBER, ANY = 'Number', 'Any'
+# The value of a check in a function body when no branch is taken.
+NONE = 'None'
+
+NUMERIC = (INT, DOUBLE, NUMBER)
+ARRAYS = (ARRAY_INT, ARRAY_DOUBLE)
+ELEMENT_TYPES = {ARRAY_INT: INT, ARRAY_DOUBLE: DOUBLE}
+ARRAY_TYPES = {INT: ARRAY_INT, DOUBLE: ARRAY_DOUBLE}
+BUILTIN_TYPES = {'toInt': INT, 'toDouble': DOUBLE, 'arrayRange': ARRAY_INT, 'parseInts': ARRAY_INT,
+                 'parseDoubles': ARRAY_DOUBLE}
+# Array builtins whose first argument is an array.
+ARRAY_ARGUMENT_BUILTINS = ('arrayLength', 'arrayGet', 'arraySlice', 'arraySum', 'arrayMin', 'arrayMax')
+ARITHMETIC = ('+', '-', '*', '/')
+ORDERING = ('<', '>', '<=', '>=')
+EQUALITY = ('==', '!=', 'not=')
+
+
+def join(left, right):
+    if left == right:
+        return left
+    if left in NUMERIC and right in NUMERIC:
+        return NUMBER
+    return ANY
+
+
+def value_type(value):
+    # bool first: it is a subclass of int.
+    if isinstance(value, bool):
+        return BOOL
+    if isinstance(value, int):
+        return INT
+    if isinstance(value, float):
+        return DOUBLE
+    if isinstance(value, str):
+        return STRING
+    if isinstance(value, IntArray):
+        return ARRAY_INT
+    if isinstance(value, DoubleArray):
+        return ARRAY_DOUBLE
+    return ANY
+
+
+def declared_value_type(declared):
+    # What a value of a declared parameter or return type can be at run
+    # time: Int is never converted to Double on the way in or out.
+    return NUMBER if declared == DOUBLE else declared
+
+
+def assignable(actual, declared):
+    if actual == ANY or actual == declared:
+        return True
+    return declared == DOUBLE and actual in NUMERIC
+
+
+class Typing:
+    def __init__(self):
+        # Expression node -> type, for the nodes an engine specializes.
+        self.types = {}
+        self.errors = []
+
+
+class TypeChecker:
+    def check(self, ast):
+        statements = []
+        for node in ast:
+            statements.extend(node if isinstance(node, list) else [node])
+        self.statements = statements
+        self.bindings = Resolver().resolve(statements).bindings
+        # Function name -> [(FunctionSignature, FunctionDefinition)]
+        self.definitions = {}
+        signature = None
+        for stmt in statements:
+            if isinstance(stmt, FunctionSignature):
+                signature = stmt
+            elif isinstance(stmt, FunctionDefinition):
+                if signature is not None and signature.name == stmt.name:
+                    self.definitions.setdefault(stmt.name, []).append((signature, stmt))
+                signature = None
+            else:
+                signature = None
+
+        # A function is verified once every definition returns its declared
+        # type; until shown otherwise each is assumed to. (name, index) of
+        # every parameter some call passes an Any value is in loose_params.
+        # Each round can only remove functions and add parameters, so this
+        # ends.
+        self.verified = set(self.definitions)
+        self.loose_params = set()
+        while True:
+            self.typing = Typing()
+            self.global_types = {}
+            # (break envs, continue envs) of the loops being typed,
+            # innermost last.
+            self.jumps = []
+            loose_params = set(self.loose_params)
+            self.block(statements, {})
+            verified = {name for name in self.verified
+                        if all(self.function(signature, definition)
+                               for signature, definition in self.definitions[name])}
+            if verified == self.verified and self.loose_params == loose_params:
+                return self.typing
+            self.verified = verified
+
+    def error(self, message):
+        if message not in self.typing.errors:
+            self.typing.errors.append(message)
+
+    def record(self, node, node_type):
+        if isinstance(node, Node):
+            self.typing.types[node] = node_type
+        return node_type
+
+    # Top-level code. env maps the globals declared so far to their types;
+    # statements update it in place.
+    def block(self, stmts, env):
+        for stmt in stmts:
+            self.statement(stmt, env)
+
+    def branches(self, blocks, env, exhaustive):
+        # Runs each block on its own copy of env, then joins the results.
+        results = []
+        for block in blocks:
+            branch_env = dict(env)
+            self.block(block, branch_env)
+            results.append(branch_env)
+        if not exhaustive:
+            results.append(dict(env))
+        self.join_into(env, results)
+
+    def join_into(self, env, results):
+        for name in set().union(*results):
+            types = [result[name] for result in results if name in result]
+            joined = types[0]
+            for other in types[1:]:
+                joined = join(joined, other)
+            env[name] = joined
+
+    def statement(self, node, env):
+        if isinstance(node, VariableAssignment):
+            value_type = self.expression(node.value, env, None)
+            env[node.name] = self.declaration(node, value_type)
+            previous = self.global_types.get(node.name)
+            self.global_types[node.name] = env[node.name] if previous is None else join(previous, env[node.name])
+        elif isinstance(node, PutsStatement):
+            self.expression(node.expr, env, None)
+        elif isinstance(node, IfElseStatement):
+            self.expression(node.condition, env, None)
+            self.branches([node.then_block, node.else_block], env, True)
+        elif isinstance(node, IfChain):
+            for condition, _ in node.branches:
+                self.expression(condition, env, None)
+            self.branches([block for _, block in node.branches] + [node.else_block], env, True)
+        elif isinstance(node, CheckStatement):
+            self.expression(node.subject_expr, env, None)
+            for pattern, _ in node.when_branches:
+                self.expression(pattern, env, None)
+            blocks = [block for _, block in node.when_branches]
+            if node.else_block:
+                blocks.append(node.else_block)
+            self.branches(blocks, env, bool(node.else_block))
+        elif isinstance(node, LoopNode):
+            if node.loop_type == 'times':
+                if self.expression(node.condition_or_count, env, None) == NONE:
+                    self.error("Loop count has no value")
+            # The body may run any number of times: iterate until the types
+            # it leaves behind, or has at a continue, stop changing. An until
+            # condition runs before every pass, so it is typed along with the
+            # body. The loop is left with those types or ones at a break.
+            while True:
+                breaks, continues = [], []
+                self.jumps.append((breaks, continues))
+                if node.loop_type == 'until':
+                    self.expression(node.condition_or_count, env, None)
+                body_env = dict(env)
+                self.block(node.body, body_env)
+                self.jumps.pop()
+                before = dict(env)
+                self.join_into(env, [before, body_env] + continues)
+                if env == before:
+                    break
+            self.join_into(env, [dict(env)] + breaks)
+        elif isinstance(node, (BreakStatement, ContinueStatement)):
+            if self.jumps:
+                breaks, continues = self.jumps[-1]
+                (breaks if isinstance(node, BreakStatement) else continues).append(dict(env))
+        elif isinstance(node, (FunctionSignature, FunctionDefinition)):
+            pass
+        else:
+            self.expression(node, env, None)
+
+    def declaration(self, node, value_type):
+        # The type a variable has after `let`: Int, Double and array
+        # declarations convert their value, String and Bool ones only check
+        # it.
+        declared = node.type_annotation
+        if declared is None:
+            return value_type
+        if declared in (INT, DOUBLE):
+            if value_type == NONE:
+                self.error(f"Cannot declare {node.name} :: {declared} with no value")
+            return declared
+        if declared in ARRAYS:
+            # Only an array converts to another.
+            if value_type not in ARRAYS + (ANY,):
+                self.error(f"Cannot declare {node.name} :: {declared} with a value of type {value_type}")
+            return declared
+        if not assignable(value_type, declared):
+            self.error(f"Cannot declare {node.name} :: {declared} with a value of type {value_type}")
+            return ANY
+        return value_type
+
+    # Function bodies. Returns whether the definition returns its declared
+    # type.
+    def function(self, signature, definition):
+        env = {param: ANY if (definition.name, index) in self.loose_params else declared_value_type(param_type)
+               for index, (param, param_type) in enumerate(zip(definition.params, signature.param_types))}
+        result = self.function_block(definition.body, env)
+        if result == ANY:
+            return False
+        if not assignable(result, signature.return_type):
+            self.error(f"{definition.name} returns {signature.return_type} but its body has type {result}")
+            return False
+        return True
+
+    def function_block(self, stmts, env):
+        result = NONE
+        for stmt in stmts:
+            result = self.function_statement(stmt, env)
+        return result
+
+    def function_statement(self, node, env):
+        if isinstance(node, VariableAssignment):
+            value_type = self.expression(node.value, env, env)
+            env[node.name] = self.declaration(node, value_type)
+            return env[node.name]
+        elif isinstance(node, PutsStatement):
+            self.expression(node.expr, env, env)
+            return NONE
+        elif isinstance(node, CheckStatement):
+            self.expression(node.subject_expr, env, env)
+            for pattern, _ in node.when_branches:
+                self.expression(pattern, env, env)
+            blocks = [block for _, block in node.when_branches]
+            if node.else_block:
+                blocks.append(node.else_block)
+            results = []
+            envs = []
+            for block in blocks:
+                branch_env = dict(env)
+                results.append(self.function_block(block, branch_env))
+                envs.append(branch_env)
+            if not node.else_block:
+                results.append(NONE)
+                envs.append(dict(env))
+            self.join_into(env, envs)
+            result = results[0]
+            for other in results[1:]:
+                result = join(result, other)
+            return result
+        return self.expression(node, env, env)
+
+    # locals is the function's variable types, or None at top level.
+    def expression(self, node, env, locals):
+        if isinstance(node, Constant):
+            return self.record(node, value_type(node.value))
+        elif isinstance(node, NumberLiteral):
+            return self.record(node, value_type(node.value))
+        elif isinstance(node, StringLiteral):
+            return self.record(node, STRING)
+        elif isinstance(node, BooleanLiteral):
+            return self.record(node, BOOL)
+        elif isinstance(node, (int, float, str)):
+            return value_type(node)
+        elif isinstance(node, Identifier):
+            if locals is None:
+                return self.record(node, env.get(node.name, ANY))
+            scope = self.bindings[node].scope
+            global_type = self.global_types.get(node.name, ANY)
+            if scope == GLOBAL:
+                return self.record(node, global_type)
+            if scope == LOCAL:
+                return self.record(node, locals[node.name])
+            # Assigned on some paths only: otherwise the global is read.
+            return self.record(node, join(locals[node.name], global_type))
+        elif isinstance(node, InputCall):
+            return self.record(node, STRING)
+        elif isinstance(node, EndOfInput):
+            return self.record(node, BOOL)
+        elif isinstance(node, UnaryOp):
+            self.expression(node.expr, env, locals)
+            if node.op != 'not':
+                self.error(f"Unsupported unary operator: {node.op}")
+                return self.record(node, ANY)
+            return self.record(node, BOOL)
+        elif isinstance(node, BinaryOp):
+            left = self.expression(node.left, env, locals)
+            right = self.expression(node.right, env, locals)
+            return self.record(node, self.binary(node.op, left, right))
+        elif isinstance(node, FunctionCall):
+            return self.record(node, self.call(node, [self.expression(arg, env, locals) for arg in node.args]))
+        return ANY
+
+    def binary(self, op, left, right):
+        if op == '++':
+            return STRING
+        if op in EQUALITY:
+            return BOOL
+        if op not in ARITHMETIC + ORDERING:
+            self.error(f"Unsupported operator: {op}")
+            return ANY
+        if left in ARRAYS or right in ARRAYS:
+            return self.array_binary(op, left, right)
+        if left == ANY or right == ANY:
+            # Either may be an array.
+            return ANY
+        if op in ORDERING:
+            if (left in NUMERIC and right in NUMERIC) or left == right == STRING:
+                return BOOL
+        elif left in NUMERIC and right in NUMERIC:
+            if op == '/' or DOUBLE in (left, right):
+                return DOUBLE
+            return INT if left == right == INT else NUMBER
+        elif op == '+' and left == right == STRING:
+            return STRING
+        elif op == '*' and {left, right} == {STRING, INT}:
+            return STRING
+        self.error(f"Operator {op} does not apply to {left} and {right}")
+        return ANY
+
+    def array_binary(self, op, left, right):
+        # An operator with an array on at least one side.
+        operands = NUMERIC + ARRAYS + (ANY,)
+        if left in operands and right in operands:
+            if op in ORDERING:
+                return ARRAY_INT
+            if op == '/' or {DOUBLE, ARRAY_DOUBLE} & {left, right}:
+                return ARRAY_DOUBLE
+            if left in (INT, ARRAY_INT) and right in (INT, ARRAY_INT):
+                return ARRAY_INT
+            return ANY
+        self.error(f"Operator {op} does not apply to {left} and {right}")
+        return ANY
+
+    def builtin(self, name, arg_types):
+        if name in ARRAY_ARGUMENT_BUILTINS:
+            array_type = arg_types[0]
+            if array_type not in ARRAYS + (ANY,):
+                self.error(f"Argument 1 of {name} must be an array, got {array_type}")
+                return ANY
+            if name == 'arrayLength':
+                return INT
+            if name == 'arraySlice' or array_type == ANY:
+                return array_type
+            return ELEMENT_TYPES[array_type]
+        if name == 'arrayFill' and len(arg_types) == 2:
+            return ARRAY_TYPES.get(arg_types[1], ANY)
+        if name == 'arrayOf':
+            if all(arg_type == INT for arg_type in arg_types):
+                return ARRAY_INT
+            if DOUBLE in arg_types and all(arg_type in NUMERIC for arg_type in arg_types):
+                return ARRAY_DOUBLE
+            return ANY
+        return BUILTIN_TYPES.get(name, ANY)
+
+    def call(self, node, arg_types):
+        name = node.name
+        if name in BUILTINS:
+            return self.builtin(name, arg_types)
+        definitions = self.definitions.get(name)
+        if definitions is None:
+            if not any(isinstance(stmt, FunctionDefinition) and stmt.name == name for stmt in self.statements):
+                self.error(f"Function not found: {name}")
+            return ANY
+        arities = {len(definition.params) for _, definition in definitions}
+        if len(arg_types) not in arities:
+            self.error(f"Argument count mismatch for {name}")
+            return ANY
+        result = None
+        for signature, definition in definitions:
+            if len(definition.params) != len(arg_types):
+                continue
+            for index, (arg_type, param_type) in enumerate(zip(arg_types, signature.param_types)):
+                if arg_type == ANY:
+                    self.loose_params.add((name, index))
+                elif not assignable(arg_type, param_type):
+                    self.error(f"Argument {index + 1} of {name} must be {param_type}, got {arg_type}")
+            returned = declared_value_type(signature.return_type)
+            result = returned if result is None else join(result, returned)
+        if name not in self.verified:
+            return ANY
+        return result
+
+
+def typed_cast(type_annotation, value_node, types):
+    # The annotation a declaration still has to convert its value to: None
+    # when the value already has that type.
+    if types is not None and types.get(value_node) == type_annotation:
+        return None
+    return type_annotation
+
+
+def typed_binary_op(node, types):
+    # The operator to run in place of node.op, given its operand types:
+    # '++' on two strings is plain '+', with no str() conversions.
+    if types is not None and node.op == '++' and types.get(node.left) == types.get(node.right) == STRING:
+        return '+'
+    return node.op
+
+
+def is_int_arithmetic(node, types):
+    # Whether node is + - or * on two ints, which always gives an int.
+    return types is not None and node.op in ('+', '-', '*') and types.get(node) == INT
+
+
+def can_make_string(node, types):
+    # Whether the binary operation node might make a string, which limits
+    # on string length have to check: not when types has it as anything
+    # else, nor a + with a number operand or a * with a Double one, which
+    # can only make numbers or fail.
+    if node.op == '++':
+        return True
+    if node.op not in ('+', '*') or types is not None and types.get(node) in NUMERIC + ARRAYS + (BOOL,):
+        return False
+    numbers = [operand.value for operand in (node.left, node.right) if isinstance(operand, NumberLiteral)]
+    if node.op == '+':
+        return not numbers
+    return not any(isinstance(value, float) for value in numbers)
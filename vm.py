@@ -0,0 +1,333 @@
+# vm.py
+# Stack virtual machine for the instruction stream produced by bytecode.py.
+#
+# VM.execute runs code as a generator that yields whenever it needs input,
+# so whoever drives it decides where input comes from: VM.run answers from
+# the input source and blocks, sessions.py awaits the next line instead.
+# Code compiled with checkpoints also yields PAUSE every slice_steps
+# checkpoints, so one long computation cannot hold up the other sessions.
+# Given a Meter (see limits.py), the VM counts its checkpoints on that
+# instead, and pauses each time the meter checks its limits.
+from array import array
+
+from bytecode import *
+from interpreter import Environment
+from limits import Meter, ResourceLimitExceeded
+from memo import MISSING, Memoizer, cache_key
+from runtime import BUILTINS, StringBuilder, dispatch
+from streams import BufferedSink, BufferedSource
+
+# What VM.execute yields: the next input line is wanted (send it back),
+# whether the input is exhausted is wanted (send a bool back), or a slice
+# is over (send None back).
+READ_LINE, AT_END, PAUSE = 'read_line', 'at_end', 'pause'
+# Checkpoints (loop passes and function calls) between pauses.
+SLICE_STEPS = 1000
+
+
+class VM:
+    def __init__(self, env, memoizer, output, input_source, slice_steps=SLICE_STEPS, meter=None):
+        self.env = env
+        self.memoizer = memoizer
+        self.output = output
+        self.input_source = input_source
+        self.slice_steps = slice_steps
+        self.meter = meter
+        self.limits = meter.limits if meter is not None else None
+        # Name -> StringBuilder, for the string globals loops build.
+        self.builders = {}
+
+    def run(self, code):
+        # Runs code to the end, reading input from the input source, and
+        # returns what it leaves (see HALT).
+        steps = self.execute(code)
+        input_source = self.input_source
+        try:
+            request = next(steps)
+            while True:
+                if request is READ_LINE:
+                    request = steps.send(input_source.read_line())
+                elif request is AT_END:
+                    request = steps.send(input_source.at_end())
+                else:
+                    request = next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+    def execute(self, code):
+        functions = self.env.functions
+        variables = self.env.variables
+        memoizer = self.memoizer
+        caches = memoizer.caches
+        write = self.output.write
+        binary_funcs = BINARY_FUNCS
+        meter = self.meter
+        limits = self.limits
+        if limits is not None:
+            binary_funcs = BINARY_FUNCS + tuple(limits.binary_ops[name] for name in BINARY_NAMES)
+        # Caller state is saved here on CALL, so Belasova calls do not
+        # recurse on the Python stack: call depth is bounded by memory only.
+        # All frames share one operand stack; a callee only ever touches the
+        # values above its caller's.
+        frames = []
+        ops, consts, names, calls = code.ops, code.consts, code.names, code.calls
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        local_env = None
+        # Values hoisted out of loops, keyed by where their code ends (see
+        # loops.py). Only top-level code has loops.
+        hoisted = {}
+        builders = self.builders
+        ticks = self.slice_steps
+        pc = 0
+        while True:
+            op = ops[pc]
+            arg = ops[pc + 1]
+            pc += 2
+            if op == LOAD_LOCAL:
+                push(local_env[arg])
+            elif op == LOAD_NAME:
+                try:
+                    push(variables[names[arg]])
+                except KeyError:
+                    raise RuntimeError(f"Unknown identifier: {names[arg]}") from None
+            elif op == LOAD_LOCAL_OR_GLOBAL:
+                value = local_env[arg]
+                if value is UNSET:
+                    name = code.varnames[arg]
+                    if name not in variables:
+                        raise RuntimeError(f"Unknown identifier: {name}")
+                    value = variables[name]
+                push(value)
+            elif op == LOAD_GLOBAL:
+                try:
+                    push(variables[names[arg]])
+                except KeyError:
+                    raise RuntimeError(f"Variable '{names[arg]}' used before declaration") from None
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == BINARY_OP:
+                right = pop()
+                stack[-1] = binary_funcs[arg](stack[-1], right)
+            elif op == BUILD_STRING:
+                values = stack[-arg:]
+                del stack[-arg:]
+                push(''.join(map(str, values)))
+            elif op == LOAD_HOISTED:
+                value = hoisted.get(arg)
+                if value is not None:
+                    push(value)
+                    pc = arg
+            elif op == STORE_GLOBAL:
+                variables[names[arg]] = pop()
+            elif op == STORE_LOCAL:
+                local_env[arg] = pop()
+            elif op == CAST_INT:
+                stack[-1] = int(stack[-1])
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == DISPATCH:
+                table = consts[arg]
+                pc = dispatch(table.targets, pop(), table.default)
+            elif op == COUNT_DOWN:
+                count = stack[-1]
+                if count > 0:
+                    stack[-1] = count - 1
+                else:
+                    pop()
+                    pc = arg
+            elif op == CHECKPOINT:
+                # Once a loop pass or call, when there are any.
+                if meter is None:
+                    ticks -= 1
+                    if not ticks:
+                        ticks = self.slice_steps
+                        yield PAUSE
+                else:
+                    meter.left -= 1
+                    if not meter.left:
+                        meter.left = meter.charge()
+                        yield PAUSE
+            elif op == CALL:
+                name, argc, builtin = calls[arg]
+                if argc:
+                    args = stack[-argc:]
+                    del stack[-argc:]
+                else:
+                    args = []
+                if builtin is not None:
+                    push(builtin(args))
+                    continue
+                func = functions.get(name)
+                if func is None:
+                    raise RuntimeError(f"Function not found: {name}")
+                if argc != len(func.params):
+                    raise RuntimeError(f"Argument count mismatch for {name}")
+                cache = caches.get(name)
+                if cache is None:
+                    frames.append((code, pc, local_env))
+                else:
+                    key = cache_key(args)
+                    value = cache.get(key)
+                    if value is not MISSING:
+                        push(value)
+                        continue
+                    # The callee returns into MEMO_STORE_CODE, which caches
+                    # the result and returns on to the caller.
+                    frames.append((code, pc, local_env))
+                    frames.append((MEMO_STORE_CODE, 0, (cache, key)))
+                code = func.code
+                ops, consts, names, calls = code.ops, code.consts, code.names, code.calls
+                local_env = args
+                if func.padding:
+                    local_env += func.padding
+                pc = 0
+            elif op == TAIL_CALL:
+                # The callee's result is this function's result, so it takes
+                # over the current frame instead of pushing a new one: tail
+                # recursion runs in constant space.
+                name, argc, builtin = calls[arg]
+                if argc:
+                    args = stack[-argc:]
+                    del stack[-argc:]
+                else:
+                    args = []
+                if builtin is not None:
+                    push(builtin(args))
+                    continue
+                func = functions.get(name)
+                if func is None:
+                    raise RuntimeError(f"Function not found: {name}")
+                if argc != len(func.params):
+                    raise RuntimeError(f"Argument count mismatch for {name}")
+                cache = caches.get(name)
+                if cache is not None:
+                    # Only hits are used here: storing a miss would need a
+                    # frame, and tail calls must not grow the stack.
+                    value = cache.get(cache_key(args))
+                    if value is not MISSING:
+                        push(value)
+                        continue
+                code = func.code
+                ops, consts, names, calls = code.ops, code.consts, code.names, code.calls
+                local_env = args
+                if func.padding:
+                    local_env += func.padding
+                pc = 0
+            elif op == RETURN:
+                # The result is already on top of the stack, where the
+                # caller expects it.
+                code, pc, local_env = frames.pop()
+                ops, consts, names, calls = code.ops, code.consts, code.names, code.calls
+            elif op == MEMO_STORE:
+                cache, key = local_env
+                cache.store(key, stack[-1])
+            elif op == POP:
+                pop()
+            elif op == DUP:
+                push(stack[-1])
+            elif op == JUMP_IF_TRUE:
+                if pop():
+                    pc = arg
+            elif op == CAST_DOUBLE:
+                stack[-1] = float(stack[-1])
+            elif op == CAST_ARRAY:
+                stack[-1] = ARRAY_CAST_FUNCS[arg](stack[-1])
+            elif op == UNARY_NOT:
+                stack[-1] = not stack[-1]
+            elif op == TO_COUNT:
+                stack[-1] = int(stack[-1])
+            elif op == PRINT:
+                write(pop())
+            elif op == INPUT:
+                self.output.before_input()
+                push((yield READ_LINE))
+            elif op == AT_EOF:
+                self.output.before_input()
+                push((yield AT_END))
+            elif op == DEFINE_FUNCTION:
+                func = consts[arg]
+                functions[func.name] = func
+                memoizer.define(func.summary)
+            elif op == ASSIGN_GLOBAL:
+                name = names[arg]
+                if name not in variables:
+                    raise RuntimeError(f"Variable '{name}' used before declaration")
+                variables[name] = pop()
+            elif op == STORE_HOISTED:
+                hoisted[arg] = stack[-1]
+            elif op == CLEAR_HOISTED:
+                for key in consts[arg].keys:
+                    hoisted[key] = None
+            elif op == LOAD_BUILDER:
+                name = names[arg]
+                builder = builders.get(name)
+                if builder is None:
+                    builder = builders[name] = StringBuilder(name, limits)
+                parts = builder.parts
+                push(parts if parts is not None else builder.start(variables))
+            elif op == APPEND_STRING:
+                stack[-arg - 1].extend(map(str, stack[-arg:]))
+                del stack[-arg - 1:]
+            elif op == FINISH_STRING:
+                builder = builders.get(names[arg])
+                if builder is not None:
+                    builder.finish(variables)
+            elif op == CHECK_STRING:
+                limits.check_string(stack[-1])
+            elif op == RAISE:
+                raise RuntimeError(consts[arg])
+            elif op == HALT:
+                # Only the stubs call_function builds leave a value here.
+                return pop() if stack else None
+            else:
+                raise RuntimeError(f"Bad opcode {op} at {pc - 2} in {code.name}")
+
+
+class VMInterpreter:
+    def __init__(self, ast, memoizer=None, output=None, input_source=None, types=None, limits=None):
+        self.ast = ast
+        self.types = types
+        self.limits = limits
+        self.meter = Meter(limits) if limits is not None else None
+        self.env = Environment()
+        self.memoizer = memoizer if memoizer is not None else Memoizer()
+        self.output = output if output is not None else BufferedSink()
+        self.input_source = input_source if input_source is not None else BufferedSource()
+        self.code = None
+
+    def compile(self):
+        self.code = Compiler(self.types, limits=self.limits).compile_program(self.ast)
+        return self.code
+
+    def interpret(self):
+        if self.code is None:
+            self.compile()
+        if self.meter is not None:
+            self.meter.start()
+        vm = VM(self.env, self.memoizer, self.output, self.input_source, meter=self.meter)
+        try:
+            vm.run(self.code)
+        except ResourceLimitExceeded as e:
+            self.meter.record(e)
+            raise
+        finally:
+            # A loop left by an error has not stored the strings it built.
+            for builder in vm.builders.values():
+                builder.finish(self.env.variables)
+            self.output.flush()
+
+    def call_function(self, name, args):
+        # Calls a Belasova function from Python, once interpret() has run
+        # its definition, through a stub that pushes the arguments and calls.
+        ops = []
+        for index in range(len(args)):
+            ops += (LOAD_CONST, index)
+        ops += (CALL, 0, HALT, 0)
+        builtins = self.limits.builtins if self.limits is not None else BUILTINS
+        stub = CodeObject('<call>', array('i', ops), tuple(args), (), ((name, len(args), builtins.get(name)),))
+        return VM(self.env, self.memoizer, self.output, self.input_source, meter=self.meter).run(stub)